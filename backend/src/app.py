@@ -16,18 +16,23 @@ from flask import Flask, render_template
 from flask_cors import CORS
 
 from config import ProdConfig, TestingConfig, DevConfig
+from changes import changes
 from chemicals import chemicals
 from locations import locations
 from manufacturers import manufacturers
 from search import search
 from users import users
 from csv_export import csv_export
+from export_jobs import export_jobs
+from inventory_import import import_inventory_command, inventory_import
 from msds import msds
+from data_version import bump_data_version
 from database import db, init_db
 from oidc import init_oidc, oidc
 from storage_class import storage_class
 from logging_config import setup_logging
 from permission_requirements import require_full_access
+from migrations import register_commands
 load_dotenv()
 
 
@@ -48,6 +53,8 @@ def create_app(config=ProdConfig):
     app.config.from_object(config)
     init_db(app)
     init_oidc(app)
+    register_commands(app)
+    app.cli.add_command(import_inventory_command)
 
     cors = CORS(app)
 
@@ -68,6 +75,7 @@ def create_app(config=ProdConfig):
         db.create_all()
         db.session.commit()
         init_test_data(app)
+        bump_data_version()
         return "OK"
 
     @app.route("/")
@@ -82,12 +90,15 @@ def create_app(config=ProdConfig):
         """
         return render_template("index.html")
 
+    app.register_blueprint(changes)
     app.register_blueprint(chemicals)
     app.register_blueprint(locations)
     app.register_blueprint(manufacturers)
     app.register_blueprint(search)
     app.register_blueprint(users)
     app.register_blueprint(csv_export)
+    app.register_blueprint(export_jobs)
+    app.register_blueprint(inventory_import)
     app.register_blueprint(msds)
     app.register_blueprint(storage_class)
     return app
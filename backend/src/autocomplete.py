@@ -0,0 +1,171 @@
+"""
+In-memory index for chemical name autocomplete.
+
+Autocomplete runs on every keystroke, so it is served without touching the
+database. Chemical names are kept normalized in a sorted list, and the names
+starting with a prefix are found with two binary searches. The most stocked
+chemicals are suggested first.
+
+Names are updated when chemicals are added, renamed or deleted. Bottle counts
+change with nearly every write, so they are re-counted with a single query the
+first time autocomplete is used after the data version moves on.
+"""
+
+import heapq
+import logging
+import threading
+from bisect import bisect_left, insort
+from flask import current_app
+from sqlalchemy import case, func
+from data_version import data_version_counter
+from database import db
+from models import Chemical, Chemical_Manufacturer, Inventory
+from search_index import normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Sorts after every character a name can contain
+PREFIX_END = chr(0x10FFFF)
+
+
+class NameIndex:
+    """
+    Chemical names in sorted order, with the number of live bottles of each chemical.
+    """
+
+    def __init__(self):
+        # (normalized name, Chemical_ID), sorted
+        self._keys = []
+        # Chemical_ID -> (normalized name, name)
+        self._names = {}
+        # Chemical_ID -> live bottles
+        self._live_bottles = {}
+        self.counts_version = None
+        # The shared data version the names were read at, see data_version.py
+        self.shared_version = None
+        self._lock = threading.Lock()
+
+    def add(self, chemical_id, name):
+        """
+        Add a chemical, or update its name if it is already in the index.
+        """
+        normalized = normalize_name(name)
+        with self._lock:
+            self._discard(chemical_id)
+            self._names[chemical_id] = (normalized, name)
+            insort(self._keys, (normalized, chemical_id))
+
+    def remove(self, chemical_id):
+        with self._lock:
+            self._discard(chemical_id)
+            self._live_bottles.pop(chemical_id, None)
+
+    def _discard(self, chemical_id):
+        old = self._names.pop(chemical_id, None)
+        if old is not None:
+            index = bisect_left(self._keys, (old[0], chemical_id))
+            del self._keys[index]
+
+    def set_live_bottles(self, live_bottles, version):
+        """
+        :param live_bottles: A dictionary of Chemical_ID to number of live bottles.
+        :param version: The data version the counts were made at.
+        """
+        with self._lock:
+            self._live_bottles = live_bottles
+            self.counts_version = version
+
+    def complete(self, prefix, limit):
+        """
+        :return: Up to limit (Chemical_ID, name, live bottles) tuples for chemicals
+            whose normalized name starts with the normalized prefix, most live bottles first.
+        """
+        prefix = normalize_name(prefix)
+        with self._lock:
+            start = bisect_left(self._keys, (prefix,))
+            end = bisect_left(self._keys, (prefix + PREFIX_END,), lo=start)
+            matches = heapq.nsmallest(
+                limit,
+                self._keys[start:end],
+                key=lambda key: (-self._live_bottles.get(key[1], 0), key),
+            )
+            return [
+                (
+                    chemical_id,
+                    self._names[chemical_id][1],
+                    self._live_bottles.get(chemical_id, 0),
+                )
+                for _, chemical_id in matches
+            ]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def count_live_bottles():
+    """
+    :return: A dictionary of Chemical_ID to number of live bottles, for chemicals with any.
+    """
+    live_bottles = func.sum(case((Inventory.Is_Dead.is_(True), 0), else_=1))
+    rows = (
+        db.session.query(Chemical_Manufacturer.Chemical_ID, live_bottles)
+        .join(Inventory.Chemical_Manufacturer)
+        .group_by(Chemical_Manufacturer.Chemical_ID)
+        .all()
+    )
+    return {chemical_id: int(count) for chemical_id, count in rows if count}
+
+
+def name_index():
+    """
+    :return: The autocomplete index for the current app, built on first use,
+        with bottle counts up to date.
+    """
+    counter = data_version_counter()
+    index = current_app.extensions.get("name_index")
+    # Chemicals added outside the server were never added to the index
+    if index is not None and index.shared_version != counter.shared_version:
+        logger.info("Rebuilding autocomplete index after changes made outside the server")
+        current_app.extensions.pop("name_index", None)
+        index = None
+    if index is None:
+        new_index = NameIndex()
+        new_index.shared_version = counter.shared_version
+        for chemical_id, name in db.session.query(
+            Chemical.Chemical_ID, Chemical.Chemical_Name
+        ):
+            new_index.add(chemical_id, name)
+        index = current_app.extensions.setdefault("name_index", new_index)
+        logger.info(f"Built autocomplete index of {len(index)} chemicals")
+
+    version = counter.value
+    if index.counts_version != version:
+        index.set_live_bottles(count_live_bottles(), version)
+    return index
+
+
+def update_name(chemical):
+    """
+    Add or rename a chemical in the autocomplete index. Call after committing.
+    """
+    index = current_app.extensions.get("name_index")
+    # If the index hasn't been built, it'll read the new name when it is
+    if index is not None:
+        index.add(chemical.Chemical_ID, chemical.Chemical_Name)
+
+
+def remove_name(chemical_id):
+    """
+    Remove a deleted chemical from the autocomplete index. Call after committing.
+    """
+    index = current_app.extensions.get("name_index")
+    if index is not None:
+        index.remove(chemical_id)
+
+
+def forget_names():
+    """
+    Throw the autocomplete index away, to be built again on next use.
+    Call after committing more new chemicals than are worth adding one by one.
+    """
+    current_app.extensions.pop("name_index", None)
@@ -0,0 +1,96 @@
+"""
+In-memory caches shared by the request handlers.
+
+Waitress serves requests from several threads, so everything here is thread safe.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+
+class LRUCache:
+    """
+    A least-recently-used cache with an optional expiry time per entry.
+
+    Counts hits, misses and evictions, see stats().
+    """
+
+    def __init__(self, max_size, max_bytes=None, sizeof=None):
+        """
+        :param max_size: The maximum number of entries to keep.
+        :param max_bytes: The most memory the cached values may use, or None for no limit.
+        :param sizeof: Returns the size in bytes of a value. Needed if max_bytes is set.
+        """
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: The cached value, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value, _ = entry
+            if expires_at is not None and expires_at <= datetime.now():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, expires_at=None):
+        """
+        Add or replace an entry, evicting the least recently used entries if the cache is full.
+        Values bigger than max_bytes aren't cached at all.
+        :param expires_at: When the entry stops being valid, or None to keep it until evicted.
+        """
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (expires_at, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_size or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        :return: A dictionary of the hit, miss and eviction counts, and how full the cache is.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,370 @@
+"""
+Delta sync: which chemicals and bottles changed since a client last looked.
+
+Every flush and every bulk UPDATE or DELETE that touches the inventory is looked
+at by the session event listeners below, which note each chemical and bottle
+whose JSON changes. When the session commits, the noted changes are written to
+Inventory_Change in the same transaction, under the next version taken from
+Inventory_Change_Version. That row stays locked until the commit finishes, so
+versions become visible in the order they were taken: once a client has seen a
+version, no change with an older one can still turn up. Change_IDs can't be used
+for this, they are handed out when the row is inserted, not when it's committed.
+
+- A bottle changes when it's added, changed or deleted, or when its
+  manufacturer, product number, sub-location or location is renamed.
+- A chemical changes when it's added, changed or deleted, when its storage class
+  is renamed, or when one of its bottles changes (its quantity may have).
+
+Clients ask /api/inventory/changes for everything after the last version they
+saw, so a refresh costs as much as what changed, not the size of the inventory.
+"""
+
+import logging
+from flask import Blueprint, jsonify, request
+from sqlalchemy import case, event, func, insert, inspect, select, true, update
+from database import db
+from inventory_rows import group_inventory_rows, inventory_row_query
+from models import (
+    Chemical,
+    Chemical_Manufacturer,
+    Inventory,
+    Inventory_Change,
+    Inventory_Change_Version,
+    Location,
+    Manufacturer,
+    Storage_Class,
+    Sub_Location,
+)
+from oidc import oidc
+
+changes = Blueprint("changes", __name__)
+logger = logging.getLogger(__name__)
+
+# Models whose changes show up in a bottle's JSON
+BOTTLE_MODELS = (Inventory, Chemical_Manufacturer, Sub_Location, Location, Manufacturer)
+# Models whose changes show up in a chemical's JSON
+CHEMICAL_MODELS = (Chemical, Storage_Class)
+# The key in Session.info of the changes to record when the session commits
+PENDING_CHANGES = "inventory_changes"
+# The Version_ID of the single Inventory_Change_Version row
+VERSION_ROW_ID = 1
+
+
+def affected_rows(connection, model, where):
+    """
+    Find the chemicals and bottles whose JSON depends on the rows of a model.
+    :param model: One of BOTTLE_MODELS or CHEMICAL_MODELS.
+    :param where: A condition selecting the rows of the model.
+    :return: A set of Chemical_IDs and a set of Inventory_IDs.
+    """
+    if model in CHEMICAL_MODELS:
+        query = (
+            select(Chemical.Chemical_ID)
+            .select_from(Chemical)
+            .outerjoin(Chemical.Storage_Class)
+            .where(where)
+        )
+        return {row[0] for row in connection.execute(query)}, set()
+
+    query = (
+        select(Inventory.Inventory_ID, Chemical_Manufacturer.Chemical_ID)
+        .select_from(Inventory)
+        .join(Inventory.Chemical_Manufacturer)
+        .join(Chemical_Manufacturer.Manufacturer)
+        .join(Inventory.Sub_Location)
+        .join(Sub_Location.Location)
+        .where(where)
+    )
+    rows = connection.execute(query).all()
+    # Only the bottles themselves changing changes how many a chemical has
+    chemical_ids = {row[1] for row in rows} if model is Inventory else set()
+    return chemical_ids, {row[0] for row in rows}
+
+
+def record_changes(session, chemical_ids, bottle_ids):
+    """
+    Note the chemicals and bottles as changed. They're added to the change log
+    when the session commits, see allocate_change_version().
+    """
+    if not chemical_ids and not bottle_ids:
+        return
+    pending_chemicals, pending_bottles = session.info.setdefault(
+        PENDING_CHANGES, (set(), set())
+    )
+    pending_chemicals.update(chemical_ids)
+    pending_bottles.update(bottle_ids)
+
+
+def latest_change_version(connection, lock=False):
+    """
+    :param lock: Lock the version row until the transaction ends.
+    :return: The version of the latest committed changes, or None if nothing has been recorded yet.
+    """
+    query = select(Inventory_Change_Version.Version).where(
+        Inventory_Change_Version.Version_ID == VERSION_ROW_ID
+    )
+    if lock:
+        query = query.with_for_update()
+    return connection.execute(query).scalar()
+
+
+def next_change_version(connection):
+    """
+    Take the next version, locking the version row until the transaction ends.
+    Another commit taking a version waits here until this one is done.
+    """
+    version = latest_change_version(connection, lock=True)
+    if version is None:
+        connection.execute(
+            insert(Inventory_Change_Version),
+            {"Version_ID": VERSION_ROW_ID, "Version": 1},
+        )
+        return 1
+    connection.execute(
+        update(Inventory_Change_Version)
+        .where(Inventory_Change_Version.Version_ID == VERSION_ROW_ID)
+        .values(Version=version + 1)
+    )
+    return version + 1
+
+
+@event.listens_for(db.session, "before_commit")
+def allocate_change_version(session):
+    """
+    Write the changes noted in this transaction to the change log, under a new version.
+    """
+    # Commit flushes after this listener runs, but the flush may note more changes
+    session.flush()
+    chemical_ids, bottle_ids = session.info.pop(PENDING_CHANGES, (set(), set()))
+    if not chemical_ids and not bottle_ids:
+        return
+    connection = session.connection()
+    version = next_change_version(connection)
+    rows = [
+        {"Version": version, "Table_Name": "Chemical", "Row_ID": id}
+        for id in chemical_ids
+    ]
+    rows.extend(
+        {"Version": version, "Table_Name": "Inventory", "Row_ID": id}
+        for id in bottle_ids
+    )
+    connection.execute(insert(Inventory_Change), rows)
+    logger.debug(
+        f"Recorded changes to {len(chemical_ids)} chemicals and {len(bottle_ids)} bottles as version {version}"
+    )
+
+
+@event.listens_for(db.session, "after_rollback")
+def forget_changes(session):
+    """
+    Nothing noted before a rollback happened any more.
+    """
+    session.info.pop(PENDING_CHANGES, None)
+
+
+@event.listens_for(db.session, "after_flush")
+def record_flush(session, flush_context):
+    """
+    Record the changes made by a flush. The rows are in the database by now,
+    except for the deleted ones, which are recorded from the objects themselves.
+    """
+    changed = {}
+    chemical_ids = set()
+    bottle_ids = set()
+    # Chemical_Manufacturer_IDs of bottles that were deleted or moved to another chemical
+    old_chemical_manufacturer_ids = set()
+
+    for obj in session.deleted:
+        if isinstance(obj, Chemical):
+            chemical_ids.add(obj.Chemical_ID)
+        elif isinstance(obj, Inventory):
+            bottle_ids.add(obj.Inventory_ID)
+            old_chemical_manufacturer_ids.add(obj.Chemical_Manufacturer_ID)
+
+    for obj in session.new:
+        if isinstance(obj, (Chemical, Inventory)):
+            changed.setdefault(type(obj), []).append(obj)
+
+    for obj in session.dirty:
+        if not isinstance(obj, BOTTLE_MODELS + CHEMICAL_MODELS):
+            continue
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        changed.setdefault(type(obj), []).append(obj)
+        if isinstance(obj, Inventory):
+            history = inspect(obj).attrs.Chemical_Manufacturer_ID.history
+            old_chemical_manufacturer_ids.update(history.deleted or ())
+
+    if not changed and not chemical_ids and not bottle_ids:
+        return
+
+    connection = session.connection()
+    for model, objects in changed.items():
+        mapper = inspect(model)
+        primary_key = mapper.primary_key[0]
+        ids = [mapper.primary_key_from_instance(obj)[0] for obj in objects]
+        chemicals, bottles = affected_rows(connection, model, primary_key.in_(ids))
+        chemical_ids |= chemicals
+        bottle_ids |= bottles
+
+    old_chemical_manufacturer_ids.discard(None)
+    if old_chemical_manufacturer_ids:
+        chemical_ids.update(
+            row[0]
+            for row in connection.execute(
+                select(Chemical_Manufacturer.Chemical_ID).where(
+                    Chemical_Manufacturer.Chemical_Manufacturer_ID.in_(
+                        old_chemical_manufacturer_ids
+                    )
+                )
+            )
+        )
+    record_changes(session, chemical_ids, bottle_ids)
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def record_bulk_change(orm_execute_state):
+    """
+    Record the changes a bulk UPDATE or DELETE (Query.update(), Query.delete())
+    is about to make, while the rows it matches can still be found.
+    """
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    model = mapper.class_ if mapper is not None else None
+    if model not in BOTTLE_MODELS + CHEMICAL_MODELS:
+        return
+    # Deleting anything but a chemical or a bottle needs its bottles deleted first
+    if orm_execute_state.is_delete and model not in (Chemical, Inventory):
+        return
+
+    where = orm_execute_state.statement.whereclause
+    if where is None:
+        where = true()
+    session = orm_execute_state.session
+    record_changes(session, *affected_rows(session.connection(), model, where))
+
+
+def changed_chemicals(chemical_ids):
+    """
+    :return: The chemicals that still exist, as in Chemical.to_dict() but without their bottles.
+    """
+    live_bottles = func.count(
+        case((Inventory.Is_Dead.is_(True), None), else_=Inventory.Inventory_ID)
+    )
+    rows = (
+        db.session.query(
+            Chemical.Chemical_ID,
+            Chemical.Chemical_Name,
+            Chemical.Chemical_Formula,
+            Storage_Class.Storage_Class_Name,
+            Storage_Class.Storage_Class_ID,
+            live_bottles,
+        )
+        .outerjoin(Chemical.Storage_Class)
+        .outerjoin(Chemical.Chemical_Manufacturers)
+        .outerjoin(Chemical_Manufacturer.Inventory)
+        .filter(Chemical.Chemical_ID.in_(chemical_ids))
+        .group_by(
+            Chemical.Chemical_ID,
+            Chemical.Chemical_Name,
+            Chemical.Chemical_Formula,
+            Storage_Class.Storage_Class_Name,
+            Storage_Class.Storage_Class_ID,
+        )
+        .order_by(Chemical.Chemical_ID)
+        .all()
+    )
+    return [
+        {
+            "id": chemical_id,
+            "chemical_name": chemical_name,
+            "formula": formula,
+            "storage_class": storage_class,
+            "storage_class_id": storage_class_id,
+            "quantity": quantity,
+        }
+        for chemical_id, chemical_name, formula, storage_class, storage_class_id, quantity in rows
+    ]
+
+
+def changed_bottles(bottle_ids):
+    """
+    :return: The bottles that still exist, as in Chemical.to_dict(), each with its chemical_id.
+    """
+    rows = inventory_row_query().filter(Inventory.Inventory_ID.in_(bottle_ids)).all()
+    return [
+        {**bottle, "chemical_id": chemical["id"]}
+        for chemical in group_inventory_rows(rows)
+        for bottle in chemical["inventory"]
+    ]
+
+
+@changes.route("/api/inventory/changes", methods=["GET"])
+@oidc.require_login
+def get_changes():
+    """
+    Get the chemicals and bottles added, changed or deleted since a version.
+
+    Query Parameters:
+        since (int, optional): The version from the last response. Without it,
+            only the current version is returned. Get it before loading the
+            whole inventory, so nothing changed in between is missed.
+
+    :return: JSON with:
+        - version: The version to pass as since next time.
+        - chemicals: Changed chemicals, without their bottles.
+        - bottles: Changed bottles, each with the chemical_id it belongs to.
+        - deleted: The ids of deleted "chemicals" and "bottles".
+        If since is newer than any change, the database has been reset and
+        clients should load the whole inventory again; a 410 is returned.
+    """
+    since = request.args.get("since")
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            logger.warning(f"Invalid since version: {since}")
+            return jsonify({"error": "since must be an integer"}), 400
+
+    version = latest_change_version(db.session.connection()) or 0
+    response = {
+        "version": version,
+        "chemicals": [],
+        "bottles": [],
+        "deleted": {"chemicals": [], "bottles": []},
+    }
+    if since is None:
+        return jsonify(response)
+    if since > version:
+        logger.warning(f"Asked for changes since {since}, but the latest is {version}")
+        return jsonify({"error": "Unknown version, reload the inventory"}), 410
+
+    chemical_ids = set()
+    bottle_ids = set()
+    for table_name, row_id in (
+        db.session.query(Inventory_Change.Table_Name, Inventory_Change.Row_ID)
+        .filter(Inventory_Change.Version > since, Inventory_Change.Version <= version)
+        .distinct()
+    ):
+        if table_name == "Chemical":
+            chemical_ids.add(row_id)
+        else:
+            bottle_ids.add(row_id)
+
+    if chemical_ids:
+        response["chemicals"] = changed_chemicals(chemical_ids)
+    if bottle_ids:
+        response["bottles"] = changed_bottles(bottle_ids)
+    # Anything changed that can't be found any more was deleted
+    response["deleted"]["chemicals"] = sorted(
+        chemical_ids - {chemical["id"] for chemical in response["chemicals"]}
+    )
+    response["deleted"]["bottles"] = sorted(
+        bottle_ids - {bottle["id"] for bottle in response["bottles"]}
+    )
+    logger.info(
+        f"{len(chemical_ids)} chemicals and {len(bottle_ids)} bottles changed since {since}"
+    )
+    return jsonify(response)
+
@@ -1,10 +1,21 @@
 from datetime import datetime
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, current_app, request, jsonify, session
+from autocomplete import name_index, remove_name, update_name
+from compact import FORMATS, compact_inventory_rows
 from msds import get_msds_url
 from oidc import oidc
+from data_version import changes_data, conditional_get
+from fieldsets import Fieldset
+from inventory_rows import (
+    in_stock,
+    inventory_row_query,
+    iter_inventory_chemicals,
+    live_bottle_quantities,
+)
+from loading import chemical_loading, inventory_loading
 from permission_requirements import require_editor
-from sqlalchemy.orm import joinedload
-import re
+from search_index import index_chemical, remove_chemical
+from streaming import log_stream_errors, stream_json_array
 import logging
 
 from models import (
@@ -33,6 +44,7 @@ logger = logging.getLogger(__name__)
 @chemicals.route("/api/add_bottle", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def add_bottle():
     """
     API endpoint to add a new chemical bottle to the inventory.
@@ -189,6 +201,7 @@ def product_search():
 @chemicals.route("/api/add_chemical", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def add_chemical():
     """
     Adds a new chemical to the database.
@@ -268,10 +281,12 @@ def add_chemical():
     db.session.add(chemical)
     db.session.add(chemical_manufacturer)
     try:
+        index_chemical(chemical)
         db.session.commit()
         logger.info(
             f"Chemical added successfully with chemical_id={chemical.Chemical_ID} by user {current_username}"
         )
+        update_name(chemical)
     except Exception as e:
         db.session.rollback()
         logger.error(
@@ -288,48 +303,86 @@ def add_chemical():
 
 @chemicals.route("/api/get_chemicals", methods=["GET"])
 @oidc.require_login
+@conditional_get
 def get_chemicals():
     """
     API to get chemical details from the database.
+    Pass format=compact for the smaller, dictionary-encoded format described in compact.py,
+    or fields= to only get some fields, as described in fieldsets.py.
+    Only chemicals with live bottles are listed. Pass dead=true or dead=false for
+    just their dead or live bottles.
     :return: A list of chemicals
     """
-    include_dead = request.args.get("dead", type=bool, default=None)
+    dead = request.args.get("dead")
+    if dead is None:
+        include_dead = None
+    elif dead.lower() in ("true", "1"):
+        include_dead = True
+    elif dead.lower() in ("false", "0"):
+        include_dead = False
+    else:
+        logger.warning(f"Invalid dead parameter: {dead}")
+        return jsonify({"error": "dead must be true or false"}), 400
+    response_format = request.args.get("format", "full")
+    if response_format not in FORMATS:
+        logger.warning(f"Invalid response format: {response_format}")
+        return jsonify({"error": f"format must be one of {', '.join(FORMATS)}"}), 400
+    fieldset = None
+    if request.args.get("fields") is not None:
+        try:
+            fieldset = Fieldset.parse(request.args["fields"])
+        except ValueError as e:
+            logger.warning(f"Invalid fields: {e}")
+            return jsonify({"error": str(e)}), 400
+        if response_format == "compact":
+            return jsonify({"error": "fields can't be used with format=compact"}), 400
     logger.info("Retrieving all chemicals")
+    batch_size = current_app.config["STREAM_BATCH_SIZE"]
+    # Only the queries run here, before the response starts, can still be
+    # answered with an error. The rows are read while the response is sent.
     try:
-        chemicals = (
-            db.session.query(Chemical)
-            .options(
-                joinedload(Chemical.Storage_Class),
-                joinedload(Chemical.Chemical_Manufacturers)
-                .joinedload(Chemical_Manufacturer.Inventory)
-                .joinedload(Inventory.Sub_Location)
-                .joinedload(Sub_Location.Location),
-                joinedload(Chemical.Chemical_Manufacturers).joinedload(
-                    Chemical_Manufacturer.Manufacturer
-                ),
-            )
-            .all()
-        )
-
-        chemical_list = [chem.to_dict() for chem in chemicals]
-        
-        for chem in chemical_list:
-            if include_dead is not None:
-                chem["inventory"] = list(filter(lambda x: x["dead"] == include_dead, chem["inventory"]))
-
-        chemical_list = filter(lambda x: x["quantity"] > 0, chemical_list)
-        chemical_list = sorted(
-            chemical_list,
-            key=lambda x: (
-                x["quantity"] == 0,
-                re.sub(r"[^a-zA-Z]", "", x["chemical_name"]).lower(),
-            ),
-        )
-        logger.debug(f"Chemicals: {chemical_list}")
-        return jsonify(chemical_list)
+        # Only chemicals with live bottles, and only the bottles asked for, are read
+        # from the database. When that's just the dead bottles, the live ones are
+        # counted separately.
+        quantities = live_bottle_quantities() if include_dead else None
+        if fieldset is not None:
+            rows = iter(in_stock(fieldset.query(), include_dead).yield_per(batch_size))
+            chemical_list = fieldset.iter_chemicals(rows, quantities)
+        else:
+            # One row per bottle, only the columns the response needs
+            rows = iter(in_stock(inventory_row_query(), include_dead).yield_per(batch_size))
+            if response_format == "compact":
+                return jsonify(compact_inventory_rows(rows, quantities))
+            # Already in alphabetical order from the query
+            chemical_list = iter_inventory_chemicals(rows, quantities)
     except Exception as e:
         logger.error(f"Failed to retrieve chemicals: {e}", exc_info=True)
         return jsonify({"error": "Failed to retrieve chemicals"}), 500
+    return stream_json_array(log_stream_errors(chemical_list, "chemicals"))
+
+
+@chemicals.route("/api/chemicals/<int:chemical_id>", methods=["GET"])
+@oidc.require_login
+@conditional_get
+def get_chemical(chemical_id):
+    """
+    API to get one chemical with all of its bottles.
+    Takes the same three queries however many manufacturers and bottles it has,
+    see loading.py.
+    :param chemical_id: The ID of the chemical.
+    :return: The chemical, in the same shape as in /api/get_chemicals, or 404 if it doesn't exist.
+    """
+    chemical = (
+        db.session.query(Chemical)
+        .filter(Chemical.Chemical_ID == chemical_id)
+        .options(*chemical_loading())
+        .first()
+    )
+    if not chemical:
+        logger.warning(f"Chemical {chemical_id} not found")
+        return jsonify({"error": "Chemical not found"}), 404
+    logger.info(f"Returning chemical {chemical_id}")
+    return jsonify(chemical.to_dict())
 
 
 @chemicals.route("/api/chemicals/product_number_lookup", methods=["GET"])
@@ -438,9 +491,50 @@ def chemical_name_lookup():
     return jsonify(chemicals_data)
 
 
+@chemicals.route("/api/chemicals/autocomplete", methods=["GET"])
+@oidc.require_login
+def autocomplete():
+    """
+    Suggest chemical names while the user types. Served from memory, see autocomplete.py.
+
+    Query Parameters:
+    - prefix (str): What the user has typed so far. Case and spaces are ignored.
+    - limit (int, optional): The most suggestions to return.
+
+    Returns:
+    - 200 OK: A list of the chemicals whose names start with the prefix, with the
+      most live bottles first. Each has an id, chemical_name and quantity.
+    - 400 Bad Request: An error message if `prefix` is missing or `limit` is invalid.
+    """
+    prefix = request.args.get("prefix", "")
+    if not prefix.strip():
+        logger.warning("Autocomplete prefix is missing")
+        return jsonify({"error": "Missing prefix"}), 400
+    limit = request.args.get("limit")
+    if limit is None:
+        limit = current_app.config["AUTOCOMPLETE_LIMIT"]
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+    if limit < 1:
+        logger.warning(f"Invalid autocomplete limit: {request.args.get('limit')}")
+        return jsonify({"error": "Invalid limit"}), 400
+
+    suggestions = name_index().complete(prefix, limit)
+    return jsonify(
+        [
+            {"id": chemical_id, "chemical_name": name, "quantity": quantity}
+            for chemical_id, name, quantity in suggestions
+        ]
+    )
+
+
 @chemicals.route("/api/chemicals/mark_dead", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def mark_dead():
     """
     API to mark a chemical bottle as dead.
@@ -483,6 +577,7 @@ def mark_dead():
 @chemicals.route("/api/chemicals/mark_many_dead", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def mark_many_dead():
     """
     Marks multiple chemicals as dead in the inventory for a specified sub-location.
@@ -586,6 +681,7 @@ def mark_many_dead():
 @chemicals.route("/api/chemicals/mark_alive", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def mark_alive():
     """
     Marks a chemical as alive by updating its status in the database.
@@ -683,6 +779,7 @@ def get_chemicals_by_sublocation():
             Inventory.Sub_Location_ID == sub_location_id,
             Inventory.Is_Dead == False,  # Filter out dead chemicals
         )
+        .options(*inventory_loading())
         .order_by(Inventory.Sticker_Number.asc())
         .all()
     )
@@ -780,6 +877,7 @@ def sticker_lookup():
 @chemicals.route("/api/chemicals/update_chemical_location", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def update_location():
     """
     Updates the location of a chemical bottle in the inventory.
@@ -836,6 +934,7 @@ def update_location():
 @chemicals.route("/api/update_chemical/<int:chemical_id>", methods=["PUT"])
 @oidc.require_login
 @require_editor
+@changes_data
 def update_chemical(chemical_id):
     """
     Updates the details of an existing chemical in the database.
@@ -878,8 +977,10 @@ def update_chemical(chemical_id):
     chemical.Chemical_Name = data.get("chemical_name", chemical.Chemical_Name)
     chemical.Chemical_Formula = data.get("chemical_formula", chemical.Chemical_Formula)
     chemical.Storage_Class_ID = data.get("storage_class_id", chemical.Storage_Class_ID)
+    index_chemical(chemical)
 
     db.session.commit()
+    update_name(chemical)
     logger.info(f"Chemical {chemical_id} updated successfully")
     return jsonify({"message": "Chemical updated successfully"})
 
@@ -887,6 +988,7 @@ def update_chemical(chemical_id):
 @chemicals.route("/api/update_last_seen/<int:sticker_number>", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def update_last_seen(sticker_number):
     """
     Update when a user saw a chemical and who saw it.
@@ -914,6 +1016,7 @@ def update_last_seen(sticker_number):
 @chemicals.route("/api/delete_chemical/<int:chemical_id>", methods=["DELETE"])
 @oidc.require_login
 @require_editor
+@changes_data
 def delete_chemical(chemical_id):
     """
     API Endpoint: Delete a Chemical
@@ -937,6 +1040,7 @@ def delete_chemical(chemical_id):
         - Deletes all Inventory records associated with the retrieved
         Chemical_Manufacturer IDs.
         - Deletes all Chemical_Manufacturer records associated with the chemical.
+        - Removes the chemical from the search index.
         - Deletes the chemical record itself.
     """
     chemical = db.session.query(Chemical).filter_by(Chemical_ID=chemical_id).first()
@@ -959,9 +1063,13 @@ def delete_chemical(chemical_id):
         synchronize_session=False
     )
 
+    # Remove it from the search index
+    remove_chemical(chemical_id)
+
     # Delete the chemical itself
     db.session.delete(chemical)
     db.session.commit()
+    remove_name(chemical_id)
     logger.info(f"Chemical {chemical_id} deleted successfully")
     return jsonify({"message": "Chemical deleted successfully"})
 
@@ -969,6 +1077,7 @@ def delete_chemical(chemical_id):
 @chemicals.route("/api/update_inventory/<int:inventory_id>", methods=["PUT"])
 @oidc.require_login
 @require_editor
+@changes_data
 def update_inventory(inventory_id):
     """
     Update an inventory record in the database.
@@ -1106,6 +1215,7 @@ def update_inventory(inventory_id):
 @chemicals.route("/api/chemicals/delete_dead", methods=["DELETE"])
 @oidc.require_login
 @require_editor
+@changes_data
 def delete_dead_bottles():
     """
     Delete dead chemical bottles from the inventory.
@@ -0,0 +1,163 @@
+"""
+Compact, dictionary-encoded inventory responses.
+
+In the full format every bottle repeats its location, sub-location and
+manufacturer, names and IDs both, and most of a large inventory's JSON is those
+repeats. When a client asks for format=compact, each location, sub-location,
+manufacturer and storage class is listed once in a lookup table, and chemicals
+and bottles are arrays that refer to them by their index in the table:
+
+    {
+        "format": "compact",
+        "locations": [[Location_ID, "Building Room"], ...],
+        "sub_locations": [[Sub_Location_ID, name, location index], ...],
+        "manufacturers": [[Manufacturer_ID, name], ...],
+        "storage_classes": [[Storage_Class_ID, name], ...],
+        "chemicals": [[id, name, formula, storage class index or null, quantity, bottles], ...],
+    }
+
+where each bottle is an array in the order of BOTTLE_FIELDS.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("full", "compact")
+
+CHEMICAL_FIELDS = (
+    "id",
+    "chemical_name",
+    "formula",
+    "storage_class",
+    "quantity",
+    "inventory",
+)
+
+BOTTLE_FIELDS = (
+    "id",
+    "sticker",
+    "product_number",
+    "sub_location",
+    "manufacturer",
+    "dead",
+    "msds",
+    "last_updated",
+    "who_updated",
+)
+
+# Positions in a chemical's array
+QUANTITY = CHEMICAL_FIELDS.index("quantity")
+INVENTORY = CHEMICAL_FIELDS.index("inventory")
+
+
+class LookupTable:
+    """
+    A list of distinct entries, each given the next index the first time it's seen.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+        self.entries = []
+
+    def index(self, key, entry):
+        """
+        :param key: What identifies the entry, usually its ID.
+        :param entry: The entry to add if the key hasn't been seen yet.
+        :return: The entry's index in the table.
+        """
+        index = self.indexes.get(key)
+        if index is None:
+            index = self.indexes[key] = len(self.entries)
+            self.entries.append(entry)
+        return index
+
+
+def compact_inventory_rows(rows, quantities=None):
+    """
+    Encode bottle rows in the compact format, in one pass over the rows.
+    :param rows: Rows of INVENTORY_ROW_COLUMNS, with each chemical's bottles together.
+    :param quantities: A dictionary of Chemical_ID to live bottles, for when the
+        rows don't include every live bottle. By default the live rows are counted.
+    :return: The compact response as a dictionary.
+    """
+    locations = LookupTable()
+    sub_locations = LookupTable()
+    manufacturers = LookupTable()
+    storage_classes = LookupTable()
+    chemicals = []
+    chemical = None
+    chemical_id = None
+
+    for (
+        row_chemical_id,
+        chemical_name,
+        formula,
+        storage_class,
+        storage_class_id,
+        inventory_id,
+        sticker,
+        product_number,
+        sub_location,
+        sub_location_id,
+        building,
+        room,
+        location_id,
+        manufacturer,
+        manufacturer_id,
+        is_dead,
+        msds,
+        last_updated,
+        who_updated,
+    ) in rows:
+        if row_chemical_id != chemical_id:
+            chemical_id = row_chemical_id
+            chemical = [
+                chemical_id,
+                chemical_name,
+                formula,
+                (
+                    storage_classes.index(
+                        storage_class_id, [storage_class_id, storage_class]
+                    )
+                    if storage_class_id is not None
+                    else None
+                ),
+                quantities.get(chemical_id, 0) if quantities is not None else 0,
+                [],
+            ]
+            chemicals.append(chemical)
+        if not is_dead and quantities is None:
+            chemical[QUANTITY] += 1
+
+        location = locations.index(location_id, [location_id, f"{building} {room}"])
+        chemical[INVENTORY].append(
+            [
+                inventory_id,
+                sticker,
+                product_number,
+                sub_locations.index(
+                    sub_location_id, [sub_location_id, sub_location, location]
+                ),
+                manufacturers.index(manufacturer_id, [manufacturer_id, manufacturer]),
+                # Integers are shorter in JSON than true and false
+                int(bool(is_dead)),
+                int(msds != None and msds != ""),
+                last_updated.strftime("%Y-%m-%d") if last_updated else None,
+                who_updated,
+            ]
+        )
+
+    logger.debug(
+        f"Encoded {len(chemicals)} chemicals with {len(locations.entries)} locations, "
+        f"{len(sub_locations.entries)} sub-locations and "
+        f"{len(manufacturers.entries)} manufacturers."
+    )
+    return {
+        "format": "compact",
+        "locations": locations.entries,
+        "sub_locations": sub_locations.entries,
+        "manufacturers": manufacturers.entries,
+        "storage_classes": storage_classes.entries,
+        "chemicals": chemicals,
+    }
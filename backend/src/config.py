@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 from sqlalchemy.engine import URL
 
@@ -37,6 +38,54 @@ class ProdConfig:
         port=os.getenv("MYSQL_PORT"),
     )
 
+    # Where synonym searches look up chemical names
+    PUBCHEM_URL = os.getenv(
+        "CHEMINV_PUBCHEM_URL", "https://pubchem.ncbi.nlm.nih.gov/rest/pug"
+    )
+    # How long (in seconds) looked up synonyms are kept before asking PubChem again
+    SYNONYM_CACHE_TTL = int(os.getenv("CHEMINV_SYNONYM_CACHE_TTL", 30 * 24 * 60 * 60))
+    # How long to remember that PubChem had no synonyms for a name
+    SYNONYM_CACHE_NEGATIVE_TTL = int(
+        os.getenv("CHEMINV_SYNONYM_CACHE_NEGATIVE_TTL", 24 * 60 * 60)
+    )
+    # How many synonym lookups to also keep in memory
+    SYNONYM_CACHE_SIZE = 512
+    # How long (in seconds) to wait while connecting to and reading from PubChem
+    PUBCHEM_CONNECT_TIMEOUT = 3.05
+    PUBCHEM_READ_TIMEOUT = 10
+    # How long a search waits for synonyms before searching without them
+    PUBCHEM_LATENCY_BUDGET = float(os.getenv("CHEMINV_PUBCHEM_LATENCY_BUDGET", 2))
+    # How many PubChem requests may run at once, and how many may be waiting
+    PUBCHEM_MAX_WORKERS = 4
+    PUBCHEM_MAX_PENDING = 16
+    # Stop asking PubChem for PUBCHEM_RESET_TIMEOUT seconds after this many failures in a row
+    PUBCHEM_FAILURE_THRESHOLD = 5
+    PUBCHEM_RESET_TIMEOUT = 60
+    # How many chemical names autocomplete suggests by default
+    AUTOCOMPLETE_LIMIT = 10
+    # How many search responses to keep in memory, and the most memory (in bytes) they may use
+    SEARCH_CACHE_SIZE = 256
+    SEARCH_CACHE_MAX_BYTES = int(
+        os.getenv("CHEMINV_SEARCH_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+    )
+    # How many rows streamed responses read from the database at a time
+    STREAM_BATCH_SIZE = 1000
+    # Where exports built in the background are kept
+    EXPORT_DIR = os.getenv(
+        "CHEMINV_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "cheminv-exports")
+    )
+    # How many exports may be built at once, and how many jobs' statuses are remembered
+    EXPORT_MAX_WORKERS = 2
+    EXPORT_MAX_JOBS = 100
+    # How often (in seconds) to check for changes made outside the server, like
+    # flask import-inventory. None never checks
+    DATA_VERSION_CHECK_INTERVAL = float(
+        os.getenv("CHEMINV_DATA_VERSION_CHECK_INTERVAL", 5)
+    )
+    # How many rows imports insert at a time, and how many errors they report
+    IMPORT_BATCH_SIZE = 1000
+    IMPORT_MAX_ERRORS = 1000
+
 
 class TestingConfig(ProdConfig):
     """
@@ -46,6 +95,8 @@ class TestingConfig(ProdConfig):
     SECRET_KEY = os.getenv("CHEMINV_SECRET_KEY")
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    # Only the tests write to their database, through the app
+    DATA_VERSION_CHECK_INTERVAL = None
     DEBUG = True
     OIDC_ENABLED = False
     OIDC_TESTING_PROFILE = {
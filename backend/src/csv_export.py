@@ -1,115 +1,315 @@
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, current_app, jsonify, request
+from marshmallow import ValidationError
 from database import db
-from models import Inventory
-from sqlalchemy.orm import joinedload
+from inventory_rows import is_dead
+from models import (
+    Chemical,
+    Chemical_Manufacturer,
+    Inventory,
+    Location,
+    Manufacturer,
+    Storage_Class,
+    Sub_Location,
+)
+from sqlalchemy import case, func
+from schemas import ExportParamsSchema
+from streaming import CHUNK_SIZE, stream_response
 import csv
 import io
+import itertools
 import logging
+import zlib
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 csv_export = Blueprint("csv_export", __name__)
 
+CSV_HEADER = [
+    "Sticker Number",
+    "Chemical",
+    "Location",
+    "Sub-Location",
+    "MSDS",
+    "Comment",
+    "Storage Class",
+    "Alphabetized by",
+    "Chemical Formula & Common Name",
+    "Last Updated",
+    "Who Updated",
+    "Quantity",
+    "Minimum Needed",
+    "Manufacturer",
+    "Product Number",
+    "CAS Number",
+    "Barcode",
+    "Dead?",
+]
 
-@csv_export.route("/api/export_inventory_csv", methods=["GET"])
-def export_inventory_csv():
+
+# The keys of each bottle in NDJSON exports, in the order of CSV_COLUMNS
+NDJSON_FIELDS = (
+    "sticker_number",
+    "chemical",
+    "location",
+    "sub_location",
+    "msds",
+    "comment",
+    "storage_class",
+    "alphabetized_by",
+    "formula_and_name",
+    "last_updated",
+    "who_updated",
+    "quantity",
+    "minimum_needed",
+    "manufacturer",
+    "product_number",
+    "cas_number",
+    "barcode",
+    "dead",
+)
+
+# The 18 columns of the CSV file, in the order of CSV_HEADER, worked out by the database
+CSV_COLUMNS = (
+    Inventory.Sticker_Number,
+    Chemical.Chemical_Name,
+    # Build a location string from the related Sub_Location and Location (if available)
+    case(
+        (Location.Location_ID.is_(None), ""),
+        else_=Location.Building + " " + Location.Room,
+    ),
+    Sub_Location.Sub_Location_Name,
+    Chemical_Manufacturer.MSDS,  # MSDS from the Chemical_Manufacturer join record
+    # Prefer the inventory comment, fallback to the join comment
+    func.coalesce(func.nullif(Inventory.Comment, ""), Chemical_Manufacturer.Comment),
+    Storage_Class.Storage_Class_Name,
+    Chemical.Alphabetical_Name,
+    # Combine the chemical formula and name.
+    case(
+        (
+            func.coalesce(Chemical.Chemical_Formula, "") != "",
+            Chemical.Chemical_Formula + " (" + Chemical.Chemical_Name + ")",
+        ),
+        else_=Chemical.Chemical_Name,
+    ),
+    Inventory.Last_Updated,
+    Inventory.Who_Updated,
+    Inventory.Quantity,
+    Chemical.Minimum_On_Hand,
+    Manufacturer.Manufacturer_Name,
+    Chemical_Manufacturer.Product_Number,
+    Chemical_Manufacturer.CAS_Number,
+    Chemical_Manufacturer.Barcode,
+    Inventory.Is_Dead,
+)
+
+
+def inventory_csv_query(filters=()):
     """
-    Export the inventory to a CSV file.
-    :return: CSV file.
+    Build one query for every row of the CSV file, so exporting takes a single
+    round trip however many bottles there are, rather than loading each bottle's
+    chemical, manufacturer and location separately.
+    Bottles without a sub-location or manufacturer are still exported.
+    :param filters: SQL conditions the bottles must meet, see export_filters().
+    :return: A query of CSV_COLUMNS for every bottle.
+    """
+    return (
+        db.session.query(*CSV_COLUMNS)
+        .select_from(Inventory)
+        .join(Inventory.Chemical_Manufacturer)
+        .join(Chemical_Manufacturer.Chemical)
+        .outerjoin(Chemical.Storage_Class)
+        .outerjoin(Chemical_Manufacturer.Manufacturer)
+        .outerjoin(Inventory.Sub_Location)
+        .outerjoin(Sub_Location.Location)
+        .filter(*filters)
+        .order_by(Inventory.Inventory_ID)
+    )
+
+
+def parse_export_params(args):
+    """
+    Parse and validate the export's query parameters.
+    :param args: The request's query parameters.
+    :return: A dictionary of the parameters, see ExportParamsSchema.
+    :raises ValidationError: If any of them are invalid.
+    """
+    manufacturers = args.get("manufacturers")
+    params = {
+        "building": args.get("building", None),
+        "location": args.get("location", None),
+        "sub_location": args.get("sub_location", None),
+        "storage_class": args.get("storage_class", None),
+        "manufacturers": manufacturers.split(",") if manufacturers else [],
+        "dead": args.get("dead", None),
+        "format": args.get("format", "csv"),
+        "compress": args.get("compress", None),
+    }
+    return ExportParamsSchema().load(params)
+
+
+def export_filters(params):
+    """
+    :param params: The parsed export parameters.
+    :return: SQL conditions for the bottles the export includes.
+    """
+    filters = []
+    if params.get("building"):
+        filters.append(Location.Building == params["building"])
+    if params.get("location"):
+        filters.append(Location.Location_ID == params["location"])
+    if params.get("sub_location"):
+        filters.append(Sub_Location.Sub_Location_ID == params["sub_location"])
+    if params.get("storage_class"):
+        filters.append(Storage_Class.Storage_Class_ID == params["storage_class"])
+    if params.get("manufacturers"):
+        filters.append(Manufacturer.Manufacturer_ID.in_(params["manufacturers"]))
+    if params.get("dead") is not None:
+        filters.append(is_dead(params["dead"]))
+    logger.debug(f"Built export filters: {filters}")
+    return filters
+
+
+def iter_csv(rows, chunk_size=CHUNK_SIZE):
+    """
+    Encode rows as CSV, a few at a time.
+    :param rows: An iterable of lists of values, starting with the header.
+    :return: A generator of strings that join up into the CSV file.
     """
-    logger.info("Starting inventory CSV export.")
     output = io.StringIO()
     writer = csv.writer(output)
+    for row in rows:
+        writer.writerow(row)
+        if output.tell() >= chunk_size:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
 
-    # Add a header row
-
-    # Write the header row first
-    writer.writerow(
-        [
-            "Sticker Number",
-            "Chemical",
-            "Location",
-            "Sub-Location",
-            "MSDS",
-            "Comment",
-            "Storage Class",
-            "Alphabetized by",
-            "Chemical Formula & Common Name",
-            "Last Updated",
-            "Who Updated",
-            "Quantity",
-            "Minimum Needed",
-            "Manufacturer",
-            "Product Number",
-            "CAS Number",
-            "Barcode",
-            "Dead?",
-        ]
-    )
 
+def iter_ndjson(rows, chunk_size=CHUNK_SIZE):
+    """
+    Encode rows as newline delimited JSON, one object per row, a few at a time.
+    :param rows: An iterable of rows of CSV_COLUMNS, without a header.
+    :return: A generator of strings that join up into the NDJSON file.
+    """
+    dumps = current_app.json.dumps
+    chunk = []
+    size = 0
+    for row in rows:
+        values = dict(zip(NDJSON_FIELDS, row))
+        if values["last_updated"]:
+            values["last_updated"] = values["last_updated"].strftime("%Y-%m-%d")
+        encoded = dumps(values, separators=(",", ":"))
+        chunk.append(encoded)
+        chunk.append("\n")
+        size += len(encoded) + 1
+        if size >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+    yield "".join(chunk)
+
+
+def iter_gzip(chunks):
+    """
+    Compress a stream of bytes as it goes.
+    :return: A generator of bytes that join up into a gzip file.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iter_export_rows(filters=()):
+    """
+    Read the inventory in batches, so only one batch of bottles is in memory at a time.
+    :param filters: SQL conditions the bottles must meet, see export_filters().
+    :return: A generator of a row of CSV_COLUMNS for every bottle.
+    """
+    count = 0
+    try:
+        for row in inventory_csv_query(filters).yield_per(
+            current_app.config["STREAM_BATCH_SIZE"]
+        ):
+            yield row
+            count += 1
+    except Exception as e:
+        # The response has already started, so all that can be done is cut it short
+        logger.error(f"An error occurred during export after {count} rows: {e}")
+        raise
+    logger.info(f"Export of {count} inventory items completed successfully.")
+
+
+def iter_export(params):
+    """
+    :param params: The parsed export parameters.
+    :return: A generator of bytes that join up into the export file.
+    """
+    rows = iter_export_rows(export_filters(params))
+    if params["format"] == "ndjson":
+        chunks = iter_ndjson(rows)
+    else:
+        chunks = iter_csv(itertools.chain([CSV_HEADER], rows))
+    chunks = (chunk.encode("utf-8") for chunk in chunks)
+    if params.get("compress") == "gzip":
+        chunks = iter_gzip(chunks)
+    return chunks
+
+
+def export_file_name(params):
+    """
+    :return: The name of the export file for the parameters, such as inventory_report.csv.gz.
+    """
+    extension = "ndjson" if params["format"] == "ndjson" else "csv"
+    if params.get("compress") == "gzip":
+        extension += ".gz"
+    return f"inventory_report.{extension}"
+
+
+def export_mimetype(params):
+    """
+    :return: The Content-Type of the export file for the parameters.
+    """
+    if params.get("compress") == "gzip":
+        return "application/gzip"
+    return "application/x-ndjson" if params["format"] == "ndjson" else "text/csv"
+
+
+@csv_export.route("/api/export_inventory_csv", methods=["GET"])
+def export_inventory_csv():
+    """
+    Export the inventory to a CSV file.
+    The file is sent as it's written, with the bottles read from the database in batches.
+
+    Query Parameters:
+        building (str, optional): Only bottles in this building.
+        location (int, optional): Only bottles in this Location_ID (room).
+        sub_location (int, optional): Only bottles in this Sub_Location_ID.
+        storage_class (int, optional): Only chemicals of this Storage_Class_ID.
+        manufacturers (str, optional): Comma separated Manufacturer_IDs.
+        dead (bool, optional): true for only dead bottles, false for only live ones.
+        format (str, optional): "csv" (the default) or "ndjson", one JSON object per bottle.
+        compress (str, optional): "gzip" to compress the file as it's sent.
+
+    :return: CSV file, or NDJSON if asked for.
+    """
     try:
-        # Get the inventory records.
-        inventory_items = db.session.query(Inventory).all()
-        logger.info(f"Retrieved {len(inventory_items)} inventory items from the database.")
-
-        # Write each row to the CSV file
-        for item in inventory_items:
-            # Get the Chemical_Manufacturer record
-            chem_mfg = item.Chemical_Manufacturer
-            # Get the Chemical record via the join table
-            chem = chem_mfg.Chemical
-
-            # Build a location string from the related Sub_Location and Location (if available)
-            location = ""
-            if item.Sub_Location and item.Sub_Location.Location:
-                loc = item.Sub_Location.Location
-                location = f"{loc.Building} {loc.Room}"
-
-            # Combine the chemical formula and name.
-            if chem.Chemical_Formula:
-                chem_formula_common = f"{chem.Chemical_Formula} ({chem.Chemical_Name})"
-            else:
-                chem_formula_common = chem.Chemical_Name
-
-            writer.writerow(
-                [
-                    item.Sticker_Number,
-                    chem.Chemical_Name,
-                    location,
-                    item.Sub_Location.Sub_Location_Name if item.Sub_Location else None,
-                    chem_mfg.MSDS,  # MSDS from the Chemical_Manufacturer join record
-                    item.Comment
-                    or chem_mfg.Comment,  # Prefer the inventory comment, fallback to the join comment
-                    chem.Storage_Class.Storage_Class_Name if chem.Storage_Class else None,
-                    chem.Alphabetical_Name,
-                    chem_formula_common,
-                    item.Last_Updated,
-                    item.Who_Updated,
-                    item.Quantity,
-                    chem.Minimum_On_Hand,
-                    (
-                        chem_mfg.Manufacturer.Manufacturer_Name
-                        if chem_mfg.Manufacturer
-                        else None
-                    ),
-                    chem_mfg.Product_Number,
-                    chem_mfg.CAS_Number,
-                    chem_mfg.Barcode,
-                    item.Is_Dead,
-                ]
-            )
-
-        output.seek(0)
-        logger.info("CSV export completed successfully.")
-
-        # Create the response object with the correct headers for a CSV download.
-        response = Response(output.getvalue(), mimetype="text/csv")
-        response.headers["Content-Disposition"] = (
-            "attachment; filename=inventory_report.csv"
+        params = parse_export_params(request.args)
+    except ValidationError as e:
+        logger.error(f"Validation error: {e.messages}")
+        return (
+            jsonify({"error": "Invalid request parameters", "details": e.messages}),
+            400,
         )
-        return response
 
-    except Exception as e:
-        logger.error(f"An error occurred during CSV export: {e}")
-        return jsonify({"error": "Failed to export inventory CSV"}), 500
+    logger.info(f"Starting inventory export with {params}.")
+    # Create the response object with the correct headers for a file download.
+    response = stream_response(iter_export(params), mimetype=export_mimetype(params))
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename={export_file_name(params)}"
+    )
+    return response
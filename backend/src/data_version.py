@@ -0,0 +1,201 @@
+"""
+A counter that goes up every time the inventory changes.
+
+Anything computed from the inventory can be cached along with the data version it
+was computed at, and thrown away once the version moves on. Every endpoint that
+writes to the inventory, chemicals, locations, manufacturers or storage classes
+is decorated with @changes_data.
+
+The counter lives in memory, so on its own it only sees writes made through
+this process. Commands that write from another process, like
+flask import-inventory, call bump_shared_data_version() instead, which counts
+the change in the Data_Version table. The counter checks that row every
+DATA_VERSION_CHECK_INTERVAL seconds, and goes up when it has changed, so such a
+change is noticed within that time. It starts again from 0 on every restart, so
+anything given to clients (like ETags) also includes a token that is different
+every time the app starts.
+"""
+
+import hashlib
+import logging
+import secrets
+import threading
+import time
+from functools import wraps
+from flask import current_app, make_response, request
+from sqlalchemy import update
+from sqlalchemy.exc import SQLAlchemyError
+from database import db
+from models import Data_Version
+
+logger = logging.getLogger(__name__)
+
+# The Data_Version_ID of the single Data_Version row
+SHARED_VERSION_ID = 1
+
+
+class DataVersion:
+    """
+    A thread safe counter.
+    """
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+        # Tells versions from before and after a restart apart
+        self.boot_token = secrets.token_hex(4)
+        # The shared version last read from the database, and when
+        self.shared_version = None
+        self._checked_at = None
+
+    @property
+    def value(self):
+        return self._value
+
+    def bump(self):
+        with self._lock:
+            self._value += 1
+            return self._value
+
+    def check_shared_version(self, read, interval):
+        """
+        Go up if the shared version has changed since it was last read,
+        reading it at most once every interval seconds.
+        :param read: Reads the shared version from the database, or returns None if it can't.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < interval:
+                return
+            self._checked_at = now
+        shared_version = read()
+        if shared_version is None:
+            return
+        with self._lock:
+            previous = self.shared_version
+            self.shared_version = shared_version
+            # Nothing has been cached yet the first time
+            if previous is not None and shared_version != previous:
+                self._value += 1
+                logger.info(
+                    f"Data changed outside the server, data version is now {self._value}"
+                )
+
+
+def data_version_counter():
+    """
+    :return: The data version counter for the current app, created on first use.
+    """
+    counter = current_app.extensions.get("data_version")
+    if counter is None:
+        counter = current_app.extensions.setdefault("data_version", DataVersion())
+    interval = current_app.config["DATA_VERSION_CHECK_INTERVAL"]
+    if interval is not None:
+        counter.check_shared_version(read_shared_data_version, interval)
+    return counter
+
+
+def read_shared_data_version():
+    """
+    :return: How many times the data has been changed outside the server, or
+        None if it can't be found out.
+    """
+    try:
+        return (
+            db.session.query(Data_Version.Version)
+            .filter(Data_Version.Data_Version_ID == SHARED_VERSION_ID)
+            .scalar()
+            or 0
+        )
+    except SQLAlchemyError as e:
+        logger.warning(f"Couldn't check for changes made outside the server: {e}")
+        return None
+
+
+def bump_shared_data_version():
+    """
+    Tell running servers that the data has changed. Call this after committing a
+    change made outside the server, such as from a command.
+    """
+    updated = db.session.execute(
+        update(Data_Version)
+        .where(Data_Version.Data_Version_ID == SHARED_VERSION_ID)
+        .values(Version=Data_Version.Version + 1)
+    ).rowcount
+    if not updated:
+        db.session.add(Data_Version(Data_Version_ID=SHARED_VERSION_ID, Version=1))
+    db.session.commit()
+    logger.info("Told running servers the data has changed")
+
+
+def current_data_version():
+    """
+    Read this before querying, so a write that happens during the query makes the
+    result stale rather than being missed.
+    :return: The current data version.
+    """
+    return data_version_counter().value
+
+
+def bump_data_version():
+    """
+    Mark everything cached so far as stale. Call this after committing a change.
+    :return: The new data version.
+    """
+    version = data_version_counter().bump()
+    logger.debug(f"Data version is now {version}")
+    return version
+
+
+def changes_data(func):
+    """
+    Decorator for endpoints that write to the database.
+    Bumps the data version once the endpoint has finished, whether or not it succeeded.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            bump_data_version()
+
+    return wrapper
+
+
+def current_etag():
+    """
+    :return: A strong ETag for the current request's response at the current data version.
+        The path and query string are part of it, since they change the response.
+    """
+    counter = data_version_counter()
+    variant = hashlib.sha1(request.full_path.encode()).hexdigest()[:16]
+    return f"{counter.boot_token}-{counter.value}-{variant}"
+
+
+def conditional_get(func):
+    """
+    Decorator for GET endpoints whose response only depends on the data and the URL.
+    Adds an ETag to the response, and answers a matching If-None-Match with
+    304 Not Modified before the endpoint runs.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        # Read before the endpoint queries anything, so a write that happens
+        # in the meantime makes this ETag stale instead of being missed
+        etag = current_etag()
+        if request.if_none_match.contains_weak(etag):
+            logger.debug(f"{request.path} has not changed since {etag}")
+            response = make_response("", 304)
+            response.set_etag(etag)
+            return response
+
+        response = make_response(func(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+            # Let browsers keep it, but check it's still current every time
+            response.cache_control.no_cache = True
+        return response
+
+    return wrapper
@@ -0,0 +1,318 @@
+"""
+Inventory exports built in the background.
+
+A large export can take longer than a reverse proxy waits for a response, and
+ties up one of waitress' threads while it runs. Instead, a client starts an
+export job, polls its status, and downloads the file once it's ready:
+
+    POST /api/export_jobs                    -> 202 and the job
+    GET  /api/export_jobs/<job_id>           -> the job's status
+    GET  /api/export_jobs/<job_id>/download  -> the file, once the job is done
+
+Jobs run on a small worker pool. Each finished file is kept on disk under a name
+made from the data version it was built at, so exporting again before anything
+has changed is served from that file without querying the database, and
+starting the same export while it's still being built joins the running job.
+Files from older data versions are deleted once a newer one is built.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, current_app, jsonify, request, send_file
+from marshmallow import ValidationError
+from cache import LRUCache
+from csv_export import (
+    export_file_name,
+    export_mimetype,
+    iter_export,
+    parse_export_params,
+)
+from data_version import data_version_counter
+from oidc import oidc
+
+export_jobs = Blueprint("export_jobs", __name__)
+logger = logging.getLogger(__name__)
+
+ARTIFACT_PREFIX = "inventory_"
+
+
+class ExportJob:
+    """
+    One requested export. Its status goes from "pending" to "running" to "done" or "failed".
+    """
+
+    def __init__(self, version, key, path, file_name, mimetype):
+        """
+        :param version: The data version the export is built at.
+        :param key: Identifies what's exported, and at which data version.
+        :param path: Where the finished file is kept.
+        :param file_name: The name to download the file as.
+        :param mimetype: The file's Content-Type.
+        """
+        self.id = uuid.uuid4().hex
+        self.version = version
+        self.key = key
+        self.path = path
+        self.file_name = file_name
+        self.mimetype = mimetype
+        self.status = "pending"
+        self.error = None
+
+    def to_dict(self):
+        return {"id": self.id, "status": self.status, "error": self.error}
+
+
+class ExportJobs:
+    """
+    The export worker pool and the jobs it has been given. Use export_job_runner()
+    to get the one for the current app.
+    """
+
+    def __init__(self, directory, max_workers, max_jobs):
+        """
+        :param directory: Where finished exports are kept. Created if it doesn't exist.
+        :param max_workers: How many exports may be built at once.
+        :param max_jobs: How many jobs to remember the status of.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="export"
+        )
+        self._jobs = LRUCache(max_jobs)
+        # Jobs still being built, by key, so the same export is only built once at a time
+        self._in_flight = {}
+        # The newest data version an export has been started at, whose files are kept
+        self._latest_version = None
+        self._lock = threading.Lock()
+
+    def get(self, job_id):
+        """
+        :return: The job, or None if there's no job with that id (any more).
+        """
+        return self._jobs.get(job_id)
+
+    def start(
+        self,
+        app,
+        version,
+        build,
+        variant="all",
+        file_name="inventory_report.csv",
+        mimetype="text/csv",
+    ):
+        """
+        Start an export, unless its file already exists or it's already being built.
+
+        :param app: The app, for the worker's app context.
+        :param version: The data version, see artifact_version().
+        :param build: Called with a file opened for writing bytes to write the export into.
+        :param variant: Tells apart exports of the same data with different
+            parameters. Only letters and numbers may be used.
+        :param file_name: The name to download the file as.
+        :param mimetype: The file's Content-Type.
+        :return: The job.
+        """
+        key = f"{version}_{variant}"
+        extension = file_name.partition(".")[2]
+        path = os.path.join(self.directory, f"{ARTIFACT_PREFIX}{key}.{extension}")
+        with self._lock:
+            if is_newer_version(version, self._latest_version):
+                self._latest_version = version
+            job = self._in_flight.get(key)
+            if job is not None:
+                logger.debug(f"Export {key} is already being built by job {job.id}")
+                return job
+
+            job = ExportJob(version, key, path, file_name, mimetype)
+            self._jobs.put(job.id, job)
+            if os.path.exists(path):
+                logger.info(f"Export {key} is already on disk, job {job.id} is done")
+                job.status = "done"
+                return job
+
+            self._in_flight[key] = job
+            self._executor.submit(self._run, app, job, build)
+        logger.info(f"Started export job {job.id} for {key}")
+        return job
+
+    def _run(self, app, job, build):
+        """
+        Build an export on the worker pool. The file is written under a temporary
+        name and renamed once complete, so a half written file is never served.
+        """
+        job.status = "running"
+        temporary_path = f"{job.path}.{job.id}.tmp"
+        try:
+            with app.app_context():
+                with open(temporary_path, "wb") as file:
+                    build(file)
+            os.replace(temporary_path, job.path)
+            self.remove_stale()
+            logger.info(f"Export job {job.id} finished")
+            job.status = "done"
+        except Exception as e:
+            logger.error(f"Export job {job.id} failed: {e}")
+            # Clean up before reporting the failure, so nothing is left behind
+            # by the time a client sees it
+            try:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+            except OSError as remove_error:
+                logger.warning(f"Couldn't remove {temporary_path}: {remove_error}")
+            job.error = "Failed to export inventory"
+            job.status = "failed"
+        finally:
+            with self._lock:
+                self._in_flight.pop(job.key, None)
+
+    def remove_stale(self):
+        """
+        Delete the files of exports built at older data versions than the newest
+        export started. That includes a job's own file if the data changed while it
+        was being built, which is then reported as out of date when downloaded.
+        """
+        with self._lock:
+            latest_version = self._latest_version
+        for path in glob.glob(os.path.join(self.directory, f"{ARTIFACT_PREFIX}*")):
+            # inventory_<version>_<variant>.<extension>, or .tmp while being written
+            if path.endswith(".tmp"):
+                continue
+            name = os.path.basename(path)[len(ARTIFACT_PREFIX) :]
+            if name.split("_")[0] != latest_version:
+                logger.debug(f"Removing stale export {path}")
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Couldn't remove stale export {path}: {e}")
+
+
+def export_job_runner():
+    """
+    :return: The export jobs of the current app, created on first use.
+    """
+    runner = current_app.extensions.get("export_jobs")
+    if runner is None:
+        config = current_app.config
+        runner = current_app.extensions.setdefault(
+            "export_jobs",
+            ExportJobs(
+                directory=config["EXPORT_DIR"],
+                max_workers=config["EXPORT_MAX_WORKERS"],
+                max_jobs=config["EXPORT_MAX_JOBS"],
+            ),
+        )
+    return runner
+
+
+def artifact_version():
+    """
+    Read before the export queries anything, so a write that happens while it's
+    built makes the file stale rather than being missed.
+    :return: The current data version, as part of a file name that's different after a restart.
+    """
+    counter = data_version_counter()
+    return f"{counter.boot_token}-{counter.value}"
+
+
+def is_newer_version(version, latest):
+    """
+    Two exports started at about the same time can read the data version in
+    either order, so the latest one started isn't always the newest.
+    :param version: A version from artifact_version().
+    :param latest: Another one, or None.
+    :return: Whether version is newer than latest. A different boot token means
+        the app has been restarted, so anything from before is out of date.
+    """
+    if latest is None:
+        return True
+    boot_token, _, value = version.rpartition("-")
+    latest_boot_token, _, latest_value = latest.rpartition("-")
+    if boot_token != latest_boot_token:
+        return True
+    return int(value) > int(latest_value)
+
+
+def export_variant(params):
+    """
+    :param params: The parsed export parameters.
+    :return: A short name for the parameters, the same whatever order they were given in.
+    """
+    normalized = dict(params, manufacturers=sorted(params.get("manufacturers") or []))
+    encoded = json.dumps(normalized, sort_keys=True, default=str)
+    return hashlib.sha1(encoded.encode()).hexdigest()[:16]
+
+
+@export_jobs.route("/api/export_jobs", methods=["POST"])
+@oidc.require_login
+def start_export_job():
+    """
+    Start exporting the inventory in the background.
+    Takes the same query parameters as /api/export_inventory_csv.
+    :return: The job as JSON, with its id and status. 202 if it's still being built,
+        200 if the file is ready to download.
+    """
+    try:
+        params = parse_export_params(request.args)
+    except ValidationError as e:
+        logger.error(f"Validation error: {e.messages}")
+        return (
+            jsonify({"error": "Invalid request parameters", "details": e.messages}),
+            400,
+        )
+
+    def build(file):
+        for chunk in iter_export(params):
+            file.write(chunk)
+
+    job = export_job_runner().start(
+        current_app._get_current_object(),
+        artifact_version(),
+        build,
+        variant=export_variant(params),
+        file_name=export_file_name(params),
+        mimetype=export_mimetype(params),
+    )
+    return jsonify(job.to_dict()), 200 if job.status == "done" else 202
+
+
+@export_jobs.route("/api/export_jobs/<job_id>", methods=["GET"])
+@oidc.require_login
+def get_export_job(job_id):
+    """
+    :return: The job as JSON, with its id, status and error if it failed. 404 if there's no such job.
+    """
+    job = export_job_runner().get(job_id)
+    if job is None:
+        return jsonify({"error": "Export job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@export_jobs.route("/api/export_jobs/<job_id>/download", methods=["GET"])
+@oidc.require_login
+def download_export_job(job_id):
+    """
+    :return: The exported file. 404 if there's no such job, 409 if it isn't
+        done yet, and 410 if the file has been replaced by a newer export.
+    """
+    job = export_job_runner().get(job_id)
+    if job is None:
+        return jsonify({"error": "Export job not found"}), 404
+    if job.status != "done":
+        return jsonify({"error": f"Export job is {job.status}"}), 409
+    try:
+        return send_file(
+            job.path,
+            mimetype=job.mimetype,
+            as_attachment=True,
+            download_name=job.file_name,
+        )
+    except FileNotFoundError:
+        logger.warning(f"The file of export job {job_id} has been removed")
+        return jsonify({"error": "Export is out of date, start a new one"}), 410
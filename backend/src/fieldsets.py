@@ -0,0 +1,240 @@
+"""
+Sparse fieldsets: only send the fields of chemicals and bottles a client asks for.
+
+A fields parameter such as "chemical_name,formula,quantity" or
+"chemical_name,inventory.sticker,inventory.location" picks fields from the
+Chemical.to_dict() shape. Bottle fields are prefixed with "inventory.", and
+"inventory" on its own means every bottle field. The id is always included.
+
+Only the columns the fields need are selected, and only those fields are
+formatted. When no bottle fields are asked for, one row per chemical is read
+instead of one per bottle, with the quantity counted by the database.
+"""
+
+import logging
+from sqlalchemy import case, func
+from database import db
+from inventory_rows import join_inventory
+from models import (
+    Chemical,
+    Chemical_Manufacturer,
+    Inventory,
+    Location,
+    Manufacturer,
+    Storage_Class,
+    Sub_Location,
+)
+
+logger = logging.getLogger(__name__)
+
+# Field name: (columns it's made from, function formatting them or None to use the column as is)
+CHEMICAL_FIELDS = {
+    "id": ((Chemical.Chemical_ID,), None),
+    "chemical_name": ((Chemical.Chemical_Name,), None),
+    "formula": ((Chemical.Chemical_Formula,), None),
+    "storage_class": ((Storage_Class.Storage_Class_Name,), None),
+    "storage_class_id": ((Storage_Class.Storage_Class_ID,), None),
+}
+
+BOTTLE_FIELDS = {
+    "id": ((Inventory.Inventory_ID,), None),
+    "sticker": ((Inventory.Sticker_Number,), None),
+    "product_number": ((Chemical_Manufacturer.Product_Number,), None),
+    "sub_location": ((Sub_Location.Sub_Location_Name,), None),
+    "sub_location_id": ((Sub_Location.Sub_Location_ID,), None),
+    "location": (
+        (Location.Building, Location.Room),
+        lambda building, room: f"{building} {room}",
+    ),
+    "location_id": ((Location.Location_ID,), None),
+    "manufacturer": ((Manufacturer.Manufacturer_Name,), None),
+    "manufacturer_id": ((Manufacturer.Manufacturer_ID,), None),
+    "dead": ((Inventory.Is_Dead,), None),
+    # Boolean, true if it has it, false if not
+    "msds": ((Inventory.MSDS,), lambda msds: msds != None and msds != ""),
+    "last_updated": (
+        (Inventory.Last_Updated,),
+        lambda last_updated: (
+            last_updated.strftime("%Y-%m-%d") if last_updated else None
+        ),
+    ),
+    "who_updated": ((Inventory.Who_Updated,), None),
+}
+
+# Counted rather than selected
+QUANTITY = "quantity"
+INVENTORY = "inventory"
+INVENTORY_PREFIX = "inventory."
+
+
+def field_getters(fields, available, start):
+    """
+    :param fields: The names of the fields to get.
+    :param available: CHEMICAL_FIELDS or BOTTLE_FIELDS.
+    :param start: Where the fields' columns start in a row.
+    :return: The columns to select, and a list of (name, column index, column count,
+        format function) for reading the fields back out of a row.
+    """
+    columns = []
+    getters = []
+    for name in fields:
+        field_columns, format_value = available[name]
+        getters.append((name, start + len(columns), len(field_columns), format_value))
+        columns.extend(field_columns)
+    return columns, getters
+
+
+def read_fields(row, getters):
+    """
+    :return: A dictionary of the fields read from a row.
+    """
+    values = {}
+    for name, index, count, format_value in getters:
+        if format_value is None:
+            values[name] = row[index]
+        else:
+            values[name] = format_value(*row[index : index + count])
+    return values
+
+
+class Fieldset:
+    """
+    The fields of chemicals, and of their bottles, to put in a response.
+    """
+
+    def __init__(self, chemical_fields, bottle_fields=None):
+        """
+        :param chemical_fields: Names from CHEMICAL_FIELDS, and/or "quantity".
+        :param bottle_fields: Names from BOTTLE_FIELDS, or None to leave bottles out.
+        """
+        self.with_quantity = QUANTITY in chemical_fields
+        self.chemical_fields = [
+            name for name in chemical_fields if name not in ("id", QUANTITY)
+        ]
+        self.bottle_fields = bottle_fields
+
+        if bottle_fields is None:
+            # (Chemical_ID, live bottles, chemical fields...)
+            columns, self._chemical_getters = field_getters(
+                self.chemical_fields, CHEMICAL_FIELDS, 2
+            )
+            live_bottles = func.sum(case((Inventory.Is_Dead.is_(True), 0), else_=1))
+            self.columns = [Chemical.Chemical_ID, live_bottles.label("Live"), *columns]
+        else:
+            # (Chemical_ID, Is_Dead, chemical fields..., bottle fields...)
+            chemical_columns, self._chemical_getters = field_getters(
+                self.chemical_fields, CHEMICAL_FIELDS, 2
+            )
+            bottle_columns, self._bottle_getters = field_getters(
+                bottle_fields, BOTTLE_FIELDS, 2 + len(chemical_columns)
+            )
+            self.columns = [
+                Chemical.Chemical_ID,
+                Inventory.Is_Dead,
+                *chemical_columns,
+                *bottle_columns,
+            ]
+
+    @classmethod
+    def parse(cls, value):
+        """
+        :param value: A comma separated list of field names, as passed in the fields parameter.
+        :return: A Fieldset.
+        :raises ValueError: If a field doesn't exist, or there are no fields.
+        """
+        chemical_fields = []
+        bottle_fields = None
+        unknown = []
+        for name in value.split(","):
+            name = name.strip()
+            if not name:
+                continue
+            if name == INVENTORY:
+                bottle_fields = list(BOTTLE_FIELDS)
+            elif name.startswith(INVENTORY_PREFIX):
+                bottle_field = name[len(INVENTORY_PREFIX) :]
+                if bottle_field not in BOTTLE_FIELDS:
+                    unknown.append(name)
+                elif bottle_fields is None:
+                    bottle_fields = [bottle_field]
+                elif bottle_field not in bottle_fields:
+                    bottle_fields.append(bottle_field)
+            elif name in CHEMICAL_FIELDS or name == QUANTITY:
+                if name not in chemical_fields:
+                    chemical_fields.append(name)
+            else:
+                unknown.append(name)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        if not chemical_fields and bottle_fields is None:
+            raise ValueError("No fields given")
+        return cls(chemical_fields, bottle_fields)
+
+    def query(self):
+        """
+        Build a query selecting just the columns the fields need. Like
+        inventory_row_query(), filters on any of the joined models can be added.
+        :return: A query ordered alphabetically by chemical. Its first column is Chemical_ID.
+        """
+        query = join_inventory(db.session.query(*self.columns))
+        if self.bottle_fields is None:
+            return query.group_by(
+                Chemical.Chemical_ID, Chemical.Sort_Key, *self.columns[2:]
+            ).order_by(Chemical.Sort_Key, Chemical.Chemical_ID)
+        return query.order_by(
+            Chemical.Sort_Key,
+            Chemical.Chemical_ID,
+            Inventory.Is_Dead,
+            Inventory.Inventory_ID,
+        )
+
+    def iter_chemicals(self, rows, quantities=None):
+        """
+        Turn the rows of query() into chemicals with just the chosen fields.
+        :param quantities: A dictionary of Chemical_ID to live bottles, for when the
+            rows don't include every live bottle. By default the live rows are counted.
+        :return: A generator of chemical dictionaries.
+        """
+        if self.bottle_fields is None:
+            for row in rows:
+                if quantities is not None:
+                    quantity = quantities.get(row[0], 0)
+                else:
+                    quantity = int(row[1] or 0)
+                yield self._chemical(row, quantity)
+            return
+
+        chemical = None
+        bottles = []
+        quantity = 0
+        for row in rows:
+            if chemical is None or row[0] != chemical[0]:
+                if chemical is not None:
+                    yield self._chemical(chemical, quantity, bottles, quantities)
+                chemical = row
+                bottles = []
+                quantity = 0
+            if not row[1]:
+                quantity += 1
+            bottles.append(read_fields(row, self._bottle_getters))
+        if chemical is not None:
+            yield self._chemical(chemical, quantity, bottles, quantities)
+
+    def group(self, rows):
+        """
+        :return: A list of the chemicals in the rows of query().
+        """
+        chemical_list = list(self.iter_chemicals(rows))
+        logger.debug(f"Read {len(chemical_list)} chemicals with sparse fields.")
+        return chemical_list
+
+    def _chemical(self, row, quantity, bottles=None, quantities=None):
+        chemical = {"id": row[0]}
+        chemical.update(read_fields(row, self._chemical_getters))
+        if self.with_quantity:
+            if quantities is not None:
+                quantity = quantities.get(row[0], 0)
+            chemical[QUANTITY] = quantity
+        if bottles is not None:
+            chemical[INVENTORY] = bottles
+        return chemical
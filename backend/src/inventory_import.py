@@ -0,0 +1,661 @@
+"""
+Bulk inventory imports.
+
+Takes files in the format /api/export_inventory_csv makes, as CSV or NDJSON, so
+a new lab's spreadsheet, or another inventory's export, can be added in one go:
+
+    POST /api/import_inventory              (the file as "file", or as the body)
+    flask --app app import-inventory FILE
+
+The file is read a batch of rows at a time. Locations, sub-locations,
+manufacturers, storage classes, chemicals and sticker numbers are each read from
+the database once, into dictionaries and sets the rows are checked against, and
+each batch is written with one multi-row INSERT per table. Chemicals, and the
+pairs of chemical and manufacturer bottles belong to, are created when they don't
+exist yet. Everything else a row refers to must exist already.
+
+The whole import is one transaction. If any row has an error nothing is
+imported, and the errors are reported by row number.
+"""
+
+import csv
+import io
+import json
+import logging
+import re
+from datetime import date, datetime
+import click
+from flask import Blueprint, current_app, jsonify, request, session
+from sqlalchemy import insert, select
+from autocomplete import forget_names
+from changes import record_changes
+from csv_export import CSV_HEADER, NDJSON_FIELDS
+from data_version import bump_shared_data_version, changes_data
+from database import db
+from models import (
+    MAX_STICKER_NUMBER,
+    Chemical,
+    Chemical_Manufacturer,
+    Chemical_Trigram,
+    Inventory,
+    Location,
+    Manufacturer,
+    Storage_Class,
+    Sub_Location,
+)
+from oidc import oidc
+from permission_requirements import require_editor
+from search_index import chemical_trigrams, normalize_name, sort_key
+
+inventory_import = Blueprint("inventory_import", __name__)
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+# CSV column names to the keys used for each row, the same as in NDJSON exports
+FIELDS_BY_COLUMN = dict(zip(CSV_HEADER, NDJSON_FIELDS))
+# For error messages
+COLUMNS_BY_FIELD = dict(zip(NDJSON_FIELDS, CSV_HEADER))
+REQUIRED_FIELDS = ("sticker_number", "chemical", "location", "sub_location")
+# A whole number written as text, optionally with a ".0" as spreadsheets write them
+WHOLE_NUMBER = re.compile(r"([+-]?[0-9]+)(?:\.0*)?")
+
+
+class ImportFileError(ValueError):
+    """
+    The file as a whole can't be imported, like when it's missing a column.
+    """
+
+
+def lookup_key(name):
+    """
+    Names in the file are matched ignoring case and repeated spaces.
+    """
+    return " ".join(str(name).split()).lower()
+
+
+def read_rows(file, file_format):
+    """
+    Read an import file one row at a time.
+    :param file: A text file.
+    :param file_format: "csv" or "ndjson".
+    :return: A generator of (row number, dictionary of fields, error or None).
+        Row numbers count the rows of data from 1, not including a CSV header.
+    :raises ImportFileError: If a CSV file is missing a required column.
+    """
+    if file_format == "ndjson":
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                values = json.loads(line)
+            except ValueError:
+                yield number, {}, "Not valid JSON"
+                continue
+            if not isinstance(values, dict):
+                yield number, {}, "Not a JSON object"
+                continue
+            yield number, values, None
+        return
+
+    reader = csv.DictReader(file)
+    fields = {
+        FIELDS_BY_COLUMN.get(column, column) for column in reader.fieldnames or ()
+    }
+    missing = [
+        COLUMNS_BY_FIELD[field] for field in REQUIRED_FIELDS if field not in fields
+    ]
+    if missing:
+        raise ImportFileError(f"Missing columns: {', '.join(missing)}")
+    for number, row in enumerate(reader, start=1):
+        yield number, {
+            FIELDS_BY_COLUMN.get(column, column): value for column, value in row.items()
+        }, None
+
+
+class RowError(ValueError):
+    """
+    A value in a row that can't be imported.
+    """
+
+
+class InventoryImporter:
+    """
+    Checks rows against what's in the database and inserts them in batches.
+    Add the rows with add(), then call finish().
+    """
+
+    def __init__(self, who_updated, batch_size, max_errors):
+        """
+        :param who_updated: Who the bottles were last seen by, if a row doesn't say.
+        :param batch_size: How many rows to insert at a time.
+        :param max_errors: How many errors to report. Any more are only counted.
+        """
+        self.who_updated = who_updated
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.connection = db.session.connection()
+
+        # Read what rows can refer to once
+        self.locations = {
+            lookup_key(f"{building} {room}"): location_id
+            for location_id, building, room in self.connection.execute(
+                select(Location.Location_ID, Location.Building, Location.Room)
+            )
+        }
+        self.sub_locations = {
+            (location_id, lookup_key(name)): sub_location_id
+            for sub_location_id, location_id, name in self.connection.execute(
+                select(
+                    Sub_Location.Sub_Location_ID,
+                    Sub_Location.Location_ID,
+                    Sub_Location.Sub_Location_Name,
+                )
+            )
+        }
+        self.manufacturers = {
+            lookup_key(name): manufacturer_id
+            for manufacturer_id, name in self.connection.execute(
+                select(Manufacturer.Manufacturer_ID, Manufacturer.Manufacturer_Name)
+            )
+        }
+        self.storage_classes = {
+            lookup_key(name): storage_class_id
+            for storage_class_id, name in self.connection.execute(
+                select(Storage_Class.Storage_Class_ID, Storage_Class.Storage_Class_Name)
+            )
+        }
+        self.chemicals = {}
+        for chemical_id, name in self.connection.execute(
+            select(Chemical.Chemical_ID, Chemical.Chemical_Name).order_by(
+                Chemical.Chemical_ID
+            )
+        ):
+            # With duplicate names, bottles go to the oldest chemical
+            self.chemicals.setdefault(lookup_key(name), chemical_id)
+        self.chemical_manufacturers = {}
+        self.read_chemical_manufacturers()
+        self.stickers = set(
+            self.connection.execute(select(Inventory.Sticker_Number)).scalars()
+        )
+
+        # Sticker numbers earlier in the file, to the row they were on
+        self.file_stickers = {}
+        # Chemicals earlier in the file that will be created
+        self.new_chemicals = set()
+        self.batch = []
+        self.rows = 0
+        self.imported = 0
+        self.chemicals_created = 0
+        self.errors = []
+        self.error_count = 0
+
+    def read_chemical_manufacturers(self, chemical_ids=None):
+        """
+        Add the existing chemical manufacturers, or just those of some chemicals, to the map.
+        """
+        query = select(
+            Chemical_Manufacturer.Chemical_Manufacturer_ID,
+            Chemical_Manufacturer.Chemical_ID,
+            Chemical_Manufacturer.Manufacturer_ID,
+            Chemical_Manufacturer.Product_Number,
+        ).order_by(Chemical_Manufacturer.Chemical_Manufacturer_ID)
+        if chemical_ids is not None:
+            query = query.where(Chemical_Manufacturer.Chemical_ID.in_(chemical_ids))
+        for (
+            cm_id,
+            chemical_id,
+            manufacturer_id,
+            product_number,
+        ) in self.connection.execute(query):
+            self.chemical_manufacturers.setdefault(
+                (chemical_id, manufacturer_id, product_number or ""), cm_id
+            )
+
+    def add(self, number, values, error=None):
+        """
+        Check a row, and insert the batch once it's full.
+        :param number: The row's number, for the error report.
+        :param values: The row's fields, by the keys in NDJSON_FIELDS.
+        :param error: Why the row couldn't be read, if it couldn't.
+        """
+        self.rows += 1
+        if error is None:
+            try:
+                self.batch.append(self.check(number, values))
+            except RowError as e:
+                error = str(e)
+        if error is not None:
+            self.error_count += 1
+            if len(self.errors) < self.max_errors:
+                self.errors.append({"row": number, "error": error})
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def check(self, number, values):
+        """
+        Resolve a row's names to IDs and convert its values.
+        :return: The row, ready to insert.
+        :raises RowError: If anything in the row is missing or invalid.
+        """
+        sticker = whole_number(values, "sticker_number")
+        if sticker is None:
+            raise RowError("Sticker Number is required")
+        if not 1 <= sticker <= MAX_STICKER_NUMBER:
+            raise RowError(
+                f"Sticker number must be between 1 and {MAX_STICKER_NUMBER}: {sticker}"
+            )
+        if sticker in self.stickers:
+            raise RowError(f"Sticker number {sticker} already exists")
+        if sticker in self.file_stickers:
+            raise RowError(
+                f"Sticker number {sticker} is also on row {self.file_stickers[sticker]}"
+            )
+        self.file_stickers[sticker] = number
+
+        location = text(values, "location")
+        location_id = self.locations.get(lookup_key(location or ""))
+        if location_id is None:
+            raise RowError(f"Unknown location: {location}")
+        sub_location = text(values, "sub_location")
+        sub_location_id = self.sub_locations.get(
+            (location_id, lookup_key(sub_location or ""))
+        )
+        if sub_location_id is None:
+            raise RowError(f"Unknown sub-location {sub_location} in {location}")
+        manufacturer = text(values, "manufacturer")
+        manufacturer_id = self.manufacturers.get(lookup_key(manufacturer or ""))
+        if manufacturer_id is None:
+            raise RowError(f"Unknown manufacturer: {manufacturer}")
+
+        name = text(values, "chemical", Chemical.Chemical_Name)
+        if name is None:
+            raise RowError("Chemical is required")
+        chemical = None
+        if (
+            lookup_key(name) not in self.chemicals
+            and lookup_key(name) not in self.new_chemicals
+        ):
+            storage_class = text(values, "storage_class")
+            storage_class_id = self.storage_classes.get(lookup_key(storage_class or ""))
+            if storage_class_id is None:
+                raise RowError(
+                    f"Unknown storage class for new chemical {name}: {storage_class}"
+                )
+            alphabetical_name = (
+                text(values, "alphabetized_by", Chemical.Alphabetical_Name) or name
+            )
+            chemical = {
+                "Chemical_Name": name,
+                "Alphabetical_Name": alphabetical_name,
+                "Chemical_Formula": formula(values, name),
+                "Storage_Class_ID": storage_class_id,
+                "Minimum_On_Hand": decimal_number(values, "minimum_needed"),
+                "Normalized_Name": normalize_name(name),
+                "Normalized_Alphabetical_Name": normalize_name(alphabetical_name),
+                "Sort_Key": sort_key(name),
+            }
+
+        product_number = text(values, "product_number", Inventory.Product_Number)
+        quantity = decimal_number(values, "quantity")
+        row = {
+            "chemical_key": lookup_key(name),
+            "chemical": chemical,
+            "manufacturer_id": manufacturer_id,
+            "chemical_manufacturer": {
+                "Manufacturer_ID": manufacturer_id,
+                "Product_Number": product_number,
+                "CAS_Number": text(
+                    values, "cas_number", Chemical_Manufacturer.CAS_Number
+                ),
+                "MSDS": text(values, "msds", Chemical_Manufacturer.MSDS),
+                "Barcode": text(values, "barcode", Chemical_Manufacturer.Barcode),
+            },
+            "bottle": {
+                "Sticker_Number": sticker,
+                "Sub_Location_ID": sub_location_id,
+                "Product_Number": product_number,
+                "Quantity": 1 if quantity is None else quantity,
+                "Comment": text(values, "comment", Inventory.Comment),
+                "Last_Updated": day(values, "last_updated") or date.today(),
+                "Who_Updated": (
+                    text(values, "who_updated", Inventory.Who_Updated)
+                    or self.who_updated
+                ),
+                "Is_Dead": boolean(values, "dead"),
+            },
+        }
+        if chemical is not None:
+            self.new_chemicals.add(lookup_key(name))
+        return row
+
+    def flush(self):
+        """
+        Insert the batch: new chemicals, then new chemical manufacturers, then bottles.
+        Once any row has an error, nothing more is inserted.
+        """
+        batch, self.batch = self.batch, []
+        if not batch or self.error_count:
+            return
+
+        new_chemicals = {}
+        for row in batch:
+            if row["chemical_key"] not in self.chemicals:
+                new_chemicals.setdefault(row["chemical_key"], row["chemical"])
+        if new_chemicals:
+            self.insert_chemicals(list(new_chemicals.values()))
+
+        new_chemical_manufacturers = {}
+        for row in batch:
+            chemical_id = self.chemicals[row["chemical_key"]]
+            cm = row["chemical_manufacturer"]
+            key = (chemical_id, cm["Manufacturer_ID"], cm["Product_Number"] or "")
+            if key not in self.chemical_manufacturers:
+                new_chemical_manufacturers.setdefault(
+                    key, dict(cm, Chemical_ID=chemical_id)
+                )
+        if new_chemical_manufacturers:
+            self.connection.execute(
+                insert(Chemical_Manufacturer), list(new_chemical_manufacturers.values())
+            )
+            self.read_chemical_manufacturers(
+                {key[0] for key in new_chemical_manufacturers}
+            )
+
+        bottles = []
+        chemical_ids = set()
+        for row in batch:
+            chemical_id = self.chemicals[row["chemical_key"]]
+            cm = row["chemical_manufacturer"]
+            bottles.append(
+                dict(
+                    row["bottle"],
+                    Chemical_Manufacturer_ID=self.chemical_manufacturers[
+                        (chemical_id, cm["Manufacturer_ID"], cm["Product_Number"] or "")
+                    ],
+                )
+            )
+            chemical_ids.add(chemical_id)
+        self.connection.execute(insert(Inventory), bottles)
+
+        stickers = {bottle["Sticker_Number"] for bottle in bottles}
+        self.stickers |= stickers
+        # Core inserts aren't seen by the change log's session listeners
+        bottle_ids = self.connection.execute(
+            select(Inventory.Inventory_ID).where(Inventory.Sticker_Number.in_(stickers))
+        ).scalars()
+        record_changes(db.session, chemical_ids, set(bottle_ids))
+        self.imported += len(bottles)
+        logger.debug(f"Imported a batch of {len(bottles)} bottles")
+
+    def insert_chemicals(self, chemicals):
+        """
+        Insert new chemicals, add them to the map and to the search index.
+        """
+        self.connection.execute(insert(Chemical), chemicals)
+        names = [chemical["Chemical_Name"] for chemical in chemicals]
+        created = self.connection.execute(
+            select(
+                Chemical.Chemical_ID, Chemical.Chemical_Name, Chemical.Alphabetical_Name
+            )
+            .where(Chemical.Chemical_Name.in_(names))
+            .order_by(Chemical.Chemical_ID)
+        ).all()
+        trigrams = []
+        for chemical_id, name, alphabetical_name in created:
+            key = lookup_key(name)
+            if key in self.chemicals:
+                continue
+            self.chemicals[key] = chemical_id
+            trigrams.extend(
+                {"Chemical_ID": chemical_id, "Trigram": trigram}
+                for trigram in chemical_trigrams(name, alphabetical_name)
+            )
+        if trigrams:
+            self.connection.execute(insert(Chemical_Trigram), trigrams)
+        self.chemicals_created += len(chemicals)
+
+    def finish(self):
+        """
+        Insert the last batch, then commit the import, or roll it back if any row had an error.
+        :return: The import report as a dictionary.
+        """
+        self.flush()
+        if self.error_count:
+            db.session.rollback()
+            logger.warning(
+                f"Import of {self.rows} rows rolled back, {self.error_count} had errors"
+            )
+            imported = chemicals_created = 0
+        else:
+            db.session.commit()
+            forget_names()
+            logger.info(
+                f"Imported {self.imported} bottles and {self.chemicals_created} new chemicals"
+            )
+            imported = self.imported
+            chemicals_created = self.chemicals_created
+        return {
+            "rows": self.rows,
+            "imported": imported,
+            "chemicals_created": chemicals_created,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+def value(values, field):
+    """
+    :return: A field's value with surrounding spaces removed, or None if it's empty.
+    """
+    found = values.get(field)
+    if isinstance(found, str):
+        found = found.strip()
+        if not found:
+            return None
+    return found
+
+
+def text(values, field, column=None):
+    """
+    :param column: The column the text goes in, to check it fits.
+    :return: A field's value as a string, or None if it's empty.
+    """
+    found = value(values, field)
+    if found is None:
+        return None
+    found = str(found)
+    length = getattr(column.type, "length", None) if column is not None else None
+    if length is not None and len(found) > length:
+        raise RowError(
+            f"{COLUMNS_BY_FIELD[field]} is longer than {length} characters: {found}"
+        )
+    return found
+
+
+def whole_number(values, field):
+    """
+    :return: A field's value as an integer, or None if it's empty. Text is read
+        with int(), so large numbers keep every digit; a ".0" suffix is allowed.
+    """
+    found = value(values, field)
+    if found is None:
+        return None
+    if isinstance(found, float) and found.is_integer():
+        return int(found)
+    if isinstance(found, int) and not isinstance(found, bool):
+        return found
+    match = WHOLE_NUMBER.fullmatch(str(found))
+    if match is None:
+        raise RowError(f"{COLUMNS_BY_FIELD[field]} must be a whole number: {found}")
+    return int(match.group(1))
+
+
+def decimal_number(values, field):
+    """
+    :return: A field's value as a float, or None if it's empty.
+    """
+    found = value(values, field)
+    if found is None:
+        return None
+    try:
+        return float(found)
+    except (TypeError, ValueError):
+        raise RowError(f"{COLUMNS_BY_FIELD[field]} must be a number: {found}")
+
+
+def day(values, field):
+    """
+    :return: A field's value as a date, or None if it's empty.
+    """
+    found = value(values, field)
+    if found is None:
+        return None
+    try:
+        return datetime.strptime(str(found)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        raise RowError(
+            f"{COLUMNS_BY_FIELD[field]} must be a date like 2025-03-06: {found}"
+        )
+
+
+def boolean(values, field):
+    """
+    :return: A field's value as a boolean, False if it's empty.
+    """
+    found = value(values, field)
+    if found is None or isinstance(found, bool):
+        return bool(found)
+    if str(found).lower() in ("true", "1", "yes"):
+        return True
+    if str(found).lower() in ("false", "0", "no"):
+        return False
+    raise RowError(f"{COLUMNS_BY_FIELD[field]} must be true or false: {found}")
+
+
+def formula(values, name):
+    """
+    :return: The formula from a "Formula (Name)" column, as exports write it.
+    """
+    combined = text(values, "formula_and_name")
+    if combined is None or combined == name:
+        return None
+    suffix = f" ({name})"
+    if combined.endswith(suffix):
+        combined = combined[: -len(suffix)]
+    if len(combined) > Chemical.Chemical_Formula.type.length:
+        raise RowError(f"Chemical Formula is too long: {combined}")
+    return combined
+
+
+def import_inventory(file, file_format, who_updated):
+    """
+    Import bottles from a file, all or nothing.
+    :param file: A text file, read a row at a time.
+    :param file_format: "csv" or "ndjson".
+    :param who_updated: Who the bottles were last seen by, if a row doesn't say.
+    :return: The import report, see InventoryImporter.finish().
+    :raises ImportFileError: If the file as a whole can't be read.
+    """
+    config = current_app.config
+    importer = InventoryImporter(
+        who_updated, config["IMPORT_BATCH_SIZE"], config["IMPORT_MAX_ERRORS"]
+    )
+    try:
+        for number, values, error in read_rows(file, file_format):
+            importer.add(number, values, error)
+    except (ImportFileError, UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        raise ImportFileError(str(e)) from e
+    except Exception:
+        db.session.rollback()
+        raise
+    return importer.finish()
+
+
+def file_format_for(file_name, default="csv"):
+    """
+    :return: The format an import file is in, going by its name.
+    """
+    if file_name and file_name.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return default
+
+
+@inventory_import.route("/api/import_inventory", methods=["POST"])
+@oidc.require_login
+@require_editor
+@changes_data
+def import_inventory_file():
+    """
+    Import bottles from a file with the columns /api/export_inventory_csv makes.
+    Send the file as the "file" field of a form, or as the request body.
+
+    Only Sticker Number, Chemical, Location and Sub-Location are required, plus
+    Manufacturer, and Storage Class for chemicals that don't exist yet.
+
+    Query Parameters:
+        format (str, optional): "csv" or "ndjson". By default, going by the file's name, or CSV.
+
+    :return: JSON with the number of rows, bottles imported, chemicals created,
+        and errors as a list of {"row", "error"}. 400 if any row has an error,
+        in which case nothing is imported.
+    """
+    current_username = session["oidc_auth_profile"].get("preferred_username")
+    upload = request.files.get("file")
+    file_format = request.args.get(
+        "format", file_format_for(upload.filename if upload else None)
+    )
+    if file_format not in IMPORT_FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    logger.info(f"User {current_username} is importing a {file_format} file")
+
+    stream = upload.stream if upload else request.stream
+    file = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        report = import_inventory(file, file_format, current_username)
+    except ImportFileError as e:
+        logger.warning(f"Import file from {current_username} can't be read: {e}")
+        return jsonify({"error": f"Import file can't be read: {e}"}), 400
+    finally:
+        file.detach()
+
+    if report["error_count"]:
+        return (
+            jsonify(dict(report, error="Nothing was imported, some rows have errors")),
+            400,
+        )
+    return jsonify(dict(report, message="Import successful"))
+
+
+@click.command("import-inventory")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(IMPORT_FORMATS),
+    help="The file's format. By default, going by its name, or CSV.",
+)
+@click.option("--who", default="import", help="Who updated bottles that don't say.")
+def import_inventory_command(path, file_format, who):
+    """
+    Import bottles from a CSV or NDJSON file in the export's format.
+    """
+    file_format = file_format or file_format_for(path)
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        try:
+            report = import_inventory(file, file_format, who)
+        except ImportFileError as e:
+            raise click.ClickException(f"Import file can't be read: {e}")
+    for error in report["errors"]:
+        click.echo(f"Row {error['row']}: {error['error']}", err=True)
+    if report["error_count"]:
+        raise click.ClickException(
+            f"Nothing was imported, {report['error_count']} of {report['rows']} rows have errors."
+        )
+    # This runs in its own process, so the server has to be told from the database
+    bump_shared_data_version()
+    click.echo(
+        f"Imported {report['imported']} bottles and "
+        f"{report['chemicals_created']} new chemicals."
+    )
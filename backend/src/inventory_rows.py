@@ -0,0 +1,213 @@
+"""
+Flat, column-only reads of the inventory.
+
+Chemical.to_dict() needs every chemical loaded as an ORM object together with all
+of its manufacturers, bottles, sub-locations and locations. Endpoints that list
+bottles can instead select just the columns they need, one row per bottle, and
+let the database apply the filters. group_inventory_rows() turns those rows back
+into the same dictionaries Chemical.to_dict() produces.
+"""
+
+import logging
+from sqlalchemy import func, or_
+from database import db
+from models import (
+    Chemical,
+    Chemical_Manufacturer,
+    Inventory,
+    Location,
+    Manufacturer,
+    Storage_Class,
+    Sub_Location,
+)
+
+logger = logging.getLogger(__name__)
+
+# One row per bottle. The order must match the unpacking in group_inventory_rows
+INVENTORY_ROW_COLUMNS = (
+    Chemical.Chemical_ID,
+    Chemical.Chemical_Name,
+    Chemical.Chemical_Formula,
+    Storage_Class.Storage_Class_Name,
+    Storage_Class.Storage_Class_ID,
+    Inventory.Inventory_ID,
+    Inventory.Sticker_Number,
+    Chemical_Manufacturer.Product_Number,
+    Sub_Location.Sub_Location_Name,
+    Sub_Location.Sub_Location_ID,
+    Location.Building,
+    Location.Room,
+    Location.Location_ID,
+    Manufacturer.Manufacturer_Name,
+    Manufacturer.Manufacturer_ID,
+    Inventory.Is_Dead,
+    Inventory.MSDS,
+    Inventory.Last_Updated,
+    Inventory.Who_Updated,
+)
+
+
+def join_inventory(query):
+    """
+    Join a query from Inventory through to every model in INVENTORY_ROW_COLUMNS.
+    Chemicals without bottles drop out.
+    """
+    return (
+        query.select_from(Inventory)
+        .join(Inventory.Chemical_Manufacturer)
+        .join(Chemical_Manufacturer.Chemical)
+        .join(Chemical_Manufacturer.Manufacturer)
+        .join(Inventory.Sub_Location)
+        .join(Sub_Location.Location)
+        .outerjoin(Chemical.Storage_Class)
+    )
+
+
+def live_bottle_counts():
+    """
+    Count each chemical's live bottles. Bottles are found by Chemical_Manufacturer_ID
+    and Is_Dead, which the ix_Inventory_Chemical_Manufacturer_ID_Is_Dead index covers.
+    :return: A subquery of (Chemical_ID, Live) for the chemicals with any live bottles.
+    """
+    return (
+        db.session.query(
+            Chemical_Manufacturer.Chemical_ID.label("Chemical_ID"),
+            func.count(Inventory.Inventory_ID).label("Live"),
+        )
+        .join(
+            Inventory,
+            Inventory.Chemical_Manufacturer_ID
+            == Chemical_Manufacturer.Chemical_Manufacturer_ID,
+        )
+        .filter(is_dead(False))
+        .group_by(Chemical_Manufacturer.Chemical_ID)
+        .subquery()
+    )
+
+
+def is_dead(dead):
+    """
+    :return: A condition for bottles that are dead, or for ones that aren't.
+    """
+    if dead:
+        return Inventory.Is_Dead.is_(True)
+    # Bottles nobody marked either way count as live, as in Chemical.to_dict()
+    return or_(Inventory.Is_Dead.is_(False), Inventory.Is_Dead.is_(None))
+
+
+def in_stock(query, dead=None):
+    """
+    Narrow a query joined with join_inventory() to chemicals with at least one live bottle.
+    :param dead: If not None, also only include bottles that are (or aren't) dead.
+    """
+    live = live_bottle_counts()
+    query = query.join(live, live.c.Chemical_ID == Chemical.Chemical_ID)
+    if dead is not None:
+        query = query.filter(is_dead(dead))
+    return query
+
+
+def live_bottle_quantities():
+    """
+    :return: A dictionary of Chemical_ID to number of live bottles, for chemicals with any.
+    """
+    live = live_bottle_counts()
+    return dict(db.session.query(live.c.Chemical_ID, live.c.Live).all())
+
+
+def inventory_row_query():
+    """
+    Build a query selecting INVENTORY_ROW_COLUMNS for every bottle.
+    Add filters on any of the joined models to narrow it down.
+    :return: A query ordered alphabetically by chemical, so each chemical's bottles
+        are together, with live ones first.
+    """
+    return join_inventory(db.session.query(*INVENTORY_ROW_COLUMNS)).order_by(
+        Chemical.Sort_Key,
+        Chemical.Chemical_ID,
+        Inventory.Is_Dead,
+        Inventory.Inventory_ID,
+    )
+
+
+def group_inventory_rows(rows):
+    """
+    Group bottle rows by chemical.
+    :param rows: Rows of INVENTORY_ROW_COLUMNS, with each chemical's bottles together.
+    :return: A list of chemical dictionaries in the same shape as Chemical.to_dict().
+    """
+    chemical_list = list(iter_inventory_chemicals(rows))
+    logger.debug(f"Grouped bottle rows into {len(chemical_list)} chemicals.")
+    return chemical_list
+
+
+def iter_inventory_chemicals(rows, quantities=None):
+    """
+    Group bottle rows by chemical, one chemical at a time.
+    :param rows: Rows of INVENTORY_ROW_COLUMNS, with each chemical's bottles together.
+    :param quantities: A dictionary of Chemical_ID to live bottles, for when the
+        rows don't include every live bottle. By default the live rows are counted.
+    :return: A generator of chemical dictionaries in the same shape as Chemical.to_dict(),
+        each yielded once its last bottle has been read.
+    """
+    chemical = None
+    for (
+        chemical_id,
+        chemical_name,
+        formula,
+        storage_class,
+        storage_class_id,
+        inventory_id,
+        sticker,
+        product_number,
+        sub_location,
+        sub_location_id,
+        building,
+        room,
+        location_id,
+        manufacturer,
+        manufacturer_id,
+        dead,
+        msds,
+        last_updated,
+        who_updated,
+    ) in rows:
+        if chemical is None or chemical["id"] != chemical_id:
+            if chemical is not None:
+                yield chemical
+            chemical = {
+                "id": chemical_id,
+                "chemical_name": chemical_name,
+                "formula": formula,
+                "storage_class": storage_class,
+                "storage_class_id": storage_class_id,
+                "inventory": [],
+                "quantity": (
+                    quantities.get(chemical_id, 0) if quantities is not None else 0
+                ),
+            }
+        chemical["inventory"].append(
+            {
+                "id": inventory_id,
+                "sticker": sticker,
+                "product_number": product_number,
+                "sub_location": sub_location,
+                "sub_location_id": sub_location_id,
+                "location": f"{building} {room}",
+                "location_id": location_id,
+                "manufacturer": manufacturer,
+                "manufacturer_id": manufacturer_id,
+                "dead": dead,
+                # Boolean, true if it has it, false if not
+                "msds": msds != None and msds != "",
+                "last_updated": (
+                    last_updated.strftime("%Y-%m-%d") if last_updated else None
+                ),
+                "who_updated": who_updated,
+            }
+        )
+        if not dead and quantities is None:
+            chemical["quantity"] += 1
+
+    if chemical is not None:
+        yield chemical
@@ -0,0 +1,87 @@
+"""
+Eager loading options for trees of relationships.
+
+Joined eager loading of a collection repeats every column of the parent once per
+child, and chaining collections (chemical -> manufacturers -> bottles) turns one
+chemical into as many rows as it has bottles, each carrying the chemical's
+columns again, which SQLAlchemy then has to de-duplicate. Instead:
+
+- Many-to-one relationships (a bottle's sub-location, a chemical's storage class)
+  are joined into the query that loads their parent. That adds columns, not rows.
+- Collections are loaded with one more query per level, so every row is only
+  transferred once. selectin loading is the cheapest when there are few parents,
+  but it sends the parent keys in batches of 500, so when a whole table is loaded
+  subquery loading is used instead, keeping the number of queries fixed.
+"""
+
+from sqlalchemy.orm import joinedload, selectinload, subqueryload
+from models import Chemical, Inventory
+
+# Everything Chemical.to_dict() reads
+CHEMICAL_TREE = {
+    "Storage_Class": {},
+    "Chemical_Manufacturers": {
+        "Manufacturer": {},
+        "Inventory": {"Sub_Location": {"Location": {}}},
+    },
+}
+
+# Everything needed to describe a bottle
+INVENTORY_TREE = {
+    "Chemical_Manufacturer": {"Chemical": {}, "Manufacturer": {}},
+    "Sub_Location": {"Location": {}},
+}
+
+
+def load_tree(model, tree, many=False, parent=None):
+    """
+    Build loader options for a tree of relationships, picking the strategy for each one.
+
+    :param model: The model the tree starts from.
+    :param tree: A dictionary of relationship names to the tree below each of them.
+    :param many: Whether a large number of rows (I.E. the whole table) is being loaded.
+    :param parent: The loader option of the relationship above, used while recursing.
+    :return: A list of loader options for Query.options().
+    """
+    options = []
+    for name, children in tree.items():
+        attribute = getattr(model, name)
+        relationship = attribute.property
+        if not relationship.uselist:
+            strategy = "joinedload"
+        elif many:
+            strategy = "subqueryload"
+        else:
+            strategy = "selectinload"
+
+        if parent is None:
+            loader = {
+                "joinedload": joinedload,
+                "selectinload": selectinload,
+                "subqueryload": subqueryload,
+            }[strategy](attribute)
+        else:
+            loader = getattr(parent, strategy)(attribute)
+
+        if children:
+            options.extend(
+                load_tree(relationship.mapper.class_, children, many, loader)
+            )
+        else:
+            options.append(loader)
+    return options
+
+
+def chemical_loading(many=False):
+    """
+    :return: Loader options for querying chemicals to call to_dict() on.
+    """
+    return load_tree(Chemical, CHEMICAL_TREE, many)
+
+
+def inventory_loading(many=False):
+    """
+    :return: Loader options for querying bottles along with their chemical,
+        manufacturer and location.
+    """
+    return load_tree(Inventory, INVENTORY_TREE, many)
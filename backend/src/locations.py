@@ -1,7 +1,9 @@
 import logging
 from flask import Blueprint, request, jsonify
+from data_version import changes_data, conditional_get
 from permission_requirements import require_editor
 from database import db
+from loading import chemical_loading
 from oidc import oidc
 from models import Inventory, Location, Chemical, Sub_Location
 from schemas import CreateLocationSchema, UpdateLocationSchema, CreateSubLocationSchema, UpdateSubLocationSchema
@@ -13,6 +15,7 @@ locations = Blueprint("locations", __name__)
 
 @locations.route("/api/locations", methods=["GET"])
 @oidc.require_login
+@conditional_get
 def get_locations():
     logger.info("GET /api/locations called")
     """
@@ -68,7 +71,10 @@ def get_chemical_location_data():
         with db.session() as session:
             logger.info(f"Chemical ID: {chemical_id}")
             chemical = (
-                session.query(Chemical).filter(Chemical.Chemical_ID == chemical_id).first()
+                session.query(Chemical)
+                .filter(Chemical.Chemical_ID == chemical_id)
+                .options(*chemical_loading())
+                .first()
             )
             # Look at all the manufacturers and their inventory records for a chemical
             for manufacturer in chemical.Chemical_Manufacturers:
@@ -95,6 +101,7 @@ def get_chemical_location_data():
 @locations.route("/api/locations/<location_id>", methods=["DELETE"])
 @oidc.require_login
 @require_editor
+@changes_data
 def delete_location(location_id):
     logger.info(f"DELETE /api/locations/{location_id} called")
     """
@@ -139,6 +146,7 @@ def delete_location(location_id):
 @locations.route("/api/locations", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def create_location():
     logger.info("POST /api/locations called")
     """
@@ -175,6 +183,7 @@ def create_location():
 @locations.route("/api/locations/<location_id>", methods=["PUT"])
 @oidc.require_login
 @require_editor
+@changes_data
 def update_location(location_id):
     logger.info(f"PUT /api/locations/{location_id} called")
     """
@@ -250,6 +259,7 @@ def get_sublocations():
 @locations.route("/api/sublocations", methods=["DELETE"])
 @oidc.require_login
 @require_editor
+@changes_data
 def delete_sublocations():
     logger.info("DELETE /api/sublocations called")
     """
@@ -299,6 +309,7 @@ def delete_sublocations():
 @locations.route("/api/sublocations", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def create_sublocation():
     logger.info("POST /api/sublocations called")
     """
@@ -339,6 +350,7 @@ def create_sublocation():
 @locations.route("/api/sublocations/<int:sublocation_id>", methods=["PUT"])
 @oidc.require_login
 @require_editor
+@changes_data
 def update_sublocation(sublocation_id):
     logger.info(f"PUT /api/sublocations/{sublocation_id} called")
     """
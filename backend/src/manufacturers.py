@@ -3,6 +3,7 @@ from flask import Blueprint, request, jsonify
 from database import db
 from models import Manufacturer, Chemical_Manufacturer, Inventory
 from oidc import oidc
+from data_version import changes_data, conditional_get
 from permission_requirements import require_editor
 
 # Configure logging
@@ -13,6 +14,7 @@ manufacturers = Blueprint("manufacturers", __name__)
 
 @manufacturers.route("/api/manufacturers", methods=["GET"])
 @oidc.require_login
+@conditional_get
 def get_manufacturers():
     """
     Handles the GET request to retrieve a list of manufacturers.
@@ -70,6 +72,7 @@ def get_manufacturers():
 @manufacturers.route("/api/add_manufacturer", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def create_manufacturer():
     """
     Creates a new manufacturer and adds it to the database.
@@ -112,6 +115,7 @@ def create_manufacturer():
 @manufacturers.route("/api/delete_manufacturers", methods=["DELETE"])
 @oidc.require_login
 @require_editor
+@changes_data
 def delete_manufacturers():
     """
     Deletes multiple manufacturers from the database.
@@ -155,6 +159,7 @@ def delete_manufacturers():
 @manufacturers.route("/api/manufacturers/<int:manufacturer_id>", methods=["PUT"])
 @oidc.require_login
 @require_editor
+@changes_data
 def update_manufacturer(manufacturer_id):
     """
     Updates an existing manufacturer in the database.
@@ -0,0 +1,81 @@
+"""
+Schema migrations for existing databases.
+
+The production database is imported from the previous system, so new tables
+aren't created automatically. After upgrading, run:
+
+    flask --app app migrate
+
+Every step is safe to run more than once.
+"""
+
+import logging
+import click
+from sqlalchemy import inspect, text
+from data_version import bump_shared_data_version
+from database import db
+from search_index import backfill_normalized_names, rebuild_trigram_index
+
+logger = logging.getLogger(__name__)
+
+
+@click.command("migrate")
+def migrate():
+    """
+    Create any missing tables and rebuild derived data.
+    """
+    logger.info("Running database migrations")
+    # Only creates tables that don't exist yet
+    db.create_all()
+    for column in add_missing_columns():
+        click.echo(f"Added column {column}")
+    backfill_normalized_names()
+    count = rebuild_trigram_index()
+    db.session.commit()
+    bump_shared_data_version()
+    click.echo(f"Migration complete, indexed {count} chemicals for search.")
+
+
+def add_missing_columns():
+    """
+    Add columns (and their indexes) that the models have but existing tables don't.
+    db.create_all() only creates whole tables. New columns must be nullable.
+    :return: The names of the columns added, as "Table.Column".
+    """
+    inspector = inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_columns = {
+            column["name"] for column in inspector.get_columns(table.name)
+        }
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            logger.info(f"Adding column {table.name}.{column.name}")
+            db.session.execute(
+                text(
+                    f"ALTER TABLE {quote(table.name)} "
+                    f"ADD COLUMN {quote(column.name)} {column_type}"
+                )
+            )
+            added.append(f"{table.name}.{column.name}")
+
+        existing_indexes = {
+            index["name"] for index in inspector.get_indexes(table.name)
+        }
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                logger.info(f"Creating index {index.name}")
+                index.create(db.session.connection())
+    return added
+
+
+def register_commands(app):
+    """
+    Register the migration commands with the Flask CLI.
+    """
+    app.cli.add_command(migrate)
@@ -1,11 +1,25 @@
 import logging
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Boolean
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Float,
+    Date,
+    DateTime,
+    ForeignKey,
+    Boolean,
+    Index,
+    Text,
+)
 from database import db
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# The largest value the Sticker_Number column (a signed 32 bit INTEGER) can hold
+MAX_STICKER_NUMBER = 2**31 - 1
+
 
 class Chemical(db.Model):
     """
@@ -24,6 +38,14 @@ class Chemical(db.Model):
         Integer, ForeignKey("Storage_Class.Storage_Class_ID"), nullable=False
     )
 
+    # Derived from the names for searching and sorting, see search_index.normalize_chemical
+    # Chemical_Name in lowercase without spaces: "sulfuricacid"
+    Normalized_Name = Column(String(90), nullable=True, index=True)
+    # Alphabetical_Name in lowercase without spaces
+    Normalized_Alphabetical_Name = Column(String(65), nullable=True, index=True)
+    # Only the letters of Chemical_Name, in lowercase: "copperiisulfate"
+    Sort_Key = Column(String(90), nullable=True, index=True)
+
     # Unused?
     Alphabetical_Name = Column(String(65), nullable=False)
     Order_More = Column(Boolean, nullable=True)
@@ -133,6 +155,25 @@ class Chemical(db.Model):
         }
 
 
+class Chemical_Trigram(db.Model):
+    """
+    Search index: one row per 3-character piece of a chemical's normalized names.
+    See search_index.py
+    """
+
+    __tablename__ = "Chemical_Trigram"
+    Chemical_Trigram_ID = Column(Integer, primary_key=True, autoincrement=True)
+    Chemical_ID = Column(
+        Integer, ForeignKey("Chemical.Chemical_ID"), nullable=False, index=True
+    )
+    # Lowercase, no spaces. I.E. "ace", "cet", "eto", "ton", "one" for Acetone
+    Trigram = Column(String(3), nullable=False)
+
+    __table_args__ = (
+        Index("ix_Chemical_Trigram_Trigram_Chemical_ID", "Trigram", "Chemical_ID"),
+    )
+
+
 class Chemical_Manufacturer(db.Model):
     """
     Joiner table for a chemical and a manufacturer
@@ -206,6 +247,15 @@ class Inventory(db.Model):
     Sub_Location = relationship("Sub_Location", back_populates="Inventory")
     Unit = relationship("Unit", back_populates="Inventory")
 
+    __table_args__ = (
+        # Counting a chemical's live bottles, see inventory_rows.live_bottle_counts
+        Index(
+            "ix_Inventory_Chemical_Manufacturer_ID_Is_Dead",
+            "Chemical_Manufacturer_ID",
+            "Is_Dead",
+        ),
+    )
+
 
 class Manufacturer(db.Model):
     """
@@ -320,3 +370,61 @@ class User(db.Model):
 
     # Relationship to Permissions
     permissions = relationship("Permissions", back_populates="users")
+
+
+class Synonym_Cache(db.Model):
+    """
+    Synonyms looked up from PubChem, so repeated synonym searches don't go to the internet.
+    See synonyms.py
+    """
+
+    __tablename__ = "Synonym_Cache"
+    Synonym_Cache_ID = Column(Integer, primary_key=True, autoincrement=True)
+    # The search query, normalized. I.E. "acetone"
+    Query = Column(String(255), nullable=False, unique=True)
+    # JSON list of synonyms. Empty if PubChem didn't know the name
+    Synonyms = Column(Text, nullable=False)
+    # False if PubChem had no synonyms (a negative cache entry)
+    Found = Column(Boolean, nullable=False)
+    # When PubChem was asked
+    Fetched_At = Column(DateTime, nullable=False)
+
+
+class Inventory_Change(db.Model):
+    """
+    Change log: one row each time a chemical or bottle is added, changed or deleted,
+    written in the same transaction as the change. See changes.py
+    """
+
+    __tablename__ = "Inventory_Change"
+    Change_ID = Column(Integer, primary_key=True, autoincrement=True)
+    # Allocated when the change is committed, see Inventory_Change_Version.
+    # Clients ask for the changes after the last version they saw
+    Version = Column(Integer, nullable=False, index=True)
+    # "Chemical" or "Inventory"
+    Table_Name = Column(String(20), nullable=False)
+    # The Chemical_ID or Inventory_ID
+    Row_ID = Column(Integer, nullable=False)
+
+
+class Inventory_Change_Version(db.Model):
+    """
+    A single row holding the latest change version. It's locked while a commit
+    takes the next version, so versions become visible in the order they're taken
+    """
+
+    __tablename__ = "Inventory_Change_Version"
+    Version_ID = Column(Integer, primary_key=True, autoincrement=False)
+    Version = Column(Integer, nullable=False)
+
+
+class Data_Version(db.Model):
+    """
+    A single row counting the changes made outside the running server, such as
+    by flask import-inventory. The server checks it every DATA_VERSION_CHECK_INTERVAL
+    seconds, see data_version.py
+    """
+
+    __tablename__ = "Data_Version"
+    Data_Version_ID = Column(Integer, primary_key=True, autoincrement=False)
+    Version = Column(Integer, nullable=False)
@@ -1,10 +1,12 @@
 import logging
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from sqlalchemy import or_
 from oidc import oidc
+from data_version import changes_data
 from permission_requirements import require_editor
 from models import Inventory, Chemical, Manufacturer, Chemical_Manufacturer
 from database import db
+from streaming import stream_json_array
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -47,6 +49,7 @@ def msds_url():
 @msds.route("/api/set_msds_url", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def set_msds_url():
     """
     :return: JSON indicating success.
@@ -70,6 +73,7 @@ def set_msds_url():
 @msds.route("/api/add_msds", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def add_msds():
     """
     Adds an MSDS URL for a specific inventory record.
@@ -112,6 +116,7 @@ def add_msds():
 @msds.route("/api/clear_msds", methods=["POST"])
 @oidc.require_login
 @require_editor
+@changes_data
 def clear_msds():
     """
     Clear the MSDS URL from a specific inventory record.
@@ -184,18 +189,16 @@ def get_missing_msds():
             Chemical_Manufacturer.Manufacturer_ID == Manufacturer.Manufacturer_ID,
         )
         .filter(or_(Inventory.MSDS == None, Inventory.MSDS == ""))
-        .all()
+        .yield_per(current_app.config["STREAM_BATCH_SIZE"])
     )
-    logger.info(f"Found {len(chemicals_without_msds)} items missing MSDS URLs.")
-    return jsonify(
-        [
-            {
-                "sticker_number": chemical.Sticker_Number,
-                "chemical_name": chemical.Chemical_Name,
-                "manufacturer_name": chemical.Manufacturer_Name,
-                "product_number": chemical.Product_Number,
-                "inventory_id": chemical.Inventory_ID,
-            }
-            for chemical in chemicals_without_msds
-        ]
+    logger.info("Streaming items missing MSDS URLs.")
+    return stream_json_array(
+        {
+            "sticker_number": chemical.Sticker_Number,
+            "chemical_name": chemical.Chemical_Name,
+            "manufacturer_name": chemical.Manufacturer_Name,
+            "product_number": chemical.Product_Number,
+            "inventory_id": chemical.Inventory_ID,
+        }
+        for chemical in chemicals_without_msds
     )
@@ -0,0 +1,215 @@
+"""
+Client for the PubChem REST API.
+
+PubChem is an external service, so a slow or failing PubChem must never hold up
+a waitress thread. Requests go through a pooled session with strict connect and
+read timeouts, run on a small worker pool with a cap on pending lookups, and a
+circuit breaker stops calling PubChem for a while after repeated failures.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class PubChemUnavailable(Exception):
+    """
+    Raised when PubChem can't be asked right now: it is failing, too slow, or too busy.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing service.
+
+    After failure_threshold failures in a row the breaker opens and every call is
+    refused for reset_timeout seconds. After that a single trial call is let
+    through: if it succeeds the breaker closes, otherwise it opens again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """
+        :return: Whether a call may be made now.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (
+                self.state == self.OPEN
+                and time.monotonic() - self._opened_at >= self.reset_timeout
+            ):
+                # Let one trial call through
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def is_open(self):
+        """
+        :return: Whether calls are being refused, without using up a trial call.
+        """
+        with self._lock:
+            return (
+                self.state == self.OPEN
+                and time.monotonic() - self._opened_at < self.reset_timeout
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if (
+                self.state == self.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                if self.state != self.OPEN:
+                    logger.warning("PubChem circuit breaker opened")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class PubChemClient:
+    """
+    A bounded, pooled PubChem client. Use pubchem_client() to get the one for the current app.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        connect_timeout,
+        read_timeout,
+        max_workers,
+        max_pending,
+        failure_threshold,
+        reset_timeout,
+    ):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="pubchem"
+        )
+        self._pending_slots = threading.BoundedSemaphore(max_pending)
+        # Lookups in progress, so the same name is only requested once at a time
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get_json(self, path):
+        """
+        Make a GET request to PubChem, blocking for at most the configured timeouts.
+
+        :param path: The path below the REST API base url.
+        :return: The decoded JSON response. PubChem answers unknown names with
+            a 404 and a "Fault" body, which is returned like any other response.
+        :raises PubChemUnavailable: If the circuit breaker is open or the request fails.
+        """
+        if not self.breaker.allow_request():
+            raise PubChemUnavailable("PubChem circuit breaker is open")
+        try:
+            response = self.session.get(f"{self.base_url}/{path}", timeout=self.timeout)
+            if response.status_code >= 500:
+                raise PubChemUnavailable(f"PubChem returned {response.status_code}")
+            data = response.json()
+        except (requests.RequestException, ValueError, PubChemUnavailable) as e:
+            self.breaker.record_failure()
+            logger.warning(f"PubChem request for {path} failed: {e}")
+            raise PubChemUnavailable(str(e)) from e
+        self.breaker.record_success()
+        return data
+
+    def fetch_synonyms(self, name):
+        """
+        Fetch synonyms for a chemical name.
+        :return: A (found, synonyms) tuple. found is False if PubChem has no synonyms for the name.
+        :raises PubChemUnavailable: If PubChem couldn't be asked.
+        """
+        logger.info(f"Looking up synonyms for {name} on PubChem")
+        response = self.get_json(f"substance/name/{quote(name, safe='')}/synonyms/json")
+        if "InformationList" not in response:
+            logger.info(f"PubChem has no synonyms for {name}")
+            return False, []
+
+        synonyms = []
+        for substance in response["InformationList"]["Information"]:
+            synonyms.extend(substance.get("Synonym", []))
+        logger.info(f"Found {len(synonyms)} synonyms for {name}")
+        return True, synonyms
+
+    def submit(self, key, func, *args):
+        """
+        Run a lookup on the worker pool.
+
+        :param key: Identifies the lookup. If the same lookup is already running,
+            its future is returned instead of starting another one.
+        :return: A Future for the result of func(*args).
+        :raises PubChemUnavailable: If the circuit breaker is open or too many lookups are pending.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+            if self.breaker.is_open():
+                raise PubChemUnavailable("PubChem circuit breaker is open")
+            if not self._pending_slots.acquire(blocking=False):
+                raise PubChemUnavailable("Too many PubChem lookups pending")
+            future = self._executor.submit(func, *args)
+            self._in_flight[key] = future
+
+        def finished(done):
+            with self._lock:
+                self._in_flight.pop(key, None)
+            self._pending_slots.release()
+
+        future.add_done_callback(finished)
+        return future
+
+
+def pubchem_client():
+    """
+    :return: The PubChem client for the current app, created on first use.
+    """
+    client = current_app.extensions.get("pubchem")
+    if client is None:
+        config = current_app.config
+        client = current_app.extensions.setdefault(
+            "pubchem",
+            PubChemClient(
+                base_url=config["PUBCHEM_URL"],
+                connect_timeout=config["PUBCHEM_CONNECT_TIMEOUT"],
+                read_timeout=config["PUBCHEM_READ_TIMEOUT"],
+                max_workers=config["PUBCHEM_MAX_WORKERS"],
+                max_pending=config["PUBCHEM_MAX_PENDING"],
+                failure_threshold=config["PUBCHEM_FAILURE_THRESHOLD"],
+                reset_timeout=config["PUBCHEM_RESET_TIMEOUT"],
+            ),
+        )
+    return client
@@ -11,9 +11,12 @@ Schemas:
     - CreateSubLocationSchema: Validates input for creating a new sublocation.
     - UpdateSubLocationSchema: Validates input for updating a sublocation.
     - SearchParamsSchema: Validates input for search parameters.
+    - ExportParamsSchema: Validates input for inventory export parameters.
 """
 
-from marshmallow import Schema, fields, ValidationError
+from marshmallow import Schema, fields, validate, ValidationError
+from compact import FORMATS
+from fieldsets import Fieldset
 from models import (
     Chemical,
     Chemical_Manufacturer,
@@ -42,6 +45,16 @@ def validate_id_exists(model, field_name):
     return validator
 
 
+def validate_fieldset(value):
+    """
+    Custom validator to check a fields parameter only names fields that exist.
+    """
+    try:
+        Fieldset.parse(value)
+    except ValueError as e:
+        raise ValidationError(str(e))
+
+
 class AddBottleSchema(Schema):
     """
     Schema for validating input when adding a new chemical bottle.
@@ -184,6 +197,11 @@ class SearchParamsSchema(Schema):
         - sub_location (int): The sub-location ID (optional).
         - manufacturers (list): List of manufacturer IDs (optional).
         - synonyms (bool): Whether to enable synonym search (optional).
+        - limit (int): The most chemicals to return in one page (optional).
+        - cursor (str): Where the previous page ended (optional).
+        - format (str): "full" or "compact" (optional).
+        - fields (str): Comma separated fields to include, see fieldsets.py (optional).
+        - facets (bool): Whether to count bottles per room, manufacturer and storage class (optional).
     """
 
     query = fields.Str()
@@ -203,3 +221,60 @@ class SearchParamsSchema(Schema):
         allow_none=True,
     )
     synonyms = fields.Bool()
+    limit = fields.Int(validate=validate.Range(min=1), required=False, allow_none=True)
+    cursor = fields.Str(required=False, allow_none=True)
+    format = fields.Str(validate=validate.OneOf(FORMATS), required=False)
+    facets = fields.Bool()
+    field_names = fields.Str(
+        data_key="fields",
+        validate=validate_fieldset,
+        required=False,
+        allow_none=True,
+    )
+
+
+# What exports can be made as, see csv_export.py
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_COMPRESSIONS = ("gzip",)
+
+
+class ExportParamsSchema(Schema):
+    """
+    Schema for validating inventory export parameters.
+    Fields:
+        - building (str): Only bottles in this building (optional).
+        - location (int): Only bottles in this location ID (optional).
+        - sub_location (int): Only bottles in this sub-location ID (optional).
+        - storage_class (int): Only chemicals of this storage class ID (optional).
+        - manufacturers (list): List of manufacturer IDs (optional).
+        - dead (bool): Only dead bottles if true, only live ones if false (optional).
+        - format (str): "csv" or "ndjson" (optional).
+        - compress (str): "gzip" to compress the export (optional).
+    """
+
+    building = fields.Str(required=False, allow_none=True)
+    location = fields.Int(
+        validate=validate_id_exists(Location, "Location_ID"),
+        required=False,
+        allow_none=True,
+    )
+    sub_location = fields.Int(
+        validate=validate_id_exists(Sub_Location, "Sub_Location_ID"),
+        required=False,
+        allow_none=True,
+    )
+    storage_class = fields.Int(
+        validate=validate_id_exists(Storage_Class, "Storage_Class_ID"),
+        required=False,
+        allow_none=True,
+    )
+    manufacturers = fields.List(
+        fields.Int(validate=validate_id_exists(Manufacturer, "Manufacturer_ID")),
+        required=False,
+        allow_none=True,
+    )
+    dead = fields.Bool(required=False, allow_none=True)
+    format = fields.Str(validate=validate.OneOf(EXPORT_FORMATS), required=False)
+    compress = fields.Str(
+        validate=validate.OneOf(EXPORT_COMPRESSIONS), required=False, allow_none=True
+    )
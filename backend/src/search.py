@@ -1,34 +1,55 @@
+import base64
+import heapq
+import itertools
+import json
 import logging
-import re
 from difflib import SequenceMatcher
-import requests
-from flask import Blueprint, request, jsonify
-from sqlalchemy.orm import joinedload
+from flask import Blueprint, current_app, request, jsonify
+from sqlalchemy import or_, func, and_, case
+from cache import LRUCache
+from compact import compact_inventory_rows
+from data_version import current_data_version
+from fieldsets import Fieldset
 from database import db
-from sqlalchemy import or_, func, and_
+from inventory_rows import (
+    group_inventory_rows,
+    inventory_row_query,
+    iter_inventory_chemicals,
+    is_dead,
+    join_inventory,
+)
 from models import (
+    MAX_STICKER_NUMBER,
     Chemical,
     Chemical_Manufacturer,
     Inventory,
     Sub_Location,
     Location,
     Manufacturer,
+    Storage_Class,
 )
 from oidc import oidc
 from schemas import SearchParamsSchema
+from search_index import candidate_chemical_ids, normalize_name
+from streaming import iter_json_array, log_stream_errors, stream_response
+from synonyms import get_synonyms
 from marshmallow.exceptions import ValidationError
 
 search = Blueprint("search", __name__)
 logger = logging.getLogger(__name__)
 
 
-def calculate_similarity(query, entry):
+def calculate_similarity(query, entry, matcher=None):
     """
     Calculate similarity between the query and an entry.
+    :param matcher: A SequenceMatcher to reuse, with the query already set as its first sequence.
     """
     query = query.lower().replace(" ", "")
     entry = entry.lower().replace(" ", "")
-    match = SequenceMatcher(None, query, entry).find_longest_match()
+    if matcher is None:
+        matcher = SequenceMatcher(None, query)
+    matcher.set_seq2(entry)
+    match = matcher.find_longest_match()
     similarity = (
         # Prioritize strings that contain all or most of the query
         match.size,
@@ -36,29 +57,383 @@ def calculate_similarity(query, entry):
         # Irrelevant compounds are usually prefix+query
         match.size - match.b,
         # If results are "query" and "query with a bunch of other stuff", prioritize the former
-        SequenceMatcher(None, query, entry).ratio(),
+        matcher.ratio(),
     )
-    logger.debug(f"Calculating similarity between {query} and {entry}: {similarity}")
     return similarity
 
 
-def get_synonyms(query):
+def similarity_keys(query, names):
     """
-    Fetch synonyms for a given query from PubChem.
+    Calculate the similarity between the query and every name in one batch.
+
+    Gives exactly the same result as calling calculate_similarity for each name.
+    For names containing the whole query (nearly every search result), the
+    longest match is the query itself, at its first occurrence, and the only
+    matching characters are the query's, so the key follows from str.find() and
+    the lengths without running difflib at all.
+
+    :return: A list of similarity tuples, in the same order as names.
     """
-    synonyms = []
-    logger.info(f"Looking up synonyms for {query}")
-    response = requests.get(
-        f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/substance/name/{query}/synonyms/json"
-    ).json()
-    if "InformationList" in response:
-        logger.info(
-            f"Found {len(response['InformationList']['Information'])} synonyms for {query}"
+    query = normalize_name(query)
+    matcher = SequenceMatcher(None, query)
+    keys = []
+    for name in names:
+        entry = normalize_name(name)
+        start = entry.find(query)
+        if start == -1:
+            # Matched by formula, sticker number or synonym rather than by name
+            keys.append(calculate_similarity(query, entry, matcher))
+            continue
+        length = len(query) + len(entry)
+        ratio = 2 * len(query) / length if length else 1.0
+        keys.append((len(query), len(query) - start, ratio))
+    return keys
+
+
+def search_order_keys(query, chemical_list, first_ids=()):
+    """
+    Calculate the key each chemical is sorted by in the search results.
+
+    Chemicals in first_ids come first, then chemicals with bottles in stock, then
+    the closest matches to the query, or alphabetical order if there is no query.
+    Every key ends with the chemical's id, so no two keys are equal and a page of
+    results can pick up right after the last key of the previous page.
+
+    :param chemical_list: Dictionaries with the id, quantity, normalized_name and
+        sort_key of each chemical, see search_summaries.
+    :return: A list of keys in the same order as chemical_list. Smaller keys come first.
+    """
+    if query:
+        similarities = similarity_keys(
+            query, [chemical["normalized_name"] for chemical in chemical_list]
+        )
+        return [
+            (
+                chemical["id"] not in first_ids,
+                chemical["quantity"] == 0,
+                *(-value for value in similarity),
+                chemical["id"],
+            )
+            for chemical, similarity in zip(chemical_list, similarities)
+        ]
+    return [
+        (
+            chemical["id"] not in first_ids,
+            chemical["quantity"] == 0,
+            chemical["sort_key"],
+            chemical["id"],
+        )
+        for chemical in chemical_list
+    ]
+
+
+def rank_chemicals(query, chemical_list, limit=None, after=None, first_ids=()):
+    """
+    Put chemicals in search result order, see search_order_keys.
+
+    :param limit: Only return the first limit chemicals. They are picked out with
+        a heap rather than by sorting every chemical.
+    :param after: Only return chemicals whose key comes after this one.
+    :return: A list of (key, chemical) pairs, in order.
+    """
+    ranked = zip(search_order_keys(query, chemical_list, first_ids), chemical_list)
+    if after is not None:
+        ranked = (pair for pair in ranked if pair[0] > after)
+    # Keys are unique, so the chemicals themselves are never compared
+    if limit is None:
+        return sorted(ranked)
+    return heapq.nsmallest(limit, ranked)
+
+
+# The types in the keys of search_order_keys, as they come back from JSON:
+# first_ids, out of stock, the similarity to the query and the id
+RELEVANCE_KEY_TYPES = (bool, bool, int, int, (int, float), int)
+# first_ids, out of stock, the sort key and the id
+NAME_KEY_TYPES = (bool, bool, str, int)
+
+
+def encode_cursor(key):
+    """
+    :return: An opaque string for the key of the last chemical on a page.
+    """
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor, query):
+    """
+    :param query: The search query, which decides what kind of key the cursor holds.
+    :return: The key encoded by encode_cursor.
+    :raises ValueError: If the cursor isn't one encode_cursor made for this kind of search.
+    """
+    key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    # See search_order_keys
+    key_types = RELEVANCE_KEY_TYPES if query else NAME_KEY_TYPES
+    if not isinstance(key, list) or len(key) != len(key_types):
+        raise ValueError("Cursor is not a search key")
+    for item, key_type in zip(key, key_types):
+        if key_type is bool:
+            valid = isinstance(item, bool)
+        else:
+            # bool is an int in Python, but never a valid number here
+            valid = isinstance(item, key_type) and not isinstance(item, bool)
+        if not valid:
+            raise ValueError("Cursor does not match the search")
+    return tuple(key)
+
+
+def search_summaries(filters):
+    """
+    Find the chemicals matching the search filters without reading their bottles.
+    :return: A list of dictionaries with the id, normalized_name, sort_key and
+        quantity (live bottles) of each chemical.
+    """
+    live_bottles = func.sum(case((Inventory.Is_Dead.is_(True), 0), else_=1))
+    rows = (
+        join_inventory(
+            db.session.query(
+                Chemical.Chemical_ID,
+                Chemical.Normalized_Name,
+                Chemical.Sort_Key,
+                live_bottles,
+            )
         )
-        for substance in response["InformationList"]["Information"]:
-            logger.debug(f"- {substance['Synonym']}")
-            synonyms.extend(substance["Synonym"])
-    return synonyms
+        .filter(and_(*filters))
+        .group_by(Chemical.Chemical_ID, Chemical.Normalized_Name, Chemical.Sort_Key)
+        .all()
+    )
+    return [
+        {
+            "id": chemical_id,
+            "normalized_name": normalized_name or "",
+            "sort_key": sort_key or "",
+            "quantity": int(quantity),
+        }
+        for chemical_id, normalized_name, sort_key, quantity in rows
+    ]
+
+
+def search_facets(filters):
+    """
+    Count the live bottles matching the search filters in each room, for each
+    manufacturer and in each storage class, with one GROUP BY query.
+    :param filters: The filters to count within. Leave out the room, sub-location
+        and manufacturer filters to show what choosing each of them would give.
+    :return: A dictionary of "rooms", "manufacturers" and "storage_classes", each a
+        list of {"id", "name", "count"}, most bottles first.
+    """
+    rows = (
+        join_inventory(
+            db.session.query(
+                Location.Location_ID,
+                Location.Building,
+                Location.Room,
+                Manufacturer.Manufacturer_ID,
+                Manufacturer.Manufacturer_Name,
+                Storage_Class.Storage_Class_ID,
+                Storage_Class.Storage_Class_Name,
+                func.count(Inventory.Inventory_ID),
+            )
+        )
+        .filter(is_dead(False), *filters)
+        .group_by(
+            Location.Location_ID,
+            Location.Building,
+            Location.Room,
+            Manufacturer.Manufacturer_ID,
+            Manufacturer.Manufacturer_Name,
+            Storage_Class.Storage_Class_ID,
+            Storage_Class.Storage_Class_Name,
+        )
+        .all()
+    )
+
+    rooms, manufacturers, storage_classes = {}, {}, {}
+
+    def add(facet, facet_id, name, count):
+        if facet_id is None:
+            return
+        entry = facet.setdefault(facet_id, {"id": facet_id, "name": name, "count": 0})
+        entry["count"] += count
+
+    for (
+        location_id,
+        building,
+        room,
+        manufacturer_id,
+        manufacturer,
+        storage_class_id,
+        storage_class,
+        count,
+    ) in rows:
+        add(rooms, location_id, f"{building} {room}", count)
+        add(manufacturers, manufacturer_id, manufacturer, count)
+        add(storage_classes, storage_class_id, storage_class, count)
+
+    def ordered(facet):
+        return sorted(
+            facet.values(), key=lambda entry: (-entry["count"], entry["name"])
+        )
+
+    return {
+        "rooms": ordered(rooms),
+        "manufacturers": ordered(manufacturers),
+        "storage_classes": ordered(storage_classes),
+    }
+
+
+def search_page(
+    query,
+    filters,
+    limit=None,
+    cursor=None,
+    first_ids=(),
+    group=group_inventory_rows,
+    row_query=inventory_row_query,
+):
+    """
+    Get one page of search results, or all of them if there's no limit or cursor.
+
+    Only the chemicals' names and bottle counts are needed to rank them, so
+    bottles are only read for the chemicals on the page.
+
+    :param cursor: The next_cursor of the previous page, or None for the first page.
+    :param group: Turns the page's bottle rows, in ranked order, into the results.
+    :param row_query: Builds the query for the bottle rows, see Fieldset.query().
+    :return: A dictionary with the page of results, the total number of matching
+        chemicals, and the cursor for the next page (None on the last page).
+    :raises ValueError: If the cursor is invalid.
+    """
+    after = decode_cursor(cursor, query) if cursor else None
+    summaries = search_summaries(filters)
+    # Ask for one extra chemical to find out if there is another page
+    ranked = rank_chemicals(
+        query, summaries, limit + 1 if limit else None, after, first_ids
+    )
+
+    next_cursor = None
+    if limit and len(ranked) > limit:
+        ranked = ranked[:limit]
+        next_cursor = encode_cursor(ranked[-1][0])
+
+    positions = {chemical["id"]: i for i, (_, chemical) in enumerate(ranked)}
+    rows = row_query().filter(and_(*filters))
+    if limit or after is not None:
+        rows = rows.filter(Chemical.Chemical_ID.in_(positions))
+    # Put the rows in ranked order, each chemical's bottles keep their order
+    rows = sorted(rows.all(), key=lambda row: positions[row.Chemical_ID])
+    return {
+        "results": group(rows),
+        "total": len(summaries),
+        "next_cursor": next_cursor,
+    }
+
+
+def iter_search_results(
+    query,
+    filters,
+    first_ids=(),
+    iter_chemicals=iter_inventory_chemicals,
+    row_query=inventory_row_query,
+):
+    """
+    Get every search result, in order, reading the bottles of a batch of
+    chemicals at a time rather than all of them at once.
+    :param iter_chemicals: Turns bottle rows into chemicals, see Fieldset.iter_chemicals().
+    :param row_query: Builds the query for the bottle rows, see Fieldset.query().
+    :return: A generator of chemicals in the same shape as Chemical.to_dict().
+    """
+    ranked = rank_chemicals(query, search_summaries(filters), first_ids=first_ids)
+    ids = [chemical["id"] for _, chemical in ranked]
+    batch_size = current_app.config["STREAM_BATCH_SIZE"]
+    for start in range(0, len(ids), batch_size):
+        positions = {
+            chemical_id: i
+            for i, chemical_id in enumerate(ids[start : start + batch_size])
+        }
+        rows = (
+            row_query()
+            .filter(and_(*filters), Chemical.Chemical_ID.in_(positions))
+            .all()
+        )
+        rows.sort(key=lambda row: positions[row.Chemical_ID])
+        yield from iter_chemicals(rows)
+
+
+def page_size(results):
+    """
+    :return: The number of chemicals in search results of either format.
+    """
+    if isinstance(results, dict):
+        return len(results["chemicals"])
+    return len(results)
+
+
+def search_cache():
+    """
+    :return: The search result cache for the current app, created on first use.
+    """
+    cache = current_app.extensions.get("search_cache")
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            "search_cache",
+            LRUCache(
+                current_app.config["SEARCH_CACHE_SIZE"],
+                max_bytes=current_app.config["SEARCH_CACHE_MAX_BYTES"],
+                sizeof=len,
+            ),
+        )
+    return cache
+
+
+def search_cache_key(validated_params):
+    """
+    :return: A key for the cached response to a search, only valid at the current data version.
+    """
+    return (
+        current_data_version(),
+        validated_params.get("query", ""),
+        validated_params.get("room", None),
+        validated_params.get("sub_location", None),
+        # The order manufacturers are listed in doesn't change the results
+        tuple(sorted(validated_params.get("manufacturers") or [])),
+        validated_params.get("synonyms", False),
+        validated_params.get("limit", None),
+        validated_params.get("cursor", None),
+        validated_params.get("format", "full"),
+        validated_params.get("field_names", None),
+        validated_params.get("facets", False),
+    )
+
+
+def cache_response(cache_key, results, cacheable=True):
+    """
+    Build the JSON response for a search, keeping the encoded body in the search cache.
+    """
+    response = jsonify(results)
+    if cacheable:
+        search_cache().put(cache_key, response.get_data())
+    return response
+
+
+def cache_stream(cache_key, chunks, cacheable=True):
+    """
+    Pass on the chunks of a streamed search response, keeping the body in the
+    search cache once it's all been sent, unless it's too big to cache.
+    """
+    cache = search_cache()
+    body = [] if cacheable else None
+    size = 0
+    for chunk in chunks:
+        chunk = chunk.encode()
+        if body is not None:
+            size += len(chunk)
+            if cache.max_bytes is not None and size > cache.max_bytes:
+                body = None
+            else:
+                body.append(chunk)
+        yield chunk
+    if body is not None:
+        cache.put(cache_key, b"".join(body))
 
 
 def parse_request_params(request):
@@ -76,42 +451,77 @@ def parse_request_params(request):
         "sub_location": request.args.get("sub_location", None),
         "manufacturers": manufacturers,
         "synonyms": request.args.get("synonyms", "false").lower() == "true",
+        "limit": request.args.get("limit", None),
+        "cursor": request.args.get("cursor", None),
+        "format": request.args.get("format", "full"),
+        "fields": request.args.get("fields", None),
+        "facets": request.args.get("facets", "false").lower() == "true",
     }
 
     return SearchParamsSchema().load(params)
 
 
-def build_search_filters(search_terms, room, sub_location, manufacturer_ids):
+def as_sticker_number(term):
     """
-    Build SQLAlchemy filters for the search query.
+    :return: The sticker number a search term could be, or None if it isn't a number
+        that fits in the Sticker_Number column. Longer numbers are searched for as text.
     """
-    name_filter = or_(
-        *[
-            func.replace(Chemical.Chemical_Name, " ", "").ilike(
-                f"%{term.replace(' ', '')}%"
-            )
-            for term in search_terms
-        ]
-    )
-    alphabetical_filter = or_(
-        *[
-            func.replace(Chemical.Alphabetical_Name, " ", "").ilike(
-                f"%{term.replace(' ', '')}%"
-            )
-            for term in search_terms
-        ]
-    )
-    formula_filter = or_(*[Chemical.Chemical_Formula == term for term in search_terms])
+    term = term.strip()
+    if term.isascii() and term.isdigit():
+        number = int(term)
+        if number <= MAX_STICKER_NUMBER:
+            return number
+    return None
 
-    sticker_filter = Chemical.Chemical_Manufacturers.any(
-        Chemical_Manufacturer.Inventory.any(Inventory.Sticker_Number.in_(search_terms))
-    )
 
-    search_filter = or_(
-        name_filter, alphabetical_filter, formula_filter, sticker_filter
+def sticker_chemical_ids(search_terms):
+    """
+    Find the chemicals of the bottles whose sticker numbers are among the search terms.
+    Sticker_Number is unique, so this is an index lookup per number.
+    :return: A set of Chemical_IDs.
+    """
+    sticker_numbers = {
+        as_sticker_number(term)
+        for term in search_terms
+        if as_sticker_number(term) is not None
+    }
+    if not sticker_numbers:
+        return set()
+    rows = (
+        db.session.query(Chemical_Manufacturer.Chemical_ID)
+        .join(Inventory.Chemical_Manufacturer)
+        .filter(Inventory.Sticker_Number.in_(sticker_numbers))
+        .all()
     )
+    return {chemical_id for chemical_id, in rows}
+
+
+def build_search_filters(
+    search_terms,
+    room,
+    sub_location,
+    manufacturer_ids,
+    candidate_ids=None,
+    sticker_ids=(),
+    text_search=True,
+):
+    """
+    Build SQLAlchemy filters for the search query.
 
-    filters = [search_filter]
+    :param candidate_ids: A SELECT of the Chemical_IDs the trigram index says may
+        match by name, see candidate_chemical_ids.
+        None means the index couldn't be used and every chemical is checked.
+    :param sticker_ids: Chemical_IDs of bottles whose sticker numbers were searched for.
+    :param text_search: False to only match sticker_ids, skipping the name and formula filters.
+    """
+    sticker_filter = Chemical.Chemical_ID.in_(sticker_ids)
+    filters = [
+        (
+            build_text_filter(search_terms, candidate_ids, sticker_filter)
+            if text_search
+            else sticker_filter
+        )
+    ]
 
     if room:
         filters.append(Location.Location_ID == int(room))
@@ -126,39 +536,31 @@ def build_search_filters(search_terms, room, sub_location, manufacturer_ids):
     return filters
 
 
-def filter_inventory_records(chemical_list, room, sub_location, manufacturer_ids):
+def build_text_filter(search_terms, candidate_ids, sticker_filter):
     """
-    Filter inventory records based on room, sub-location, and manufacturer criteria.
+    Build the filter matching chemicals by name, alphabetical name, formula or sticker number.
     """
-    for chemical in chemical_list:
-        filtered_inventory = chemical["inventory"]
-
-        if room:
-            filtered_inventory = [
-                inv for inv in filtered_inventory if inv["location_id"] == int(room)
-            ]
-
-        if sub_location:
-            filtered_inventory = [
-                inv
-                for inv in filtered_inventory
-                if inv["sub_location_id"] == int(sub_location)
-            ]
-
-        if manufacturer_ids:
-            filtered_inventory = [
-                inv
-                for inv in filtered_inventory
-                if inv["manufacturer_id"] in manufacturer_ids
-            ]
+    # The normalized name columns are stored lowercase without spaces
+    name_filter = or_(
+        *[
+            Chemical.Normalized_Name.like(f"%{normalize_name(term)}%")
+            for term in search_terms
+        ]
+    )
+    alphabetical_filter = or_(
+        *[
+            Chemical.Normalized_Alphabetical_Name.like(f"%{normalize_name(term)}%")
+            for term in search_terms
+        ]
+    )
+    text_filter = or_(name_filter, alphabetical_filter)
+    if candidate_ids is not None:
+        # Only run the LIKE filters on chemicals the index says could match
+        text_filter = and_(Chemical.Chemical_ID.in_(candidate_ids), text_filter)
 
-        chemical["inventory"] = filtered_inventory
-        chemical["quantity"] = len(
-            [inv for inv in filtered_inventory if not inv["dead"]]
-        )
+    formula_filter = or_(*[Chemical.Chemical_Formula == term for term in search_terms])
 
-    logger.info(f"Filtered inventory records for chemicals.")
-    return [chem for chem in chemical_list if chem["inventory"]]
+    return or_(text_filter, formula_filter, sticker_filter)
 
 
 @search.route("/api/search", methods=["GET"])
@@ -166,6 +568,11 @@ def filter_inventory_records(chemical_list, room, sub_location, manufacturer_ids
 def search_route():
     """
     Handle the search API route.
+    Pass format=compact for the smaller, dictionary-encoded format described in compact.py,
+    or fields= to only get some fields, as described in fieldsets.py.
+    Pass facets=true to also get the number of live bottles matching the query
+    in each room, for each manufacturer and in each storage class (see search_facets).
+    The results are then under "results", next to "facets".
     """
     try:
         validated_params = parse_request_params(request)
@@ -176,67 +583,139 @@ def search_route():
             400,
         )
 
+    # Read the data version before searching, so a write during the search
+    # makes this result stale instead of being missed
+    cache_key = search_cache_key(validated_params)
+    body = search_cache().get(cache_key)
+    if body is not None:
+        logger.info("Returning cached search results.")
+        return current_app.response_class(body, mimetype="application/json")
+
     query = validated_params.get("query", "")
     room = validated_params.get("room", None)
     sub_location = validated_params.get("sub_location", None)
     manufacturer_ids = validated_params.get("manufacturers", [])
     synonym_search_enabled = validated_params.get("synonyms", False)
+    limit = validated_params.get("limit", None)
+    cursor = validated_params.get("cursor", None)
+    paginated = limit is not None or cursor is not None
+    with_facets = validated_params.get("facets", False)
+
+    compact = validated_params.get("format", "full") == "compact"
+    group = compact_inventory_rows if compact else group_inventory_rows
+    iter_chemicals = iter_inventory_chemicals
+    row_query = inventory_row_query
+    if validated_params.get("field_names") is not None:
+        if compact:
+            return (
+                jsonify(
+                    {
+                        "error": "Invalid request parameters",
+                        "details": {
+                            "fields": ["fields can't be used with format=compact."]
+                        },
+                    }
+                ),
+                400,
+            )
+        fieldset = Fieldset.parse(validated_params["field_names"])
+        group = fieldset.group
+        iter_chemicals = fieldset.iter_chemicals
+        row_query = fieldset.query
 
     if not query and not room and not sub_location and not manufacturer_ids:
         logger.warning("No filtering criteria provided. Returning an empty list.")
-        return jsonify([])
+        if paginated:
+            response = {"results": group([]), "total": 0, "next_cursor": None}
+        elif with_facets:
+            response = {"results": group([])}
+        else:
+            return jsonify(group([]))
+        if with_facets:
+            # Nothing to narrow down yet, so the whole inventory
+            response["facets"] = search_facets([])
+        return jsonify(response)
+
+    # A scanned barcode is just a sticker number, which can only match a bottle
+    sticker_search = as_sticker_number(query) is not None
 
     search_terms = [query]
-    if synonym_search_enabled:
-        search_terms.extend(get_synonyms(query))
+    synonyms = (
+        get_synonyms(query) if synonym_search_enabled and not sticker_search else []
+    )
+    search_terms.extend(synonyms)
+    # No synonyms may just mean PubChem didn't answer in time, so don't keep the result
+    cacheable = not synonym_search_enabled or sticker_search or bool(synonyms)
 
     search_terms = list(set(search_terms))
     search_terms = [term for term in search_terms if len(term) > 3 or term == query]
 
-    filters = build_search_filters(search_terms, room, sub_location, manufacturer_ids)
-
-    matching_chemicals = (
-        db.session.query(Chemical)
-        .outerjoin(Chemical.Chemical_Manufacturers)
-        .outerjoin(Chemical_Manufacturer.Manufacturer)
-        .outerjoin(Chemical_Manufacturer.Inventory)
-        .outerjoin(Inventory.Sub_Location)
-        .outerjoin(Sub_Location.Location)
-        .options(
-            joinedload(Chemical.Storage_Class),
-            joinedload(Chemical.Chemical_Manufacturers)
-            .joinedload(Chemical_Manufacturer.Inventory)
-            .joinedload(Inventory.Sub_Location)
-            .joinedload(Sub_Location.Location),
-            joinedload(Chemical.Chemical_Manufacturers).joinedload(
-                Chemical_Manufacturer.Manufacturer
-            ),
-        )
-        .filter(and_(*filters))
-        .all()
-    )
-
-    chemical_list = [chemical.to_dict() for chemical in matching_chemicals]
-
-    chemical_list = filter_inventory_records(
-        chemical_list, room, sub_location, manufacturer_ids
+    # The bottles with matching sticker numbers are found first, and their chemicals come first
+    sticker_ids = sticker_chemical_ids(search_terms)
+    candidate_ids = None if sticker_search else candidate_chemical_ids(search_terms)
+    filters = build_search_filters(
+        search_terms,
+        room,
+        sub_location,
+        manufacturer_ids,
+        candidate_ids,
+        sticker_ids,
+        text_search=not sticker_search,
     )
+    # Facets are counted for the text query alone, the first filter
+    facets = search_facets(filters[:1]) if with_facets else None
 
-    if query:
-        chemical_list.sort(
-            key=lambda x: (
-                x["quantity"] != 0,
-                calculate_similarity(query, x["chemical_name"]),
-            ),
-            reverse=True,
+    if paginated:
+        try:
+            page = search_page(
+                query, filters, limit, cursor, sticker_ids, group, row_query
+            )
+        except ValueError as e:
+            logger.error(f"Invalid search cursor: {e}")
+            return (
+                jsonify(
+                    {
+                        "error": "Invalid request parameters",
+                        "details": {"cursor": ["Invalid cursor."]},
+                    }
+                ),
+                400,
+            )
+        logger.info(
+            f"Returning {page_size(page['results'])} of {page['total']} matching chemicals."
         )
-    else:
-        chemical_list.sort(
-            key=lambda x: (
-                x["quantity"] == 0,
-                re.sub(r"[^a-zA-Z]", "", x["chemical_name"]).lower(),
-            ),
+        if with_facets:
+            page["facets"] = facets
+        return cache_response(cache_key, page, cacheable)
+
+    # Room, sub-location and manufacturer filters apply to each bottle, so only
+    # the bottles that will be returned are read from the database
+    if compact:
+        chemical_list = search_page(query, filters, first_ids=sticker_ids, group=group)
+        chemical_list = chemical_list["results"]
+        logger.info(f"Returning {page_size(chemical_list)} matching chemicals.")
+        if with_facets:
+            chemical_list = {"results": chemical_list, "facets": facets}
+        return cache_response(cache_key, chemical_list, cacheable)
+
+    logger.info("Streaming matching chemicals.")
+    chemical_list = iter_search_results(
+        query, filters, sticker_ids, iter_chemicals, row_query
+    )
+    chunks = iter_json_array(log_stream_errors(chemical_list, "search results"))
+    if with_facets:
+        chunks = itertools.chain(
+            [f'{{"facets":{current_app.json.dumps(facets)},"results":'],
+            chunks,
+            ["}"],
         )
+    return stream_response(cache_stream(cache_key, chunks, cacheable))
 
-    logger.info(f"Returning {len(chemical_list)} matching chemicals.")
-    return jsonify(chemical_list)
+
+@search.route("/api/search/cache_stats", methods=["GET"])
+@oidc.require_login
+def search_cache_stats():
+    """
+    :return: The search cache's hit, miss and eviction counts, and how full it is.
+    """
+    return jsonify(search_cache().stats())
@@ -0,0 +1,186 @@
+"""
+Trigram index over normalized chemical names.
+
+A substring search (ILIKE '%term%') can't be served by a normal database index,
+so every search used to scan the whole Chemical table. Instead, each chemical's
+name and alphabetical name are broken into 3-character pieces and stored in
+Chemical_Trigram. A term can only be a substring of a name if every one of its
+trigrams belongs to that name, so the index narrows the search down to a small
+set of candidate Chemical_IDs. The LIKE filter still runs on those candidates,
+so results are exactly the same as an unindexed search.
+
+Chemicals also store their normalized names and a sort key, so searching and
+sorting don't have to compute them for every row on every request.
+
+The index must be updated whenever a chemical is added, renamed or deleted.
+"""
+
+import logging
+import re
+from sqlalchemy import bindparam, delete, func, insert, select, union, update
+from database import db
+from models import Chemical, Chemical_Trigram
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_SIZE = 3
+
+
+def normalize_name(name):
+    """
+    Normalize a name or search term the same way the search filters do.
+    """
+    return (name or "").replace(" ", "").lower()
+
+
+def sort_key(name):
+    """
+    The key chemicals are sorted alphabetically by: only the letters, in lowercase.
+    """
+    return re.sub(r"[^a-zA-Z]", "", name or "").lower()
+
+
+def normalize_chemical(chemical):
+    """
+    Fill in a chemical's normalized name columns from its names.
+    """
+    chemical.Normalized_Name = normalize_name(chemical.Chemical_Name)
+    chemical.Normalized_Alphabetical_Name = normalize_name(chemical.Alphabetical_Name)
+    chemical.Sort_Key = sort_key(chemical.Chemical_Name)
+
+
+def backfill_normalized_names():
+    """
+    Recompute the normalized name columns of every chemical.
+    The caller is responsible for committing.
+    :return: The number of chemicals updated.
+    """
+    chemicals = db.session.query(
+        Chemical.Chemical_ID, Chemical.Chemical_Name, Chemical.Alphabetical_Name
+    ).all()
+    rows = [
+        {
+            "chemical_id": chemical_id,
+            "normalized_name": normalize_name(chemical_name),
+            "normalized_alphabetical_name": normalize_name(alphabetical_name),
+            "sort_key": sort_key(chemical_name),
+        }
+        for chemical_id, chemical_name, alphabetical_name in chemicals
+    ]
+    if rows:
+        statement = (
+            update(Chemical.__table__)
+            .where(Chemical.__table__.c.Chemical_ID == bindparam("chemical_id"))
+            .values(
+                Normalized_Name=bindparam("normalized_name"),
+                Normalized_Alphabetical_Name=bindparam("normalized_alphabetical_name"),
+                Sort_Key=bindparam("sort_key"),
+            )
+        )
+        db.session.connection().execute(statement, rows)
+    logger.info(f"Normalized the names of {len(rows)} chemicals")
+    return len(rows)
+
+
+def trigrams(text):
+    """
+    Split a normalized string into its set of trigrams.
+    Strings shorter than a trigram have none.
+    """
+    return {text[i : i + TRIGRAM_SIZE] for i in range(len(text) - TRIGRAM_SIZE + 1)}
+
+
+def chemical_trigrams(chemical_name, alphabetical_name):
+    """
+    All trigrams for a chemical, covering both of the names search looks at.
+    """
+    return trigrams(normalize_name(chemical_name)) | trigrams(
+        normalize_name(alphabetical_name)
+    )
+
+
+def index_chemical(chemical):
+    """
+    Update a chemical's normalized names and replace its index rows.
+    Adds to the current session, the caller is responsible for committing.
+    """
+    normalize_chemical(chemical)
+    if chemical.Chemical_ID is None:
+        # New chemicals need an ID before they can be indexed
+        db.session.flush()
+    remove_chemical(chemical.Chemical_ID)
+    db.session.add_all(
+        Chemical_Trigram(Chemical_ID=chemical.Chemical_ID, Trigram=trigram)
+        for trigram in chemical_trigrams(
+            chemical.Chemical_Name, chemical.Alphabetical_Name
+        )
+    )
+    logger.debug(f"Indexed chemical {chemical.Chemical_ID}")
+
+
+def remove_chemical(chemical_id):
+    """
+    Remove a chemical from the index. Must happen before the chemical itself is deleted.
+    """
+    db.session.query(Chemical_Trigram).filter(
+        Chemical_Trigram.Chemical_ID == chemical_id
+    ).delete(synchronize_session=False)
+
+
+def rebuild_trigram_index():
+    """
+    Rebuild the whole index from the Chemical table.
+    The caller is responsible for committing.
+    :return: The number of chemicals indexed.
+    """
+    logger.info("Rebuilding chemical trigram index")
+    db.session.execute(delete(Chemical_Trigram))
+    chemicals = db.session.query(
+        Chemical.Chemical_ID, Chemical.Chemical_Name, Chemical.Alphabetical_Name
+    ).all()
+    rows = [
+        {"Chemical_ID": chemical_id, "Trigram": trigram}
+        for chemical_id, chemical_name, alphabetical_name in chemicals
+        for trigram in chemical_trigrams(chemical_name, alphabetical_name)
+    ]
+    if rows:
+        db.session.execute(insert(Chemical_Trigram), rows)
+    logger.info(f"Indexed {len(chemicals)} chemicals ({len(rows)} trigrams)")
+    return len(chemicals)
+
+
+def candidate_chemical_ids(search_terms):
+    """
+    Find the chemicals whose names could contain any of the search terms.
+
+    :param search_terms: The raw search terms.
+    :return: A SELECT of the candidate Chemical_IDs, to filter with
+        Chemical_ID.in_(), or None if a term can't be looked up in the index
+        (too short, or contains a LIKE wildcard) and every chemical has to be
+        considered. The ids stay in the database rather than being sent back
+        to it as one parameter each.
+    """
+    term_trigrams = []
+    for term in search_terms:
+        normalized = normalize_name(term)
+        if "%" in normalized or "_" in normalized:
+            return None
+        grams = trigrams(normalized)
+        if not grams:
+            return None
+        term_trigrams.append(grams)
+
+    if not term_trigrams:
+        return None
+
+    # A chemical is a candidate for a term if it has every one of the term's trigrams
+    matches_per_term = [
+        select(Chemical_Trigram.Chemical_ID)
+        .where(Chemical_Trigram.Trigram.in_(grams))
+        .group_by(Chemical_Trigram.Chemical_ID)
+        .having(func.count(func.distinct(Chemical_Trigram.Trigram)) == len(grams))
+        for grams in term_trigrams
+    ]
+    if len(matches_per_term) == 1:
+        return matches_per_term[0]
+    return union(*matches_per_term)
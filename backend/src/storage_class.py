@@ -3,6 +3,7 @@ from flask import Blueprint, jsonify, request
 from database import db
 from models import Storage_Class, Chemical
 from oidc import oidc
+from data_version import changes_data, conditional_get
 from permission_requirements import require_editor
 
 storage_class = Blueprint('storage_class', __name__)
@@ -10,6 +11,7 @@ storage_class = Blueprint('storage_class', __name__)
 logger = logging.getLogger(__name__)
 
 @storage_class.route("/api/storage_classes", methods=["GET"])
+@conditional_get
 def get_storage_classes():
     """
     This endpoint retrieves all storage classes from the database and returns
@@ -39,6 +41,7 @@ def get_storage_classes():
 @storage_class.route('/api/storage_classes/', methods=['DELETE'])
 @oidc.require_login
 @require_editor
+@changes_data
 def delete_storage_classes():
     """
     Deletes specified storage classes and reassigns associated chemicals to the 'Unknown' class.
@@ -89,6 +92,7 @@ def delete_storage_classes():
 @storage_class.route('/api/storage_classes/', methods=['POST'])
 @oidc.require_login
 @require_editor
+@changes_data
 def create_storage_class():
     """
     Creates a new storage class.
@@ -114,6 +118,7 @@ def create_storage_class():
 @storage_class.route('/api/storage_classes/<int:storage_class_id>', methods=['PUT'])
 @oidc.require_login
 @require_editor
+@changes_data
 def update_storage_class(storage_class_id):
     """
     Updates the name of an existing storage class.
@@ -0,0 +1,80 @@
+"""
+Streamed JSON responses.
+
+jsonify() builds the whole body as one string before sending any of it, so a
+large list takes several times its own size in memory. These helpers encode a
+list one item at a time instead, from a generator that can read its rows from
+the database as it goes, and send the body in chunks. How much memory a
+response uses, and how long it takes for its first byte to be sent, no longer
+depend on how long the list is.
+"""
+
+import logging
+from flask import current_app, stream_with_context
+
+logger = logging.getLogger(__name__)
+
+# Bytes of JSON gathered before sending them
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(items, chunk_size=CHUNK_SIZE):
+    """
+    Encode items as a JSON array, a few at a time.
+    :param items: An iterable of anything jsonify() can encode.
+    :return: A generator of strings that join up into the array.
+    """
+    dumps = current_app.json.dumps
+    chunk = ["["]
+    size = 1
+    separator = ""
+    for item in items:
+        encoded = dumps(item, separators=(",", ":"))
+        chunk.append(separator)
+        chunk.append(encoded)
+        size += len(encoded) + 1
+        separator = ","
+        if size >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+    chunk.append("]")
+    yield "".join(chunk)
+
+
+def log_stream_errors(items, name):
+    """
+    Pass on the items of a streamed response, logging how many had been sent if
+    reading the rest fails. The response has already started by then, so all
+    that can be done is cut it short.
+    :param items: An iterable read while the response is sent.
+    :param name: What the items are, for the log message.
+    :return: A generator of the same items.
+    """
+    count = 0
+    try:
+        for item in items:
+            yield item
+            count += 1
+    except Exception as e:
+        logger.error(
+            f"Failed to stream {name} after {count} of them: {e}", exc_info=True
+        )
+        raise
+
+
+def stream_response(chunks, mimetype="application/json"):
+    """
+    :param chunks: A generator of the body's chunks. It runs inside the request
+        context, so it can keep querying the database.
+    :return: A response, JSON unless another mimetype is given, sent as the chunks are made.
+    """
+    return current_app.response_class(stream_with_context(chunks), mimetype=mimetype)
+
+
+def stream_json_array(items):
+    """
+    :param items: An iterable of anything jsonify() can encode, read while the response is sent.
+    :return: A streamed JSON response with the items in an array.
+    """
+    return stream_response(iter_json_array(items))
@@ -0,0 +1,130 @@
+"""
+Cached PubChem synonym lookups.
+
+Synonym searches used to ask PubChem on every request. Lookups are now stored in
+the Synonym_Cache table, keyed by the normalized query, with an in-memory LRU in
+front of it, so a repeated synonym search costs at most one indexed lookup.
+Names PubChem doesn't know are cached too (for a shorter time), so typos don't
+keep going out to the internet.
+
+Lookups run on the PubChem client's worker pool. A search only waits
+PUBCHEM_LATENCY_BUDGET seconds for them and then carries on without synonyms;
+a late answer still fills the cache for the next search.
+"""
+
+import json
+import logging
+from concurrent import futures
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from cache import LRUCache
+from database import db
+from models import Synonym_Cache
+from pubchem import PubChemUnavailable, pubchem_client
+
+logger = logging.getLogger(__name__)
+
+# Longer queries are still looked up, but only cached in memory
+MAX_QUERY_LENGTH = Synonym_Cache.Query.type.length
+
+
+def normalize_query(query):
+    """
+    Normalize a query into a cache key: lowercase with single spaces.
+    """
+    return " ".join(query.lower().split())
+
+
+def memory_cache():
+    """
+    :return: The in-memory synonym cache for the current app.
+    """
+    cache = current_app.extensions.get("synonym_cache")
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            "synonym_cache", LRUCache(current_app.config["SYNONYM_CACHE_SIZE"])
+        )
+    return cache
+
+
+def cache_lifetime(found):
+    """
+    :param found: Whether PubChem had synonyms for the name.
+    :return: How long a lookup stays cached.
+    """
+    if found:
+        return timedelta(seconds=current_app.config["SYNONYM_CACHE_TTL"])
+    return timedelta(seconds=current_app.config["SYNONYM_CACHE_NEGATIVE_TTL"])
+
+
+def store_synonyms(query, found, synonyms):
+    """
+    Save a PubChem lookup to the Synonym_Cache table.
+    """
+    entry = db.session.query(Synonym_Cache).filter(Synonym_Cache.Query == query).first()
+    if entry is None:
+        entry = Synonym_Cache(Query=query)
+        db.session.add(entry)
+    entry.Synonyms = json.dumps(synonyms)
+    entry.Found = found
+    entry.Fetched_At = datetime.now()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request cached the same query first, keep theirs
+        db.session.rollback()
+        logger.debug(f"Synonyms for {query} were already cached")
+
+
+def lookup_synonyms(app, key):
+    """
+    Ask PubChem for synonyms and cache the answer.
+    Runs on the PubChem worker pool, so it needs its own app context.
+    """
+    with app.app_context():
+        found, synonyms = pubchem_client().fetch_synonyms(key)
+        if len(key) <= MAX_QUERY_LENGTH:
+            store_synonyms(key, found, synonyms)
+        memory_cache().put(
+            key, tuple(synonyms), datetime.now() + cache_lifetime(found)
+        )
+        return synonyms
+
+
+def get_synonyms(query):
+    """
+    Get synonyms for a query, asking PubChem only if they aren't cached.
+    If PubChem is slow or unavailable, returns no synonyms rather than waiting.
+    """
+    key = normalize_query(query)
+    if not key:
+        return []
+
+    cache = memory_cache()
+    synonyms = cache.get(key)
+    if synonyms is not None:
+        logger.debug(f"Synonyms for {key} found in memory")
+        return list(synonyms)
+
+    if len(key) <= MAX_QUERY_LENGTH:
+        entry = (
+            db.session.query(Synonym_Cache).filter(Synonym_Cache.Query == key).first()
+        )
+        expiry = entry.Fetched_At + cache_lifetime(entry.Found) if entry else None
+        if expiry and expiry > datetime.now():
+            logger.debug(f"Synonyms for {key} found in the database")
+            synonyms = json.loads(entry.Synonyms)
+            cache.put(key, tuple(synonyms), expiry)
+            return synonyms
+
+    app = current_app._get_current_object()
+    try:
+        future = pubchem_client().submit(key, lookup_synonyms, app, key)
+        return list(future.result(timeout=app.config["PUBCHEM_LATENCY_BUDGET"]))
+    except futures.TimeoutError:
+        logger.warning(f"PubChem is slow to answer for {key}, searching without synonyms")
+    except PubChemUnavailable as e:
+        logger.warning(f"PubChem is unavailable ({e}), searching without synonyms")
+    return []
@@ -12,6 +12,7 @@ from models import (
 )
 from datetime import date
 from database import db
+from search_index import backfill_normalized_names, rebuild_trigram_index
 
 
 def init_test_data(app):
@@ -456,4 +457,6 @@ def init_test_data(app):
             ]
         )
         db.session.flush()
+        backfill_normalized_names()
+        rebuild_trigram_index()
         db.session.commit()
\ No newline at end of file
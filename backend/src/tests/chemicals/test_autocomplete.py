@@ -0,0 +1,127 @@
+import json
+import time
+from sqlalchemy import insert
+from autocomplete import NameIndex, count_live_bottles, name_index
+from data_version import bump_shared_data_version
+from database import db
+from models import Chemical
+
+
+def test_name_index_prefix_ranges():
+    index = NameIndex()
+    for chemical_id, name in enumerate(
+        ["Sodium Chloride", "Sodium Hydroxide", "Sulfur", "Sodium Sulfate", "Soap"]
+    ):
+        index.add(chemical_id, name)
+    index.set_live_bottles({1: 5, 3: 2}, 0)
+
+    assert index.complete("sodium", 10) == [
+        (1, "Sodium Hydroxide", 5),
+        (3, "Sodium Sulfate", 2),
+        (0, "Sodium Chloride", 0),
+    ]
+    # Case and spaces are ignored, and the limit is respected
+    assert index.complete("SODIUM c", 10) == [(0, "Sodium Chloride", 0)]
+    assert index.complete("so", 2) == [
+        (1, "Sodium Hydroxide", 5),
+        (3, "Sodium Sulfate", 2),
+    ]
+    assert index.complete("x", 10) == []
+
+    index.add(4, "Potassium Soap")
+    index.remove(3)
+    assert [name for _, name, _ in index.complete("so", 10)] == [
+        "Sodium Hydroxide",
+        "Sodium Chloride",
+    ]
+    assert index.complete("potassium", 10) == [(4, "Potassium Soap", 0)]
+
+
+def test_autocomplete_matches_database(client):
+    response = client.get("/api/chemicals/autocomplete?prefix=a&limit=100")
+    assert response.status_code == 200
+    live_bottles = count_live_bottles()
+    expected = sorted(
+        (
+            -live_bottles.get(chem.Chemical_ID, 0),
+            chem.Chemical_Name.replace(" ", "").lower(),
+            chem.Chemical_ID,
+        )
+        for chem in db.session.query(Chemical)
+        if chem.Chemical_Name.lower().startswith("a")
+    )
+    assert len(expected) > 1
+    assert [chem["id"] for chem in response.json] == [key[2] for key in expected]
+    assert all(
+        chem["quantity"] == live_bottles.get(chem["id"], 0) for chem in response.json
+    )
+
+
+def test_autocomplete_requires_prefix(client):
+    assert client.get("/api/chemicals/autocomplete").status_code == 400
+    assert client.get("/api/chemicals/autocomplete?prefix=a&limit=0").status_code == 400
+
+
+def test_autocomplete_rejects_non_numeric_limit(client):
+    response = client.get("/api/chemicals/autocomplete?prefix=a&limit=abc")
+    assert response.status_code == 400
+    assert response.json["error"] == "Invalid limit"
+
+
+def test_autocomplete_follows_added_renamed_and_deleted_chemicals(client):
+    client.get("/api/chemicals/autocomplete?prefix=a")
+    response = client.post(
+        "/api/add_chemical",
+        data=json.dumps(
+            {
+                "chemical_name": "Zirconium Oxide",
+                "chemical_formula": "ZrO2",
+                "product_number": "Z100",
+                "storage_class_id": 1,
+                "manufacturer_id": 1,
+            }
+        ),
+        content_type="application/json",
+    )
+    chemical_id = response.json["chemical_id"]
+    names = lambda prefix: [
+        chem["chemical_name"]
+        for chem in client.get(f"/api/chemicals/autocomplete?prefix={prefix}").json
+    ]
+    assert names("zirc") == ["Zirconium Oxide"]
+
+    client.put(
+        f"/api/update_chemical/{chemical_id}",
+        data=json.dumps({"chemical_name": "Zirconia"}),
+        content_type="application/json",
+    )
+    assert names("zirc") == ["Zirconia"]
+
+    client.delete(f"/api/delete_chemical/{chemical_id}")
+    assert names("zirc") == []
+
+
+def test_autocomplete_follows_changes_made_outside_the_server(app, client):
+    app.config["DATA_VERSION_CHECK_INTERVAL"] = 0
+    client.get("/api/chemicals/autocomplete?prefix=a")
+    # As a command run in another process would, without telling the index
+    db.session.execute(
+        insert(Chemical).values(
+            Chemical_Name="Zirconium Oxide",
+            Alphabetical_Name="Zirconium Oxide",
+            Storage_Class_ID=1,
+        )
+    )
+    db.session.commit()
+    bump_shared_data_version()
+
+    response = client.get("/api/chemicals/autocomplete?prefix=zirc")
+    assert [chem["chemical_name"] for chem in response.json] == ["Zirconium Oxide"]
+
+
+def test_autocomplete_is_fast(app):
+    index = name_index()
+    start = time.perf_counter()
+    for _ in range(1000):
+        index.complete("ac", 10)
+    assert (time.perf_counter() - start) / 1000 < 0.001
@@ -0,0 +1,61 @@
+from database import db
+from models import Chemical, Inventory
+from sqlalchemy import insert
+
+
+def by_bottle_id(chemical):
+    return {
+        **chemical,
+        "inventory": sorted(chemical["inventory"], key=lambda bottle: bottle["id"]),
+    }
+
+
+def test_get_chemical(client):
+    chemical = db.session.query(Chemical).first()
+    expected = chemical.to_dict()
+
+    response = client.get(f"/api/chemicals/{chemical.Chemical_ID}")
+
+    assert response.status_code == 200
+    assert by_bottle_id(response.json) == by_bottle_id(expected)
+
+
+def test_get_chemical_not_found(client):
+    response = client.get("/api/chemicals/99999")
+    assert response.status_code == 404
+    assert response.json == {"error": "Chemical not found"}
+
+
+def test_get_chemical_query_count(client, large_inventory, query_counter):
+    # Give one chemical hundreds of bottles
+    chemical = db.session.get(Chemical, 10000)
+    chemical_manufacturer_id = chemical.Chemical_Manufacturers[
+        0
+    ].Chemical_Manufacturer_ID
+    sub_location_id = chemical.Chemical_Manufacturers[0].Inventory[0].Sub_Location_ID
+    db.session.execute(
+        insert(Inventory),
+        [
+            {
+                "Inventory_ID": 200000 + i,
+                "Sticker_Number": 200000 + i,
+                "Chemical_Manufacturer_ID": chemical_manufacturer_id,
+                "Sub_Location_ID": sub_location_id,
+                "Is_Dead": False,
+                "Who_Updated": "Synthetic",
+            }
+            for i in range(300)
+        ],
+    )
+    db.session.commit()
+    db.session.expunge_all()
+
+    with query_counter() as queries:
+        big = client.get("/api/chemicals/10000")
+    with query_counter() as small_queries:
+        small = client.get("/api/chemicals/10001")
+
+    assert len(big.json["inventory"]) == 310
+    assert len(small.json["inventory"]) == 10
+    # The chemical with its storage class, its manufacturers, its bottles with their locations
+    assert len(queries.statements) == len(small_queries.statements) == 3
@@ -0,0 +1,109 @@
+from database import db
+from models import Chemical, Chemical_Manufacturer, Inventory
+from sqlalchemy import insert, inspect
+
+
+def add_fully_dead_chemicals(count):
+    """
+    Adds chemicals whose bottles are all dead, each with 3 bottles.
+    """
+    bottle = db.session.query(Inventory).first()
+    manufacturer_id = bottle.Chemical_Manufacturer.Manufacturer_ID
+    chemicals, chemical_manufacturers, bottles = [], [], []
+    for i in range(count):
+        chemical_id = 20000 + i
+        chemicals.append(
+            {
+                "Chemical_ID": chemical_id,
+                "Chemical_Name": f"Used Up {i}",
+                "Alphabetical_Name": f"Used Up {i}",
+                "Storage_Class_ID": 1,
+            }
+        )
+        chemical_manufacturers.append(
+            {
+                "Chemical_Manufacturer_ID": chemical_id,
+                "Chemical_ID": chemical_id,
+                "Manufacturer_ID": manufacturer_id,
+            }
+        )
+        for j in range(3):
+            bottles.append(
+                {
+                    "Inventory_ID": 300000 + 3 * i + j,
+                    "Sticker_Number": 300000 + 3 * i + j,
+                    "Chemical_Manufacturer_ID": chemical_id,
+                    "Sub_Location_ID": bottle.Sub_Location_ID,
+                    "Is_Dead": True,
+                }
+            )
+    db.session.execute(insert(Chemical), chemicals)
+    db.session.execute(insert(Chemical_Manufacturer), chemical_manufacturers)
+    db.session.execute(insert(Inventory), bottles)
+    db.session.commit()
+
+
+def test_dead_false_only_returns_live_bottles(client):
+    full = {chem["id"]: chem for chem in client.get("/api/get_chemicals").json}
+    response = client.get("/api/get_chemicals?dead=false")
+    assert response.status_code == 200
+    for chem in response.json:
+        assert all(not bottle["dead"] for bottle in chem["inventory"])
+        assert chem["quantity"] == full[chem["id"]]["quantity"]
+        assert len(chem["inventory"]) == chem["quantity"]
+
+
+def test_dead_true_only_returns_dead_bottles(client):
+    full = {chem["id"]: chem for chem in client.get("/api/get_chemicals").json}
+    response = client.get("/api/get_chemicals?dead=True")
+    assert response.status_code == 200
+    assert response.json
+    for chem in response.json:
+        assert chem["inventory"]
+        assert all(bottle["dead"] for bottle in chem["inventory"])
+        # Still the number of live bottles
+        assert chem["quantity"] == full[chem["id"]]["quantity"] > 0
+
+
+def test_dead_filter_in_every_format(client):
+    full = client.get("/api/get_chemicals?dead=true").json
+    sparse = client.get("/api/get_chemicals?dead=true&fields=quantity").json
+    assert sparse == [{"id": chem["id"], "quantity": chem["quantity"]} for chem in full]
+    compact = client.get("/api/get_chemicals?dead=true&format=compact").json
+    assert [chem[0] for chem in compact["chemicals"]] == [chem["id"] for chem in full]
+
+
+def test_invalid_dead_filter(client):
+    response = client.get("/api/get_chemicals?dead=yes")
+    assert response.status_code == 400
+
+
+def test_chemicals_without_live_bottles_are_not_read(client, query_counter):
+    add_fully_dead_chemicals(200)
+    in_stock_bottles = (
+        db.session.query(Inventory)
+        .join(Inventory.Chemical_Manufacturer)
+        .filter(
+            Chemical_Manufacturer.Chemical_ID.in_(
+                db.session.query(Chemical_Manufacturer.Chemical_ID)
+                .join(Chemical_Manufacturer.Inventory)
+                .filter(Inventory.Is_Dead.is_(False))
+            )
+        )
+        .count()
+    )
+
+    with query_counter() as queries:
+        response = client.get("/api/get_chemicals")
+
+    assert not any(chem["id"] >= 20000 for chem in response.json)
+    assert len(queries.statements) == 1
+    assert queries.rows == in_stock_bottles
+
+
+def test_live_bottle_index(app):
+    indexes = {
+        index["name"]: index for index in inspect(db.engine).get_indexes("Inventory")
+    }
+    index = indexes["ix_Inventory_Chemical_Manufacturer_ID_Is_Dead"]
+    assert index["column_names"] == ["Chemical_Manufacturer_ID", "Is_Dead"]
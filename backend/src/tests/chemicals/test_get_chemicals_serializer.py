@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+from database import db
+from inventory_rows import group_inventory_rows, inventory_row_query
+from models import Chemical, Chemical_Manufacturer, Inventory, Sub_Location
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+
+
+def to_dict_chemicals():
+    """
+    The previous get_chemicals serializer: every chemical hydrated and converted with to_dict().
+    """
+    chemicals = (
+        db.session.query(Chemical)
+        .options(
+            joinedload(Chemical.Storage_Class),
+            joinedload(Chemical.Chemical_Manufacturers)
+            .joinedload(Chemical_Manufacturer.Inventory)
+            .joinedload(Inventory.Sub_Location)
+            .joinedload(Sub_Location.Location),
+            joinedload(Chemical.Chemical_Manufacturers).joinedload(
+                Chemical_Manufacturer.Manufacturer
+            ),
+        )
+        .order_by(Chemical.Sort_Key, Chemical.Chemical_ID)
+        .all()
+    )
+    chemical_list = [chem.to_dict() for chem in chemicals]
+    # The flat serializer only sees chemicals with bottles
+    return [chem for chem in chemical_list if chem["inventory"]]
+
+
+def flat_chemicals():
+    return group_inventory_rows(inventory_row_query().all())
+
+
+@contextmanager
+def materialized():
+    """
+    Count what a block reads: the columns of every query's rows, and the model
+    objects loaded from them. Deterministic, unlike timing the two serializers.
+    """
+    counts = {"columns": 0, "objects": 0}
+
+    def count_columns(conn, cursor, statement, parameters, context, executemany):
+        counts["columns"] += len(cursor.description or ())
+
+    def count_object(target, context):
+        counts["objects"] += 1
+
+    db.session.expunge_all()
+    event.listen(db.engine, "after_cursor_execute", count_columns)
+    event.listen(db.Model, "load", count_object, propagate=True)
+    try:
+        yield counts
+    finally:
+        event.remove(db.engine, "after_cursor_execute", count_columns)
+        event.remove(db.Model, "load", count_object)
+
+
+def by_id(chemical_list):
+    """
+    Bottles of a chemical with several manufacturers may be listed in a different
+    order, so compare them by id.
+    """
+    return {
+        chem["id"]: {
+            **chem,
+            "inventory": sorted(chem["inventory"], key=lambda inv: inv["id"]),
+        }
+        for chem in chemical_list
+    }
+
+
+def test_flat_serializer_matches_to_dict(app, large_inventory):
+    flat = flat_chemicals()
+    assert [chem["id"] for chem in flat] == [chem["id"] for chem in to_dict_chemicals()]
+    assert by_id(flat) == by_id(to_dict_chemicals())
+    assert sum(len(chem["inventory"]) for chem in flat) >= large_inventory
+
+
+def test_get_chemicals_returns_flat_serializer_output(client, large_inventory):
+    response = client.get("/api/get_chemicals")
+    assert response.status_code == 200
+    assert response.json == [chem for chem in flat_chemicals() if chem["quantity"] > 0]
+
+
+def test_flat_serializer_reads_less_than_to_dict(app, large_inventory):
+    with materialized() as flat:
+        flat_chemicals()
+    with materialized() as orm:
+        to_dict_chemicals()
+    # No model objects are built, and only the columns the JSON needs are read
+    assert flat["objects"] == 0
+    assert orm["objects"] > large_inventory
+    assert flat["columns"] * 2 < orm["columns"]
@@ -1,7 +1,43 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
 import pytest
+from flask.testing import FlaskClient
 from app import create_app
 from config import TestingConfig
 from testdata import init_test_data
+from database import db
+from models import (
+    Chemical,
+    Chemical_Manufacturer,
+    Inventory,
+    Manufacturer,
+    Storage_Class,
+    Sub_Location,
+)
+from search_index import backfill_normalized_names
+from sqlalchemy import event, insert
+
+# Synonyms served by the stand-in PubChem server, keyed by lowercase name
+PUBCHEM_SYNONYMS = {
+    "acetone": ["Acetone", "2-Propanone", "Dimethyl ketone", "Propanone"],
+    "table salt": ["Sodium chloride", "Halite", "NaCl"],
+}
+
+
+class BufferedClient(FlaskClient):
+    """
+    A test client that reads streamed responses to the end straight away, like a
+    server would, so a response's generator is done before the next request starts.
+    """
+
+    def open(self, *args, **kwargs):
+        kwargs.setdefault("buffered", True)
+        return super().open(*args, **kwargs)
+
 
 @pytest.fixture(scope="function")
 def app():
@@ -9,6 +45,162 @@ def app():
     This fixture will create a Flask app with the testing configuration
     """
     testing_app = create_app(TestingConfig)
+    testing_app.test_client_class = BufferedClient
     init_test_data(testing_app)
     with testing_app.app_context():
         yield testing_app
+
+
+class StandInPubChem(list):
+    """
+    The names the stand-in PubChem server was asked about.
+    Set delay (seconds) to make it slow, or status to make it fail.
+    """
+
+    delay = 0
+    status = None
+
+
+@pytest.fixture(scope="function")
+def pubchem(app):
+    """
+    A local stand-in for the PubChem synonyms API.
+    Points the app at it and yields a StandInPubChem.
+    """
+    requested = StandInPubChem()
+
+    class PubChemHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # /substance/name/<name>/synonyms/json
+            name = unquote(self.path.split("/")[3])
+            requested.append(name)
+            time.sleep(requested.delay)
+            synonyms = PUBCHEM_SYNONYMS.get(name.lower())
+            if requested.status:
+                status = requested.status
+                body = {"Fault": {"Code": "PUGREST.ServerBusy"}}
+            elif synonyms:
+                status = 200
+                body = {
+                    "InformationList": {
+                        "Information": [{"SID": 1, "Synonym": synonyms}]
+                    }
+                }
+            else:
+                status = 404
+                body = {"Fault": {"Code": "PUGREST.NotFound"}}
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps(body).encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PubChemHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    app.config["PUBCHEM_URL"] = f"http://127.0.0.1:{server.server_port}"
+    yield requested
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope="function")
+def large_inventory(app):
+    """
+    Adds 500 chemicals to the test data, each with 2 manufacturers and 10 bottles
+    (every third one dead) spread over the existing sub-locations.
+    :return: The number of bottles added.
+    """
+    storage_class_ids = [
+        row[0] for row in db.session.query(Storage_Class.Storage_Class_ID)
+    ]
+    manufacturer_ids = [
+        row[0] for row in db.session.query(Manufacturer.Manufacturer_ID)
+    ]
+    sub_location_ids = [
+        row[0] for row in db.session.query(Sub_Location.Sub_Location_ID)
+    ]
+
+    chemicals, chemical_manufacturers, bottles = [], [], []
+    for i in range(500):
+        chemical_id = 10000 + i
+        chemicals.append(
+            {
+                "Chemical_ID": chemical_id,
+                "Chemical_Name": f"Synthetic Compound {i}",
+                "Alphabetical_Name": f"Synthetic Compound {i}",
+                "Chemical_Formula": f"C{i}H{i}",
+                "Storage_Class_ID": storage_class_ids[i % len(storage_class_ids)],
+            }
+        )
+        for j in range(2):
+            chemical_manufacturer_id = 2 * chemical_id + j
+            chemical_manufacturers.append(
+                {
+                    "Chemical_Manufacturer_ID": chemical_manufacturer_id,
+                    "Chemical_ID": chemical_id,
+                    "Manufacturer_ID": manufacturer_ids[
+                        (i + j) % len(manufacturer_ids)
+                    ],
+                    "Product_Number": f"SYN-{i}-{j}",
+                }
+            )
+            for k in range(5):
+                sticker = 100000 + len(bottles)
+                bottles.append(
+                    {
+                        "Inventory_ID": sticker,
+                        "Sticker_Number": sticker,
+                        "Chemical_Manufacturer_ID": chemical_manufacturer_id,
+                        "Sub_Location_ID": sub_location_ids[
+                            len(bottles) % len(sub_location_ids)
+                        ],
+                        "Is_Dead": len(bottles) % 3 == 0,
+                        "Who_Updated": "Synthetic",
+                    }
+                )
+    db.session.execute(insert(Chemical), chemicals)
+    db.session.execute(insert(Chemical_Manufacturer), chemical_manufacturers)
+    db.session.execute(insert(Inventory), bottles)
+    backfill_normalized_names()
+    db.session.commit()
+    return len(bottles)
+
+
+class QueryCounter:
+    """
+    While active, counts the SELECT statements run and the rows and values they return.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.rows = 0
+        self.values = 0
+
+    def count(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith("SELECT"):
+            return
+        self.statements.append(statement)
+        # Run it again on the side, the real cursor's rows belong to the caller
+        recount = conn.connection.cursor()
+        rows = recount.execute(statement, parameters).fetchall()
+        self.rows += len(rows)
+        self.values += len(rows) * len(recount.description)
+        recount.close()
+
+    def __enter__(self):
+        event.listen(db.engine, "after_cursor_execute", self.count)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(db.engine, "after_cursor_execute", self.count)
+
+
+@pytest.fixture(scope="function")
+def query_counter(app):
+    """
+    Use as "with query_counter() as queries:" to count the queries run in the block.
+    """
+    return QueryCounter
@@ -0,0 +1,142 @@
+from changes import record_changes
+from database import db
+from models import Chemical, Chemical_Manufacturer, Inventory, Sub_Location
+
+
+def current_version(client):
+    response = client.get("/api/inventory/changes")
+    assert response.status_code == 200
+    assert response.json["bottles"] == []
+    return response.json["version"]
+
+
+def changes_since(client, version):
+    response = client.get(f"/api/inventory/changes?since={version}")
+    assert response.status_code == 200
+    return response.json
+
+
+def test_no_changes(client):
+    version = current_version(client)
+    changes = changes_since(client, version)
+    assert changes == {
+        "version": version,
+        "chemicals": [],
+        "bottles": [],
+        "deleted": {"chemicals": [], "bottles": []},
+    }
+
+
+def test_marking_a_bottle_dead(client):
+    bottle = db.session.query(Inventory).filter_by(Is_Dead=False).first()
+    chemical_id = bottle.Chemical_Manufacturer.Chemical_ID
+    version = current_version(client)
+
+    client.post("/api/chemicals/mark_dead", json={"inventory_id": bottle.Inventory_ID})
+
+    changes = changes_since(client, version)
+    assert changes["version"] > version
+    assert [b["id"] for b in changes["bottles"]] == [bottle.Inventory_ID]
+    assert changes["bottles"][0]["dead"] is True
+    assert changes["bottles"][0]["chemical_id"] == chemical_id
+    assert [c["id"] for c in changes["chemicals"]] == [chemical_id]
+    # The quantity matches the full listing
+    full = db.session.get(Chemical, chemical_id).to_dict()
+    assert changes["chemicals"][0]["quantity"] == full["quantity"]
+
+    # Nothing more has changed since then
+    assert changes_since(client, changes["version"])["bottles"] == []
+
+
+def test_renaming_a_location_changes_its_bottles(client):
+    sub_location = db.session.query(Sub_Location).first()
+    location_id = sub_location.Location_ID
+    bottles_there = {
+        bottle.Inventory_ID
+        for bottle in db.session.query(Inventory)
+        .join(Inventory.Sub_Location)
+        .filter(Sub_Location.Location_ID == location_id)
+    }
+    assert bottles_there
+    version = current_version(client)
+
+    response = client.put(
+        f"/api/locations/{location_id}",
+        json={"building": "Renamed Hall", "room": "1"},
+    )
+    assert response.status_code == 200
+
+    changes = changes_since(client, version)
+    assert {bottle["id"] for bottle in changes["bottles"]} == bottles_there
+    assert {bottle["location"] for bottle in changes["bottles"]} == {"Renamed Hall 1"}
+    # A chemical's own fields didn't change
+    assert changes["chemicals"] == []
+
+
+def test_deleting_a_chemical_leaves_tombstones(client):
+    chemical = db.session.query(Chemical).join(Chemical.Chemical_Manufacturers).first()
+    chemical_id = chemical.Chemical_ID
+    bottle_ids = sorted(
+        bottle.Inventory_ID
+        for bottle in db.session.query(Inventory)
+        .join(Inventory.Chemical_Manufacturer)
+        .filter(Chemical_Manufacturer.Chemical_ID == chemical_id)
+    )
+    version = current_version(client)
+
+    assert client.delete(f"/api/delete_chemical/{chemical_id}").status_code == 200
+
+    changes = changes_since(client, version)
+    assert changes["deleted"] == {"chemicals": [chemical_id], "bottles": bottle_ids}
+    assert changes["chemicals"] == []
+    assert changes["bottles"] == []
+
+
+def test_msds_changes_are_recorded(client):
+    bottle = db.session.query(Inventory).filter(Inventory.MSDS == None).first()
+    version = current_version(client)
+
+    client.post("/api/add_msds", json={"inventory_id": bottle.Inventory_ID})
+
+    changes = changes_since(client, version)
+    assert [b["id"] for b in changes["bottles"]] == [bottle.Inventory_ID]
+    assert changes["bottles"][0]["msds"] is True
+
+
+def test_rolled_back_changes_are_not_recorded(client):
+    version = current_version(client)
+    bottle = db.session.query(Inventory).first()
+    bottle.Is_Dead = not bottle.Is_Dead
+    db.session.flush()
+    db.session.rollback()
+    assert current_version(client) == version
+
+
+def test_changes_committed_later_get_a_newer_version(client):
+    first, second = db.session.query(Inventory).filter_by(Is_Dead=False).limit(2)
+    first_id = first.Inventory_ID
+    second_id = second.Inventory_ID
+    version = current_version(client)
+
+    # Another session changes the first bottle, but hasn't committed yet
+    other = db.session.session_factory()
+    record_changes(other, set(), {first_id})
+
+    # Meanwhile the second bottle's change is committed, and a client syncs
+    client.post("/api/chemicals/mark_dead", json={"inventory_id": second_id})
+    changes = changes_since(client, version)
+    assert [bottle["id"] for bottle in changes["bottles"]] == [second_id]
+    seen = changes["version"]
+
+    # The first bottle's change commits after the client has seen the second's
+    other.commit()
+    other.close()
+    changes = changes_since(client, seen)
+    assert changes["version"] > seen
+    assert [bottle["id"] for bottle in changes["bottles"]] == [first_id]
+
+
+def test_invalid_since(client):
+    assert client.get("/api/inventory/changes?since=abc").status_code == 400
+    version = current_version(client)
+    assert client.get(f"/api/inventory/changes?since={version + 1}").status_code == 410
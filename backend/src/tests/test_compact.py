@@ -0,0 +1,131 @@
+import gzip
+import json
+from compact import BOTTLE_FIELDS, compact_inventory_rows
+from inventory_rows import group_inventory_rows, inventory_row_query
+
+
+def expand(payload):
+    """
+    Decode a compact response back into the full format, as a client would.
+    """
+    locations = payload["locations"]
+    sub_locations = payload["sub_locations"]
+    manufacturers = payload["manufacturers"]
+    storage_classes = payload["storage_classes"]
+    chemical_list = []
+    for chemical_id, name, formula, storage_class, quantity, bottles in payload[
+        "chemicals"
+    ]:
+        inventory = []
+        for bottle in bottles:
+            bottle = dict(zip(BOTTLE_FIELDS, bottle))
+            sub_location_id, sub_location, location = sub_locations[
+                bottle["sub_location"]
+            ]
+            manufacturer_id, manufacturer = manufacturers[bottle["manufacturer"]]
+            inventory.append(
+                {
+                    "id": bottle["id"],
+                    "sticker": bottle["sticker"],
+                    "product_number": bottle["product_number"],
+                    "sub_location": sub_location,
+                    "sub_location_id": sub_location_id,
+                    "location": locations[location][1],
+                    "location_id": locations[location][0],
+                    "manufacturer": manufacturer,
+                    "manufacturer_id": manufacturer_id,
+                    "dead": bool(bottle["dead"]),
+                    "msds": bool(bottle["msds"]),
+                    "last_updated": bottle["last_updated"],
+                    "who_updated": bottle["who_updated"],
+                }
+            )
+        chemical_list.append(
+            {
+                "id": chemical_id,
+                "chemical_name": name,
+                "formula": formula,
+                "storage_class": (
+                    storage_classes[storage_class][1]
+                    if storage_class is not None
+                    else None
+                ),
+                "storage_class_id": (
+                    storage_classes[storage_class][0]
+                    if storage_class is not None
+                    else None
+                ),
+                "inventory": inventory,
+                "quantity": quantity,
+            }
+        )
+    return chemical_list
+
+
+def test_get_chemicals_compact_matches_full(client):
+    full = client.get("/api/get_chemicals")
+    compact = client.get("/api/get_chemicals?format=compact")
+    assert compact.status_code == 200
+    assert compact.json["format"] == "compact"
+    assert expand(compact.json) == full.json
+
+
+def test_get_chemicals_compact_dead_filter(client):
+    full = client.get("/api/get_chemicals?dead=true")
+    compact = client.get("/api/get_chemicals?dead=true&format=compact")
+    assert expand(compact.json) == full.json
+
+
+def test_get_chemicals_invalid_format(client):
+    response = client.get("/api/get_chemicals?format=xml")
+    assert response.status_code == 400
+
+
+def test_search_compact_matches_full(client):
+    for params in ["query=acid", "room=1", "query=water&room=1", ""]:
+        full = client.get(f"/api/search?{params}")
+        compact = client.get(f"/api/search?{params}&format=compact")
+        assert compact.status_code == 200
+        assert expand(compact.json) == full.json
+
+
+def test_search_compact_pages(client):
+    full = client.get("/api/search?room=1&limit=2").json
+    compact = client.get("/api/search?room=1&limit=2&format=compact").json
+    assert expand(compact["results"]) == full["results"]
+    assert compact["total"] == full["total"]
+    assert compact["next_cursor"] == full["next_cursor"]
+
+
+def test_search_invalid_format(client):
+    response = client.get("/api/search?query=water&format=xml")
+    assert response.status_code == 400
+
+
+def encoded_strings(value):
+    """
+    Count the strings, keys included, JSON encoding has to escape and copy.
+    Most of the time spent encoding goes to them, and unlike timing, the count
+    doesn't depend on the machine.
+    """
+    if isinstance(value, str):
+        return 1
+    if isinstance(value, dict):
+        return sum(1 + encoded_strings(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(encoded_strings(item) for item in value)
+    return 0
+
+
+def test_compact_is_smaller_and_cheaper_to_encode(app, large_inventory):
+    rows = inventory_row_query().all()
+    full = group_inventory_rows(rows)
+    compact = compact_inventory_rows(rows)
+    full_json = json.dumps(full)
+    compact_json = json.dumps(compact)
+    assert len(compact_json) * 3 < len(full_json)
+    # Still smaller once compressed, as it would be sent with gzip
+    assert len(gzip.compress(compact_json.encode())) < len(
+        gzip.compress(full_json.encode())
+    )
+    assert encoded_strings(compact) * 3 < encoded_strings(full)
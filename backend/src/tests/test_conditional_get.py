@@ -0,0 +1,58 @@
+import pytest
+
+CONDITIONAL_ENDPOINTS = [
+    "/api/get_chemicals",
+    "/api/locations",
+    "/api/manufacturers",
+    "/api/storage_classes",
+]
+
+
+@pytest.mark.parametrize("url", CONDITIONAL_ENDPOINTS)
+def test_unchanged_data_is_not_sent_again(client, query_counter, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert not etag.startswith("W/")
+
+    with query_counter() as queries:
+        cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+    assert cached.headers["ETag"] == etag
+    assert queries.statements == []
+
+
+@pytest.mark.parametrize("url", CONDITIONAL_ENDPOINTS)
+def test_changed_data_is_sent(client, url):
+    etag = client.get(url).headers["ETag"]
+    response = client.post("/api/storage_classes/", json={"name": "New Storage Class"})
+    assert response.status_code == 201
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_query_string_changes_etag(client):
+    full = client.get("/api/get_chemicals")
+    compact = client.get(
+        "/api/get_chemicals?format=compact",
+        headers={"If-None-Match": full.headers["ETag"]},
+    )
+    assert compact.status_code == 200
+    assert compact.headers["ETag"] != full.headers["ETag"]
+
+
+def test_errors_have_no_etag(client):
+    response = client.get("/api/get_chemicals?format=xml")
+    assert response.status_code == 400
+    assert "ETag" not in response.headers
+
+
+def test_restart_changes_etag(client, app):
+    etag = client.get("/api/locations").headers["ETag"]
+    # A restarted app counts from 0 again
+    del app.extensions["data_version"]
+    response = client.get("/api/locations", headers={"If-None-Match": etag})
+    assert response.status_code == 200
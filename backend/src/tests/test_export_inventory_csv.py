@@ -1,3 +1,9 @@
+import gzip
+import json
+from csv_export import iter_csv
+from models import Storage_Class
+
+
 def test_export_inventory_csv(client):
     # Send GET request to the API endpoint
     response = client.get("/api/export_inventory_csv")
@@ -54,3 +60,122 @@ def test_export_inventory_csv(client):
         "9001,Copper(II) Sulfate,Science Hall 104,Prep Table,,,Toxic,Copper(II) Sulfate,CuSO4 (Copper(II) Sulfate),2025-05-15,Dr. Indigo,1.0,0.5,Honeywell,C008,7758-98-7,,False",
         "10001,Ammonia,Science Hall 103,Stockroom Shelf,,,Toxic,Ammonia,NH3 (Ammonia),2025-06-06,Bob,1.0,1.0,BDB,A009,7664-41-7,,False",
     ]
+
+
+def test_iter_csv_chunks():
+    rows = [["a", "b,c"], [1, None]] * 10
+    chunks = list(iter_csv(rows, chunk_size=16))
+    assert len(chunks) > 1
+    assert "".join(chunks) == 'a,"b,c"\r\n1,\r\n' * 10
+
+
+def test_export_inventory_csv_is_streamed(client, large_inventory):
+    response = client.get("/api/export_inventory_csv", buffered=False)
+    assert response.status_code == 200
+    assert response.is_streamed
+
+    chunks = [chunk.decode("utf-8") for chunk in response.response]
+    response.close()
+    # Sent in pieces rather than all at once
+    assert len(chunks) > 1
+    lines = "".join(chunks).splitlines()
+    assert lines[0].startswith("Sticker Number,")
+    # The 11 bottles in the test data plus the large inventory
+    assert len(lines) == 1 + 11 + large_inventory
+
+
+def export_queries(client, query_counter):
+    with query_counter() as queries:
+        response = client.get("/api/export_inventory_csv")
+    assert response.status_code == 200
+    return len(queries.statements), len(response.data.splitlines())
+
+
+def test_export_inventory_csv_query_count(request, client, query_counter):
+    small_queries, small_lines = export_queries(client, query_counter)
+    assert small_queries == 1
+    assert small_lines == 12
+
+    # Not one query per bottle, or per related row
+    request.getfixturevalue("large_inventory")
+    large_queries, large_lines = export_queries(client, query_counter)
+    assert large_lines > small_lines
+    assert large_queries == small_queries
+
+
+def export_lines(client, query):
+    response = client.get(f"/api/export_inventory_csv?{query}")
+    assert response.status_code == 200
+    return response.data.decode("utf-8").splitlines()[1:]
+
+
+def test_export_inventory_csv_filters(client):
+    live = export_lines(client, "dead=false")
+    dead = export_lines(client, "dead=true")
+    assert len(live) == 9
+    assert all(line.endswith(",False") for line in live)
+    assert [line.split(",")[0] for line in dead] == ["1002", "5001"]
+
+    room = export_lines(client, "location=1")
+    assert room and all(",Science Hall 101," in line for line in room)
+    assert export_lines(client, "building=Science%20Hall") == export_lines(client, "")
+    assert export_lines(client, "building=Nowhere") == []
+
+    storage_class_id = (
+        Storage_Class.query.filter_by(Storage_Class_Name="Corrosive")
+        .one()
+        .Storage_Class_ID
+    )
+    corrosive = export_lines(client, f"storage_class={storage_class_id}")
+    assert corrosive and all(",Corrosive," in line for line in corrosive)
+
+    # Filters combine
+    assert export_lines(client, "location=1&dead=true") == [
+        line for line in dead if ",Science Hall 101," in line
+    ]
+
+
+def test_export_inventory_csv_invalid_filters(client):
+    for query in ("location=999999", "dead=maybe", "format=xml", "compress=zip"):
+        response = client.get(f"/api/export_inventory_csv?{query}")
+        assert response.status_code == 400
+        assert response.json["error"] == "Invalid request parameters"
+
+
+def test_export_inventory_ndjson(client):
+    response = client.get("/api/export_inventory_csv?format=ndjson")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    assert "inventory_report.ndjson" in response.headers["Content-Disposition"]
+
+    bottles = [json.loads(line) for line in response.data.decode("utf-8").splitlines()]
+    assert len(bottles) == 11
+    assert bottles[0] == {
+        "sticker_number": 1001,
+        "chemical": "Acetone",
+        "location": "Science Hall 101",
+        "sub_location": "Shelf A",
+        "msds": None,
+        "comment": None,
+        "storage_class": "Flammable",
+        "alphabetized_by": "Acetone",
+        "formula_and_name": "C3H6O (Acetone)",
+        "last_updated": "2025-03-06",
+        "who_updated": "Anne",
+        "quantity": 1.0,
+        "minimum_needed": 2.0,
+        "manufacturer": "Fisher Scientific",
+        "product_number": "A123",
+        "cas_number": "67-64-1",
+        "barcode": None,
+        "dead": False,
+    }
+
+
+def test_export_inventory_gzip(client):
+    plain = client.get("/api/export_inventory_csv?dead=false").data
+    response = client.get("/api/export_inventory_csv?dead=false&compress=gzip")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/gzip"
+    assert "inventory_report.csv.gz" in response.headers["Content-Disposition"]
+    assert gzip.decompress(response.data) == plain
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+import pytest
+from data_version import bump_data_version
+from export_jobs import artifact_version, export_job_runner, is_newer_version
+
+
+@pytest.fixture
+def export_dir(app, tmp_path):
+    app.config["EXPORT_DIR"] = str(tmp_path)
+    return tmp_path
+
+
+def wait_for(client, job_id):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/export_jobs/{job_id}").json
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Export job {job_id} didn't finish")
+
+
+def test_export_job(client, export_dir):
+    response = client.post("/api/export_jobs")
+    assert response.status_code == 202
+    job = wait_for(client, response.json["id"])
+    assert job["status"] == "done"
+
+    download = client.get(f"/api/export_jobs/{job['id']}/download")
+    assert download.status_code == 200
+    assert download.headers["Content-Type"].startswith("text/csv")
+    assert "inventory_report.csv" in download.headers["Content-Disposition"]
+    assert download.data == client.get("/api/export_inventory_csv").data
+    download.close()
+
+
+def test_unchanged_export_is_served_from_disk(client, export_dir, query_counter):
+    first = client.post("/api/export_jobs").json
+    wait_for(client, first["id"])
+
+    with query_counter() as queries:
+        second = client.post("/api/export_jobs")
+        download = client.get(f"/api/export_jobs/{second.json['id']}/download")
+    assert second.status_code == 200
+    assert second.json["status"] == "done"
+    assert download.status_code == 200
+    download.close()
+    assert queries.statements == []
+    assert len(os.listdir(export_dir)) == 1
+
+
+def test_changed_data_builds_new_export(client, export_dir):
+    first = client.post("/api/export_jobs").json
+    wait_for(client, first["id"])
+
+    bump_data_version()
+    second = client.post("/api/export_jobs")
+    assert second.status_code == 202
+    assert wait_for(client, second.json["id"])["status"] == "done"
+
+    # The older file is gone
+    files = os.listdir(export_dir)
+    assert len(files) == 1
+    assert files[0].startswith(f"inventory_{artifact_version()}_")
+    assert client.get(f"/api/export_jobs/{first['id']}/download").status_code == 410
+
+
+def test_export_job_in_progress(app, client, export_dir):
+    started = threading.Event()
+    release = threading.Event()
+
+    def build(file):
+        started.set()
+        release.wait(10)
+        file.write(b"done")
+
+    runner = export_job_runner()
+    job = runner.start(app, artifact_version(), build)
+    assert started.wait(10)
+    # Starting the same export again joins the running job
+    assert runner.start(app, artifact_version(), build) is job
+    assert client.get(f"/api/export_jobs/{job.id}").json["status"] == "running"
+    assert client.get(f"/api/export_jobs/{job.id}/download").status_code == 409
+
+    release.set()
+    assert wait_for(client, job.id)["status"] == "done"
+    download = client.get(f"/api/export_jobs/{job.id}/download")
+    assert download.data == b"done"
+    download.close()
+
+
+def test_failed_export_job(app, client, export_dir):
+    def build(file):
+        raise RuntimeError("Database went away")
+
+    job = export_job_runner().start(app, artifact_version(), build)
+    finished = wait_for(client, job.id)
+    assert finished["status"] == "failed"
+    assert finished["error"] == "Failed to export inventory"
+    assert os.listdir(export_dir) == []
+    assert client.get(f"/api/export_jobs/{job.id}/download").status_code == 409
+
+
+def test_export_started_at_an_older_version(app, client, export_dir):
+    def build(file):
+        file.write(b"export")
+
+    runner = export_job_runner()
+    older = artifact_version()
+    bump_data_version()
+    newer = runner.start(app, artifact_version(), build)
+    assert wait_for(client, newer.id)["status"] == "done"
+
+    # A request that read the version before the bump is started after it
+    stale = runner.start(app, older, build)
+    assert wait_for(client, stale.id)["status"] == "done"
+    # The newer file is kept
+    download = client.get(f"/api/export_jobs/{newer.id}/download")
+    assert download.status_code == 200
+    download.close()
+    assert client.get(f"/api/export_jobs/{stale.id}/download").status_code == 410
+
+
+def test_is_newer_version():
+    assert is_newer_version("abcd-2", None)
+    assert is_newer_version("abcd-10", "abcd-9")
+    assert not is_newer_version("abcd-9", "abcd-10")
+    assert not is_newer_version("abcd-9", "abcd-9")
+    # After a restart
+    assert is_newer_version("ef01-1", "abcd-9")
+
+
+def test_unknown_export_job(client, export_dir):
+    assert client.get("/api/export_jobs/missing").status_code == 404
+    assert client.get("/api/export_jobs/missing/download").status_code == 404
+
+
+def test_export_jobs_with_parameters(client, export_dir):
+    everything = client.post("/api/export_jobs").json
+    wait_for(client, everything["id"])
+    dead = client.post("/api/export_jobs?dead=true&format=ndjson")
+    # Not the same export, so it's built too
+    assert dead.status_code == 202
+    wait_for(client, dead.json["id"])
+    assert len(os.listdir(export_dir)) == 2
+
+    download = client.get(f"/api/export_jobs/{dead.json['id']}/download")
+    assert download.headers["Content-Type"] == "application/x-ndjson"
+    assert "inventory_report.ndjson" in download.headers["Content-Disposition"]
+    assert download.data == (
+        client.get("/api/export_inventory_csv?dead=true&format=ndjson").data
+    )
+    download.close()
+
+    assert client.post("/api/export_jobs?format=xml").status_code == 400
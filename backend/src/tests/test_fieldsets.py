@@ -0,0 +1,90 @@
+import pytest
+from database import db
+from fieldsets import Fieldset
+from inventory_rows import group_inventory_rows, inventory_row_query
+
+
+def sparse(chemical_list, chemical_fields, bottle_fields=None):
+    """
+    Cut full chemicals down to the chosen fields.
+    """
+    result = []
+    for chem in chemical_list:
+        sparse_chem = {"id": chem["id"]}
+        sparse_chem.update({name: chem[name] for name in chemical_fields})
+        if bottle_fields is not None:
+            sparse_chem["inventory"] = [
+                {name: bottle[name] for name in bottle_fields}
+                for bottle in chem["inventory"]
+            ]
+        result.append(sparse_chem)
+    return result
+
+
+def test_parse():
+    fieldset = Fieldset.parse("chemical_name, quantity,inventory.sticker,id")
+    assert fieldset.chemical_fields == ["chemical_name"]
+    assert fieldset.with_quantity
+    assert fieldset.bottle_fields == ["sticker"]
+    assert len(Fieldset.parse("inventory").bottle_fields) == 13
+    for value in ["", "colour", "inventory.colour", ","]:
+        with pytest.raises(ValueError):
+            Fieldset.parse(value)
+
+
+def test_chemical_fields_only_read_one_row_per_chemical(app, query_counter):
+    full = group_inventory_rows(inventory_row_query().all())
+    fieldset = Fieldset.parse("chemical_name,formula,quantity")
+    with query_counter() as queries:
+        chemical_list = fieldset.group(fieldset.query().all())
+    assert chemical_list == sparse(full, ["chemical_name", "formula", "quantity"])
+    assert queries.rows == len(full)
+    # Chemical_ID, the live count, name and formula
+    assert queries.values == 4 * len(full)
+
+
+def test_bottle_fields(app):
+    full = group_inventory_rows(inventory_row_query().all())
+    fieldset = Fieldset.parse("chemical_name,inventory.location,inventory.last_updated")
+    assert fieldset.group(fieldset.query().all()) == sparse(
+        full, ["chemical_name"], ["location", "last_updated"]
+    )
+    # Only the columns for the fields (and the id and dead flag) are selected
+    assert len(fieldset.columns) == 2 + 1 + 2 + 1
+
+
+def test_get_chemicals_fields(client):
+    full = client.get("/api/get_chemicals").json
+    response = client.get("/api/get_chemicals?fields=chemical_name,quantity")
+    assert response.status_code == 200
+    assert response.json == sparse(full, ["chemical_name", "quantity"])
+
+    response = client.get("/api/get_chemicals?fields=inventory.sticker&dead=true")
+    assert response.json == sparse(
+        client.get("/api/get_chemicals?dead=true").json, [], ["sticker"]
+    )
+
+
+def test_get_chemicals_invalid_fields(client):
+    assert client.get("/api/get_chemicals?fields=colour").status_code == 400
+    response = client.get("/api/get_chemicals?fields=chemical_name&format=compact")
+    assert response.status_code == 400
+
+
+def test_search_fields(client):
+    for params in ["query=acid", "room=1", "room=1&limit=2"]:
+        full = client.get(f"/api/search?{params}").json
+        response = client.get(f"/api/search?{params}&fields=formula,inventory.dead")
+        assert response.status_code == 200
+        if "limit" in params:
+            assert response.json["next_cursor"] == full["next_cursor"]
+            full, sparse_results = full["results"], response.json["results"]
+        else:
+            sparse_results = response.json
+        assert sparse_results == sparse(full, ["formula"], ["dead"])
+
+
+def test_search_invalid_fields(client):
+    response = client.get("/api/search?query=acid&fields=colour")
+    assert response.status_code == 400
+    assert "fields" in response.json["details"]
@@ -0,0 +1,198 @@
+import io
+import json
+from models import Chemical, Chemical_Manufacturer, Inventory, Inventory_Change
+
+HEADER = "Sticker Number,Chemical,Location,Sub-Location,Manufacturer,Storage Class,Dead?,Last Updated,Who Updated\n"
+
+
+def post_import(client, body, file_name="inventory.csv", query=""):
+    return client.post(
+        f"/api/import_inventory{query}",
+        data={"file": (io.BytesIO(body.encode("utf-8")), file_name)},
+        content_type="multipart/form-data",
+    )
+
+
+def count(model):
+    return model.query.count()
+
+
+def test_import_exported_inventory(client):
+    exported = client.get("/api/export_inventory_csv").data.decode("utf-8")
+    lines = exported.splitlines()
+    # The same bottles under new sticker numbers
+    renumbered = [lines[0]] + [
+        str(int(line.split(",", 1)[0]) + 50000) + "," + line.split(",", 1)[1]
+        for line in lines[1:]
+    ]
+    chemicals = count(Chemical)
+    chemical_manufacturers = count(Chemical_Manufacturer)
+
+    response = post_import(client, "\n".join(renumbered) + "\n")
+    assert response.status_code == 200
+    assert response.json["rows"] == 11
+    assert response.json["imported"] == 11
+    assert response.json["chemicals_created"] == 0
+    assert response.json["errors"] == []
+    # Bottles go to the chemicals and chemical manufacturers that already exist
+    assert count(Chemical) == chemicals
+    assert count(Chemical_Manufacturer) == chemical_manufacturers
+
+    reexported = client.get("/api/export_inventory_csv").data.decode("utf-8")
+    assert reexported.splitlines()[1:] == lines[1:] + renumbered[1:]
+
+
+def test_import_new_chemical_ndjson(client):
+    before = client.get("/api/inventory/changes").json["version"]
+    rows = [
+        {
+            "sticker_number": 60001,
+            "chemical": "Imported Compound",
+            "formula_and_name": "C2H2 (Imported Compound)",
+            "location": "Science Hall 101",
+            "sub_location": "shelf a",
+            "manufacturer": "Sigma-Aldrich",
+            "storage_class": "Flammable",
+            "product_number": "IMP-1",
+            "last_updated": "2025-07-01",
+        },
+        {
+            "sticker_number": 60002,
+            "chemical": "imported  compound",
+            "location": "Science Hall 101",
+            "sub_location": "Shelf A",
+            "manufacturer": "Sigma-Aldrich",
+            "product_number": "IMP-1",
+            "dead": True,
+        },
+    ]
+    body = "\n".join(json.dumps(row) for row in rows) + "\n"
+    response = post_import(client, body, file_name="inventory.ndjson")
+    assert response.status_code == 200
+    assert response.json["imported"] == 2
+    assert response.json["chemicals_created"] == 1
+
+    chemical = Chemical.query.filter_by(Chemical_Name="Imported Compound").one()
+    assert chemical.Chemical_Formula == "C2H2"
+    assert chemical.Storage_Class.Storage_Class_Name == "Flammable"
+    assert len(chemical.Chemical_Manufacturers) == 1
+    bottles = chemical.Chemical_Manufacturers[0].Inventory
+    assert sorted(bottle.Sticker_Number for bottle in bottles) == [60001, 60002]
+    assert {bottle.Who_Updated for bottle in bottles} == {"anne-admin@example.com"}
+
+    # Searchable, and picked up by delta sync
+    results = client.get("/api/search?query=imported").json
+    assert [result["chemical_name"] for result in results] == ["Imported Compound"]
+    changes = client.get(f"/api/inventory/changes?since={before}").json
+    assert sorted(bottle["sticker"] for bottle in changes["bottles"]) == [60001, 60002]
+    assert [changed["id"] for changed in changes["chemicals"]] == [chemical.Chemical_ID]
+
+
+def test_import_reports_errors_and_imports_nothing(client):
+    body = HEADER + (
+        "61001,Acetone,Science Hall 101,Shelf A,Fisher Scientific,,False,,\n"
+        "1001,Acetone,Science Hall 101,Shelf A,Fisher Scientific,,False,,\n"
+        "61001,Acetone,Science Hall 101,Shelf A,Fisher Scientific,,False,,\n"
+        "61002,Acetone,Nowhere 1,Shelf A,Fisher Scientific,,False,,\n"
+        "61003,New Stuff,Science Hall 101,Shelf A,Fisher Scientific,,False,,\n"
+        "61004,Acetone,Science Hall 101,Shelf A,Fisher Scientific,,maybe,,\n"
+        "61005,Acetone,Science Hall 101,Shelf A,Fisher Scientific,,False,last week,\n"
+        "sixty,Acetone,Science Hall 101,Shelf A,Fisher Scientific,,False,,\n"
+    )
+    bottles = count(Inventory)
+    changes = count(Inventory_Change)
+
+    response = post_import(client, body)
+    assert response.status_code == 400
+    assert response.json["imported"] == 0
+    assert response.json["error_count"] == 7
+    assert [error["row"] for error in response.json["errors"]] == [2, 3, 4, 5, 6, 7, 8]
+    assert "already exists" in response.json["errors"][0]["error"]
+    assert "also on row 1" in response.json["errors"][1]["error"]
+    assert "Unknown location" in response.json["errors"][2]["error"]
+    assert "storage class" in response.json["errors"][3]["error"]
+    assert count(Inventory) == bottles
+    assert count(Inventory_Change) == changes
+
+
+def test_import_sticker_numbers_must_fit_the_column(client):
+    row = ",Acetone,Science Hall 101,Shelf A,Fisher Scientific,,False,,\n"
+    stickers = ["2147483648", "-5", "0", "12345678901234567891", "61001.5"]
+    response = post_import(client, HEADER + "".join(s + row for s in stickers))
+    assert response.status_code == 400
+    errors = [error["error"] for error in response.json["errors"]]
+    assert errors[:4] == [
+        "Sticker number must be between 1 and 2147483647: 2147483648",
+        "Sticker number must be between 1 and 2147483647: -5",
+        "Sticker number must be between 1 and 2147483647: 0",
+        # Every digit is kept, not rounded through a float
+        "Sticker number must be between 1 and 2147483647: 12345678901234567891",
+    ]
+    assert "must be a whole number" in errors[4]
+
+    # Spreadsheets write whole numbers with a .0, and the largest one fits
+    stickers = ["61001.0", "2147483647"]
+    response = post_import(client, HEADER + "".join(s + row for s in stickers))
+    assert response.status_code == 200
+    assert response.json["imported"] == 2
+    assert Inventory.query.filter_by(Sticker_Number=2147483647).count() == 1
+
+
+def test_import_missing_columns(client):
+    response = post_import(client, "Sticker Number,Chemical\n1,Acetone\n")
+    assert response.status_code == 400
+    assert "Location" in response.json["error"]
+
+
+def test_import_batches(app, client, query_counter):
+    app.config["IMPORT_BATCH_SIZE"] = 100
+    rows = [
+        f"{70000 + i},Batch Chemical {i % 50},Science Hall 101,Shelf A,VWR International,Toxic,False,,\n"
+        for i in range(1000)
+    ]
+    with query_counter() as queries:
+        response = post_import(client, HEADER + "".join(rows))
+    assert response.status_code == 200
+    assert response.json["imported"] == 1000
+    assert response.json["chemicals_created"] == 50
+    # Not a query per row: a few to read the names, then a few per batch
+    assert len(queries.statements) < 50
+    assert count(Inventory) == 1011
+
+
+def test_import_cli(app, tmp_path):
+    path = tmp_path / "inventory.csv"
+    path.write_text(
+        HEADER + "62001,Water,Science Hall 102,Cabinet B,Sigma-Aldrich,,False,,\n"
+    )
+    result = app.test_cli_runner().invoke(args=["import-inventory", str(path)])
+    assert result.exit_code == 0, result.output
+    assert "Imported 1 bottles" in result.output
+    bottle = Inventory.query.filter_by(Sticker_Number=62001).one()
+    assert bottle.Who_Updated == "import"
+    assert bottle.Chemical_Manufacturer.Chemical.Chemical_Name == "Water"
+
+    path.write_text(
+        HEADER + "1001,Water,Science Hall 102,Cabinet B,Sigma-Aldrich,,False,,\n"
+    )
+    result = app.test_cli_runner().invoke(args=["import-inventory", str(path)])
+    assert result.exit_code != 0
+    assert "Row 1: Sticker number 1001 already exists" in result.output
+
+
+def test_import_cli_is_noticed_by_the_server(app, client, tmp_path):
+    app.config["DATA_VERSION_CHECK_INTERVAL"] = 0
+    etag = client.get("/api/get_chemicals").headers["ETag"]
+    client.get("/api/search?query=imported")
+    path = tmp_path / "inventory.csv"
+    path.write_text(
+        HEADER
+        + "62001,Imported Compound,Science Hall 102,Cabinet B,Sigma-Aldrich,Flammable,False,,\n"
+    )
+    result = app.test_cli_runner().invoke(args=["import-inventory", str(path)])
+    assert result.exit_code == 0, result.output
+
+    response = client.get("/api/get_chemicals", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    search = client.get("/api/search?query=imported").json
+    assert [chem["chemical_name"] for chem in search] == ["Imported Compound"]
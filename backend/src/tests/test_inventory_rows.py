@@ -0,0 +1,70 @@
+from sqlalchemy import and_
+from database import db
+from inventory_rows import group_inventory_rows, inventory_row_query
+from models import Chemical, Location, Manufacturer, Sub_Location
+from search import build_search_filters
+
+
+def to_dicts(room=None, sub_location=None, manufacturer_ids=None):
+    """
+    What the ORM path returns, with only the bottles matching the filters, for comparison.
+    """
+    chemical_list = []
+    for chemical in db.session.query(Chemical).order_by(
+        Chemical.Sort_Key, Chemical.Chemical_ID
+    ):
+        chemical = chemical.to_dict()
+        chemical["inventory"] = [
+            bottle
+            for bottle in chemical["inventory"]
+            if (room is None or bottle["location_id"] == room)
+            and (sub_location is None or bottle["sub_location_id"] == sub_location)
+            and (not manufacturer_ids or bottle["manufacturer_id"] in manufacturer_ids)
+        ]
+        chemical["quantity"] = len(
+            [bottle for bottle in chemical["inventory"] if not bottle["dead"]]
+        )
+        if chemical["inventory"]:
+            chemical_list.append(chemical)
+    return chemical_list
+
+
+def filtered_rows(room=None, sub_location=None, manufacturer_ids=None):
+    """
+    The bottles the search's SQL filters pick out, for a query matching every chemical.
+    """
+    filters = build_search_filters([""], room, sub_location, manufacturer_ids or [])
+    rows = inventory_row_query().filter(and_(*filters))
+    return group_inventory_rows(rows.all())
+
+
+def test_rows_match_to_dict(app):
+    assert group_inventory_rows(inventory_row_query().all()) == to_dicts()
+
+
+def test_search_filters_match_to_dict(app):
+    for (location_id,) in db.session.query(Location.Location_ID):
+        assert filtered_rows(room=location_id) == to_dicts(room=location_id)
+    for (sub_location_id,) in db.session.query(Sub_Location.Sub_Location_ID):
+        assert filtered_rows(sub_location=sub_location_id) == to_dicts(
+            sub_location=sub_location_id
+        )
+    for (manufacturer_id,) in db.session.query(Manufacturer.Manufacturer_ID):
+        assert filtered_rows(manufacturer_ids=[manufacturer_id]) == to_dicts(
+            manufacturer_ids=[manufacturer_id]
+        )
+    assert filtered_rows(room=1, manufacturer_ids=[1, 2]) == to_dicts(
+        room=1, manufacturer_ids=[1, 2]
+    )
+
+
+def test_search_only_returns_matching_bottles(client):
+    response = client.get("/api/search?query=a&room=1&manufacturers=1")
+    assert response.status_code == 200
+    expected = {
+        chem["id"]: chem
+        for chem in to_dicts(room=1, manufacturer_ids=[1])
+        if "a" in chem["chemical_name"].lower()
+    }
+    assert len(response.json) > 0
+    assert {chem["id"]: chem for chem in response.json} == expected
@@ -0,0 +1,80 @@
+from database import db
+from loading import chemical_loading, load_tree
+from models import Chemical, Chemical_Manufacturer, Inventory, Sub_Location
+from sqlalchemy.orm import joinedload
+
+
+def chained_joinedload():
+    """
+    How chemicals used to be loaded for to_dict().
+    """
+    return [
+        joinedload(Chemical.Storage_Class),
+        joinedload(Chemical.Chemical_Manufacturers)
+        .joinedload(Chemical_Manufacturer.Inventory)
+        .joinedload(Inventory.Sub_Location)
+        .joinedload(Sub_Location.Location),
+        joinedload(Chemical.Chemical_Manufacturers).joinedload(
+            Chemical_Manufacturer.Manufacturer
+        ),
+    ]
+
+
+def sorted_bottles(chemical_list):
+    for chem in chemical_list:
+        chem["inventory"].sort(key=lambda bottle: bottle["id"])
+    return sorted(chemical_list, key=lambda chem: chem["id"])
+
+
+def load_chemicals(options, query_counter):
+    db.session.expunge_all()
+    with query_counter() as queries:
+        chemical_list = [
+            chem.to_dict() for chem in db.session.query(Chemical).options(*options)
+        ]
+    return chemical_list, queries
+
+
+def test_strategies():
+    options = load_tree(Chemical, {"Storage_Class": {}, "Chemical_Manufacturers": {}})
+    strategies = [dict(option.context[0].strategy)["lazy"] for option in options]
+    assert strategies == ["joined", "selectin"]
+    many = load_tree(Chemical, {"Chemical_Manufacturers": {}}, many=True)
+    assert dict(many[0].context[0].strategy)["lazy"] == "subquery"
+
+
+def test_loading_avoids_row_multiplication(app, large_inventory, query_counter):
+    joined, joined_queries = load_chemicals(chained_joinedload(), query_counter)
+    layered, layered_queries = load_chemicals(
+        chemical_loading(many=True), query_counter
+    )
+    # Relationships aren't ordered, so the bottles can come back in any order
+    assert sorted_bottles(layered) == sorted_bottles(joined)
+
+    chemicals = db.session.query(Chemical).count()
+    chemical_manufacturers = db.session.query(Chemical_Manufacturer).count()
+    bottles = db.session.query(Inventory).count()
+
+    # Chemicals with storage classes, manufacturers with their manufacturer,
+    # bottles with their locations: one query each, and every row read once
+    assert len(layered_queries.statements) == 3
+    assert layered_queries.rows == chemicals + chemical_manufacturers + bottles
+    # The chained joins repeat the chemical and manufacturer for every bottle
+    assert len(joined_queries.statements) == 1
+    assert joined_queries.rows >= bottles
+    assert joined_queries.values > 1.5 * layered_queries.values
+
+
+def test_selectin_loading_for_a_few_chemicals(app, large_inventory, query_counter):
+    ids = [10000, 10001, 10002]
+    db.session.expunge_all()
+    with query_counter() as queries:
+        chemical_list = [
+            chem.to_dict()
+            for chem in db.session.query(Chemical)
+            .filter(Chemical.Chemical_ID.in_(ids))
+            .options(*chemical_loading())
+        ]
+    assert [chem["id"] for chem in chemical_list] == ids
+    assert len(queries.statements) == 3
+    assert queries.rows == 3 + 6 + 30
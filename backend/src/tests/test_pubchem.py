@@ -0,0 +1,78 @@
+import time
+import pytest
+from pubchem import CircuitBreaker, PubChemUnavailable, pubchem_client
+from synonyms import get_synonyms, memory_cache
+
+
+def test_circuit_breaker_opens_after_repeated_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_circuit_breaker_lets_a_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one trial at a time
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0)
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_slow_pubchem_falls_back_within_budget(client, pubchem):
+    pubchem.delay = 0.5
+    client.application.config["PUBCHEM_LATENCY_BUDGET"] = 0.05
+
+    start = time.monotonic()
+    response = client.get("/api/search?query=acetone&synonyms=true")
+    assert time.monotonic() - start < 0.5
+    assert response.status_code == 200
+    assert any(chem["chemical_name"] == "Acetone" for chem in response.json)
+
+    # The lookup finishes in the background and is cached for the next search
+    deadline = time.monotonic() + 5
+    while memory_cache().get("acetone") is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert "2-Propanone" in get_synonyms("acetone")
+    assert pubchem == ["acetone"]
+
+
+def test_failing_pubchem_opens_circuit_breaker(app, pubchem):
+    pubchem.status = 503
+    app.config["PUBCHEM_FAILURE_THRESHOLD"] = 2
+
+    assert get_synonyms("first") == []
+    assert get_synonyms("second") == []
+    assert pubchem_client().breaker.state == CircuitBreaker.OPEN
+
+    # PubChem isn't asked again while the breaker is open
+    assert get_synonyms("third") == []
+    assert pubchem == ["first", "second"]
+
+
+def test_pending_lookups_are_capped(app, pubchem):
+    pubchem.delay = 0.3
+    app.config["PUBCHEM_MAX_WORKERS"] = 1
+    app.config["PUBCHEM_MAX_PENDING"] = 1
+    client = pubchem_client()
+
+    first = client.submit("first", client.fetch_synonyms, "first")
+    # The same lookup is shared rather than queued twice
+    assert client.submit("first", client.fetch_synonyms, "first") is first
+    with pytest.raises(PubChemUnavailable):
+        client.submit("second", client.fetch_synonyms, "second")
+    assert first.result(timeout=5) == (False, [])
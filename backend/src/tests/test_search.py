@@ -1,4 +1,4 @@
-from search import filter_inventory_records
+from search import as_sticker_number, encode_cursor, rank_chemicals
 from database import db
 from models import Inventory
 
@@ -61,7 +61,7 @@ def test_search_route_with_manufacturer(client):
             assert db_inv.Chemical_Manufacturer.Manufacturer_ID == 1
 
 
-def test_search_route_with_synonyms(client):
+def test_search_route_with_synonyms(client, pubchem):
     response = client.get("/api/search?query=acetone&synonyms=true")
     assert response.status_code == 200
     data = response.json
@@ -110,4 +110,104 @@ def test_search_route_ordering(client):
     assert len(data) > 0  # Ensure results are returned
     # Ensure results are ordered by quantity and similarity
     quantities = [chem["quantity"] for chem in data]
-    assert quantities == sorted(quantities, reverse=True)
\ No newline at end of file
+    assert quantities == sorted(quantities, reverse=True)
+
+
+def test_search_route_pagination(client):
+    full = client.get("/api/search?query=acid").json
+    pages = []
+    url = "/api/search?query=acid&limit=2"
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.json
+        assert page["total"] == len(full)
+        assert len(page["results"]) <= 2
+        pages.extend(page["results"])
+        cursor = page["next_cursor"]
+        url = f"/api/search?query=acid&limit=2&cursor={cursor}" if cursor else None
+    # Paging through gives the same results in the same order
+    assert pages == full
+
+
+def test_search_route_pagination_without_query(client):
+    full = client.get("/api/search?room=1").json
+    assert len(full) > 1
+    page = client.get("/api/search?room=1&limit=1").json
+    assert page["results"] == full[:1]
+    rest = client.get(f"/api/search?room=1&cursor={page['next_cursor']}").json
+    assert rest["results"] == full[1:]
+    assert rest["next_cursor"] is None
+
+
+def test_search_route_invalid_pagination(client):
+    assert client.get("/api/search?query=acid&limit=0").status_code == 400
+    response = client.get("/api/search?query=acid&limit=2&cursor=notacursor")
+    assert response.status_code == 400
+    assert "cursor" in response.json["details"]
+
+
+def test_search_route_cursor_must_match_the_ordering(client):
+    relevance_key = [False, False, -4, -4, -0.5, 3]
+    name_key = [False, False, "aceticacid", 3]
+    for query, key in [
+        # Valid JSON, but not a search key
+        ("acid", [1]),
+        ("acid", {"id": 1}),
+        # A key for the other ordering
+        ("acid", name_key),
+        ("", relevance_key),
+        # The right length, but the wrong types
+        ("acid", [False, False, "4", -4, -0.5, 3]),
+        ("acid", [1, 0, -4, -4, -0.5, 3]),
+        ("", [False, False, "aceticacid", True]),
+    ]:
+        response = client.get(
+            f"/api/search?query={query}&room=1&limit=2&cursor={encode_cursor(key)}"
+        )
+        assert response.status_code == 400, (query, key)
+        assert "cursor" in response.json["details"]
+
+    for query, key in [("acid", relevance_key), ("", name_key)]:
+        response = client.get(
+            f"/api/search?query={query}&room=1&limit=2&cursor={encode_cursor(key)}"
+        )
+        assert response.status_code == 200
+
+
+def test_search_route_sticker_number(client):
+    bottle = db.session.query(Inventory).first()
+    chemical_id = bottle.Chemical_Manufacturer.Chemical_ID
+    response = client.get(f"/api/search?query={bottle.Sticker_Number}")
+    assert response.status_code == 200
+    data = response.json
+    assert [chem["id"] for chem in data] == [chemical_id]
+    assert bottle.Inventory_ID in [inv["id"] for inv in data[0]["inventory"]]
+
+
+def test_search_route_unknown_sticker_number(client):
+    response = client.get("/api/search?query=99999999")
+    assert response.status_code == 200
+    assert response.json == []
+
+
+def test_search_route_number_too_long_for_sticker(client):
+    response = client.get("/api/search?query=99999999999999999999999")
+    assert response.status_code == 200
+    assert response.json == []
+    assert as_sticker_number(str(2**31 - 1)) == 2**31 - 1
+    assert as_sticker_number(str(2**31)) is None
+
+
+def test_sticker_matches_come_first():
+    chemical_list = [
+        {"id": 1, "normalized_name": "acetone", "sort_key": "acetone", "quantity": 3},
+        {
+            "id": 2,
+            "normalized_name": "aceticacid",
+            "sort_key": "aceticacid",
+            "quantity": 0,
+        },
+    ]
+    ranked = rank_chemicals("acetone", chemical_list, first_ids={2})
+    assert [chem["id"] for _, chem in ranked] == [2, 1]
@@ -0,0 +1,70 @@
+import json
+from cache import LRUCache
+from data_version import current_data_version
+from search import search_cache
+
+
+def test_lru_cache_memory_bound():
+    cache = LRUCache(10, max_bytes=10, sizeof=len)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"
+    # "b" is the least recently used, so it makes room
+    cache.put("c", b"123")
+    assert cache.get("b") is None
+    assert cache.get("c") == b"123"
+    # Too big to cache at all
+    cache.put("d", b"12345678901")
+    assert cache.get("d") is None
+    assert cache.stats() == {
+        "hits": 2,
+        "misses": 2,
+        "evictions": 1,
+        "entries": 2,
+        "bytes": 8,
+    }
+
+
+def test_repeated_search_is_cached(client):
+    first = client.get("/api/search?query=acetone&room=1")
+    second = client.get("/api/search?query=acetone&room=1")
+    assert first.status_code == second.status_code == 200
+    assert first.json == second.json
+    stats = client.get("/api/search/cache_stats").json
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_manufacturer_order_shares_cache_entry(client):
+    client.get("/api/search?manufacturers=1,2")
+    client.get("/api/search?manufacturers=2,1")
+    assert search_cache().stats()["hits"] == 1
+
+
+def test_writes_invalidate_cache(client):
+    before = client.get("/api/search?query=water").json
+    bottle = before[0]["inventory"][0]
+    version = current_data_version()
+
+    response = client.post(
+        "/api/chemicals/mark_dead",
+        data=json.dumps({"inventory_id": bottle["id"]}),
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    assert current_data_version() > version
+
+    after = client.get("/api/search?query=water").json
+    marked = [
+        inv for chem in after for inv in chem["inventory"] if inv["id"] == bottle["id"]
+    ]
+    assert marked[0]["dead"]
+    assert search_cache().stats()["hits"] == 0
+
+
+def test_searches_without_synonyms_from_pubchem_are_not_cached(client, pubchem):
+    pubchem.status = 503
+    client.get("/api/search?query=acetone&synonyms=true")
+    client.get("/api/search?query=acetone&synonyms=true")
+    assert search_cache().stats()["entries"] == 0
@@ -0,0 +1,88 @@
+from collections import Counter
+from models import Inventory
+from search import search_cache, search_facets
+
+
+def expected_facets(chemicals):
+    """
+    Count the live bottles of search results the slow way.
+    """
+    rooms, manufacturers = Counter(), Counter()
+    for chemical in chemicals:
+        for bottle in chemical["inventory"]:
+            if not bottle["dead"]:
+                rooms[bottle["location_id"]] += 1
+                manufacturers[bottle["manufacturer_id"]] += 1
+    return rooms, manufacturers
+
+
+def counts(facet):
+    return {entry["id"]: entry["count"] for entry in facet}
+
+
+def test_facets_count_live_bottles(client):
+    results = client.get("/api/search?query=acid").json
+    response = client.get("/api/search?query=acid&facets=true")
+    assert response.status_code == 200
+    assert response.json["results"] == results
+
+    facets = response.json["facets"]
+    rooms, manufacturers = expected_facets(results)
+    assert counts(facets["rooms"]) == rooms
+    assert counts(facets["manufacturers"]) == manufacturers
+    assert sum(entry["count"] for entry in facets["storage_classes"]) <= sum(
+        rooms.values()
+    )
+    # Most bottles first
+    room_counts = [entry["count"] for entry in facets["rooms"]]
+    assert room_counts == sorted(room_counts, reverse=True)
+
+
+def test_facets_ignore_room_filter(client):
+    everywhere = client.get("/api/search?query=acid&facets=true").json
+    response = client.get("/api/search?query=acid&room=1&facets=true")
+    assert response.status_code == 200
+    # The other rooms still show how many bottles choosing them would find
+    assert response.json["facets"] == everywhere["facets"]
+    assert all(
+        bottle["location_id"] == 1
+        for chemical in response.json["results"]
+        for bottle in chemical["inventory"]
+    )
+
+
+def test_facets_with_pagination(client):
+    response = client.get("/api/search?query=acid&facets=true&limit=1")
+    assert response.status_code == 200
+    assert len(response.json["results"]) == 1
+    assert response.json["facets"] == (
+        client.get("/api/search?query=acid&facets=true").json["facets"]
+    )
+
+
+def test_facets_without_criteria(app, client):
+    response = client.get("/api/search?facets=true")
+    assert response.status_code == 200
+    assert response.json["results"] == []
+    with app.app_context():
+        live = Inventory.query.filter(Inventory.Is_Dead.isnot(True)).count()
+    assert sum(counts(response.json["facets"]["rooms"]).values()) == live
+
+
+def test_facets_are_one_query(app, large_inventory, query_counter):
+    with app.test_request_context():
+        with query_counter() as queries:
+            facets = search_facets([])
+    assert len(queries.statements) == 1
+    assert sum(entry["count"] for entry in facets["manufacturers"]) >= 3000
+
+
+def test_facets_are_cached(client):
+    first = client.get("/api/search?query=acid&facets=true")
+    second = client.get("/api/search?query=acid&facets=true")
+    assert first.json == second.json
+    # Asking without facets is a different entry
+    client.get("/api/search?query=acid")
+    stats = search_cache().stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
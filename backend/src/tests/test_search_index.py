@@ -0,0 +1,158 @@
+from database import db
+from models import Chemical, Chemical_Trigram
+from search_index import (
+    candidate_chemical_ids,
+    normalize_name,
+    rebuild_trigram_index,
+    sort_key,
+    trigrams,
+)
+from sqlalchemy import inspect, text
+import json
+
+
+def chemical_id(name):
+    return db.session.query(Chemical).filter_by(Chemical_Name=name).one().Chemical_ID
+
+
+def candidates(search_terms):
+    """
+    :return: The Chemical_IDs candidate_chemical_ids selects, or None if it can't narrow them.
+    """
+    query = candidate_chemical_ids(search_terms)
+    if query is None:
+        return None
+    return set(db.session.execute(query).scalars())
+
+
+def test_trigrams():
+    assert trigrams("acetone") == {"ace", "cet", "eto", "ton", "one"}
+    assert trigrams("ab") == set()
+
+
+def test_candidates_narrow_by_name(app):
+    assert candidates(["Sulfuric Acid"]) == {chemical_id("Sulfuric Acid")}
+
+
+def test_candidates_ignore_case_and_spaces(app):
+    assert candidates(["sulfuricacid", "HYDRO chloric"]) == {
+        chemical_id("Sulfuric Acid"),
+        chemical_id("Hydrochloric Acid"),
+    }
+
+
+def test_candidates_unusable_terms(app):
+    # Too short, or containing a LIKE wildcard, can't use the index
+    assert candidate_chemical_ids(["ac"]) is None
+    assert candidate_chemical_ids(["acetone", "ac%d"]) is None
+
+
+def test_common_query_binds_few_parameters(client, large_inventory, query_counter):
+    # Every synthetic compound is a candidate, but their ids aren't sent back
+    # to the database one parameter each
+    rebuild_trigram_index()
+    db.session.commit()
+    assert len(candidates(["compound"])) >= 500
+    with query_counter() as queries:
+        response = client.get("/api/search?query=compound&limit=10")
+    assert response.json["total"] >= 500
+    assert max(statement.count("?") for statement in queries.statements) < 50
+
+
+def test_rebuild_matches_incremental_index(app):
+    before = db.session.query(
+        Chemical_Trigram.Chemical_ID, Chemical_Trigram.Trigram
+    ).all()
+    rebuild_trigram_index()
+    db.session.commit()
+    after = db.session.query(
+        Chemical_Trigram.Chemical_ID, Chemical_Trigram.Trigram
+    ).all()
+    assert sorted(before) == sorted(after)
+
+
+def test_added_chemical_is_searchable(client):
+    response = client.post(
+        "/api/add_chemical",
+        data=json.dumps(
+            {
+                "chemical_name": "Benzaldehyde",
+                "chemical_formula": "C7H6O",
+                "product_number": "B100",
+                "storage_class_id": 1,
+                "manufacturer_id": 1,
+            }
+        ),
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    assert candidates(["benzald"]) == {response.json["chemical_id"]}
+
+
+def test_renamed_chemical_is_reindexed(client):
+    water_id = chemical_id("Water")
+    response = client.put(
+        f"/api/update_chemical/{water_id}",
+        data=json.dumps({"chemical_name": "Deionized Water"}),
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    assert candidates(["deionized"]) == {water_id}
+
+
+def test_deleted_chemical_is_removed(client):
+    ammonia_id = chemical_id("Ammonia")
+    response = client.delete(f"/api/delete_chemical/{ammonia_id}")
+    assert response.status_code == 200
+    assert (
+        db.session.query(Chemical_Trigram).filter_by(Chemical_ID=ammonia_id).count()
+        == 0
+    )
+    assert candidates(["ammonia"]) == set()
+
+
+def test_chemicals_store_normalized_names(client):
+    response = client.post(
+        "/api/add_chemical",
+        data=json.dumps(
+            {
+                "chemical_name": "Copper(II) Chloride",
+                "chemical_formula": "CuCl2",
+                "product_number": "C200",
+                "storage_class_id": 1,
+                "manufacturer_id": 1,
+            }
+        ),
+        content_type="application/json",
+    )
+    chemical = db.session.get(Chemical, response.json["chemical_id"])
+    assert chemical.Normalized_Name == "copper(ii)chloride"
+    assert chemical.Sort_Key == "copperiichloride"
+
+    client.put(
+        f"/api/update_chemical/{chemical.Chemical_ID}",
+        data=json.dumps({"chemical_name": "Cupric Chloride"}),
+        content_type="application/json",
+    )
+    db.session.refresh(chemical)
+    assert chemical.Normalized_Name == "cupricchloride"
+    assert chemical.Sort_Key == "cupricchloride"
+
+
+def test_migrate_adds_and_backfills_normalized_columns(app):
+    # Make the Chemical table look like one imported from the old system
+    for index in ("Normalized_Name", "Normalized_Alphabetical_Name", "Sort_Key"):
+        db.session.execute(text(f"DROP INDEX ix_Chemical_{index}"))
+        db.session.execute(text(f"ALTER TABLE Chemical DROP COLUMN {index}"))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["migrate"])
+    assert result.exit_code == 0, result.output
+    assert "Added column Chemical.Sort_Key" in result.output
+
+    db.session.expire_all()
+    for chemical in db.session.query(Chemical):
+        assert chemical.Normalized_Name == normalize_name(chemical.Chemical_Name)
+        assert chemical.Sort_Key == sort_key(chemical.Chemical_Name)
+    indexes = {index["name"] for index in inspect(db.engine).get_indexes("Chemical")}
+    assert "ix_Chemical_Sort_Key" in indexes
@@ -0,0 +1,240 @@
+import random
+from difflib import SequenceMatcher
+from search import calculate_similarity, rank_chemicals, similarity_keys
+from search_index import normalize_name, sort_key
+
+NAMES = [
+    "Acetic Acid",
+    "Hydrochloric Acid",
+    "Sulfuric Acid",
+    "Nitric Acid",
+    "Acid Blue 9",
+    "Acetone",
+    "Ethanol",
+    "Methanol",
+    "Ethyl Acetate",
+    "Methyl Ethyl Ketone",
+    "Sodium Hydroxide",
+    "Sodium Chloride",
+    "Potassium Chloride",
+    "Sodium Sulfate",
+    "Copper(II) Sulfate",
+    "Sulfur",
+    "Sulfamic Acid",
+    "Ammonium Sulfide",
+    "Ethanolamine",
+    "Diethanolamine",
+    "Methane Sulfonic Acid",
+    "Phosphoric Acid",
+    "Boric Acid",
+    "Benzoic Acid",
+    "Ascorbic Acid",
+    "Water",
+    "Hydrogen Peroxide",
+    "Isopropanol",
+    "Propanoic Acid",
+    "Acidified Water",
+]
+
+# Orderings produced by the original SequenceMatcher based ranking
+GOLDEN = {
+    "acid": [
+        "Acid Blue 9",
+        "Acidified Water",
+        "Boric Acid",
+        "Acetic Acid",
+        "Nitric Acid",
+        "Benzoic Acid",
+        "Sulfuric Acid",
+        "Sulfamic Acid",
+        "Ascorbic Acid",
+        "Propanoic Acid",
+        "Phosphoric Acid",
+        "Hydrochloric Acid",
+        "Methane Sulfonic Acid",
+        "Acetone",
+        "Ethyl Acetate",
+        "Sodium Chloride",
+        "Ammonium Sulfide",
+        "Sodium Hydroxide",
+        "Hydrogen Peroxide",
+        "Potassium Chloride",
+        "Water",
+        "Ethanolamine",
+        "Ethanol",
+        "Methanol",
+        "Diethanolamine",
+        "Isopropanol",
+        "Sodium Sulfate",
+        "Copper(II) Sulfate",
+        "Methyl Ethyl Ketone",
+        "Sulfur",
+    ],
+    "ethanol": [
+        "Ethanol",
+        "Ethanolamine",
+        "Methanol",
+        "Diethanolamine",
+        "Methane Sulfonic Acid",
+        "Isopropanol",
+        "Ethyl Acetate",
+        "Methyl Ethyl Ketone",
+        "Propanoic Acid",
+        "Acetone",
+        "Acetic Acid",
+        "Ascorbic Acid",
+        "Hydrochloric Acid",
+        "Benzoic Acid",
+        "Phosphoric Acid",
+        "Nitric Acid",
+        "Sulfur",
+        "Water",
+        "Copper(II) Sulfate",
+        "Sulfamic Acid",
+        "Boric Acid",
+        "Hydrogen Peroxide",
+        "Acidified Water",
+        "Acid Blue 9",
+        "Sulfuric Acid",
+        "Sodium Sulfate",
+        "Sodium Chloride",
+        "Sodium Hydroxide",
+        "Ammonium Sulfide",
+        "Potassium Chloride",
+    ],
+    "sodium hydroxide": [
+        "Sodium Hydroxide",
+        "Sodium Chloride",
+        "Sodium Sulfate",
+        "Hydrogen Peroxide",
+        "Hydrochloric Acid",
+        "Ammonium Sulfide",
+        "Potassium Chloride",
+        "Diethanolamine",
+        "Isopropanol",
+        "Propanoic Acid",
+        "Acid Blue 9",
+        "Ethyl Acetate",
+        "Methyl Ethyl Ketone",
+        "Acidified Water",
+        "Boric Acid",
+        "Nitric Acid",
+        "Acetic Acid",
+        "Benzoic Acid",
+        "Ascorbic Acid",
+        "Sulfuric Acid",
+        "Sulfamic Acid",
+        "Phosphoric Acid",
+        "Methane Sulfonic Acid",
+        "Sulfur",
+        "Acetone",
+        "Water",
+        "Ethanolamine",
+        "Ethanol",
+        "Methanol",
+        "Copper(II) Sulfate",
+    ],
+    "Ethyl": [
+        "Ethyl Acetate",
+        "Methyl Ethyl Ketone",
+        "Ethanol",
+        "Ethanolamine",
+        "Methanol",
+        "Methane Sulfonic Acid",
+        "Diethanolamine",
+        "Hydrochloric Acid",
+        "Hydrogen Peroxide",
+        "Acetone",
+        "Acetic Acid",
+        "Sodium Hydroxide",
+        "Benzoic Acid",
+        "Phosphoric Acid",
+        "Sulfur",
+        "Nitric Acid",
+        "Sulfuric Acid",
+        "Sulfamic Acid",
+        "Water",
+        "Copper(II) Sulfate",
+        "Acidified Water",
+        "Acid Blue 9",
+        "Isopropanol",
+        "Sodium Sulfate",
+        "Sodium Chloride",
+        "Ammonium Sulfide",
+        "Potassium Chloride",
+        "Boric Acid",
+        "Ascorbic Acid",
+        "Propanoic Acid",
+    ],
+}
+
+
+def chemicals(names, quantity=1, first_id=0):
+    return [
+        {
+            "id": first_id + i,
+            "chemical_name": name,
+            "normalized_name": normalize_name(name),
+            "sort_key": sort_key(name),
+            "quantity": quantity,
+        }
+        for i, name in enumerate(names)
+    ]
+
+
+def ranked_names(query, chemical_list, **kwargs):
+    return [
+        chem["chemical_name"]
+        for _, chem in rank_chemicals(query, chemical_list, **kwargs)
+    ]
+
+
+def test_golden_ordering():
+    for query, expected in GOLDEN.items():
+        assert ranked_names(query, chemicals(NAMES)) == expected
+
+
+def test_out_of_stock_ranked_last():
+    chemical_list = chemicals(["Boric Acid"], quantity=0) + chemicals(
+        ["Sulfuric Acid"], first_id=1
+    )
+    assert ranked_names("acid", chemical_list) == ["Sulfuric Acid", "Boric Acid"]
+
+
+def test_top_k_matches_full_sort():
+    for query in list(GOLDEN) + [""]:
+        ranked = rank_chemicals(query, chemicals(NAMES))
+        assert rank_chemicals(query, chemicals(NAMES), limit=7) == ranked[:7]
+        # Pages pick up after the key of the previous page's last chemical
+        after = ranked[6][0]
+        assert (
+            rank_chemicals(query, chemicals(NAMES), limit=7, after=after)
+            == ranked[7:14]
+        )
+
+
+def original_similarity(query, entry):
+    query = query.lower().replace(" ", "")
+    entry = entry.lower().replace(" ", "")
+    match = SequenceMatcher(None, query, entry).find_longest_match()
+    return (
+        match.size,
+        match.size - match.b,
+        SequenceMatcher(None, query, entry).ratio(),
+    )
+
+
+def test_similarity_matches_sequence_matcher():
+    rng = random.Random(4)
+    alphabet = "acdeilnorst "
+    for _ in range(200):
+        query = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 8)))
+        names = [
+            "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+            + (query if rng.random() < 0.7 else "")
+            + "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+            for _ in range(20)
+        ]
+        expected = [original_similarity(query, name) for name in names]
+        assert similarity_keys(query, names) == expected
+        assert [calculate_similarity(query, name) for name in names] == expected
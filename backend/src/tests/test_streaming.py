@@ -0,0 +1,84 @@
+import itertools
+import json
+import logging
+import pytest
+from streaming import iter_json_array, log_stream_errors
+
+
+def test_json_array_matches_json_dumps(app):
+    for items in [[], [1], [{"a": [1, 2]}, None, "x"], list(range(1000))]:
+        chunks = list(iter_json_array(items, chunk_size=100))
+        assert json.loads("".join(chunks)) == items
+        if len(items) == 1000:
+            assert len(chunks) > 1
+
+
+def test_json_array_is_lazy(app):
+    # The first chunk is ready without reading every item
+    chunks = iter_json_array(({"id": i} for i in itertools.count()), chunk_size=1000)
+    first = next(chunks)
+    assert 1000 <= len(first) < 2000
+    assert first.startswith('[{"id":0},{"id":1}')
+
+
+def test_stream_errors_are_logged_with_the_count(caplog):
+    def items():
+        yield 1
+        yield 2
+        raise RuntimeError("connection lost")
+
+    streamed = []
+    with caplog.at_level(logging.ERROR, logger="streaming"):
+        with pytest.raises(RuntimeError):
+            for item in log_stream_errors(items(), "chemicals"):
+                streamed.append(item)
+    assert streamed == [1, 2]
+    assert "Failed to stream chemicals after 2 of them" in caplog.text
+
+
+def test_get_chemicals_is_streamed(client, large_inventory):
+    response = client.get("/api/get_chemicals", buffered=False)
+    assert response.is_streamed
+    assert response.mimetype == "application/json"
+    chemical_list = json.loads(b"".join(response.response))
+    assert len(chemical_list) > 500
+    assert all(chem["quantity"] > 0 for chem in chemical_list)
+
+
+def test_streamed_search_matches_pages(client, app, large_inventory):
+    # Read the bottles for a few chemicals at a time
+    app.config["STREAM_BATCH_SIZE"] = 7
+    streamed = client.get("/api/search?room=1", buffered=False)
+    assert streamed.is_streamed
+    streamed = json.loads(b"".join(streamed.response))
+
+    paged = []
+    cursor = ""
+    while cursor is not None:
+        page = client.get(f"/api/search?room=1&limit=100{cursor}").json
+        paged.extend(page["results"])
+        cursor = page["next_cursor"] and f"&cursor={page['next_cursor']}"
+    assert len(streamed) > 100
+    assert streamed == paged
+
+
+def test_streamed_search_is_cached(client):
+    first = client.get("/api/search?query=water")
+    assert client.get("/api/search/cache_stats").json["entries"] == 1
+    second = client.get("/api/search?query=water")
+    assert not second.is_streamed
+    assert second.data == first.data
+
+
+def test_missing_msds_is_streamed(client):
+    response = client.get("/api/get_missing_msds", buffered=False)
+    assert response.is_streamed
+    items = json.loads(b"".join(response.response))
+    assert items
+    assert set(items[0]) == {
+        "sticker_number",
+        "chemical_name",
+        "manufacturer_name",
+        "product_number",
+        "inventory_id",
+    }
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from database import db
+from models import Synonym_Cache
+from synonyms import get_synonyms, memory_cache
+
+
+def test_synonyms_are_cached(app, pubchem):
+    synonyms = get_synonyms("Acetone")
+    assert "2-Propanone" in synonyms
+    # Different spelling of the same query, served from memory
+    assert get_synonyms("  acetone ") == synonyms
+    assert pubchem == ["acetone"]
+
+    entry = db.session.query(Synonym_Cache).filter_by(Query="acetone").one()
+    assert entry.Found
+
+
+def test_synonyms_survive_memory_eviction(app, pubchem):
+    synonyms = get_synonyms("acetone")
+    memory_cache().clear()
+    assert get_synonyms("acetone") == synonyms
+    assert pubchem == ["acetone"]
+
+
+def test_unknown_names_are_negatively_cached(app, pubchem):
+    assert get_synonyms("not a chemical") == []
+    memory_cache().clear()
+    assert get_synonyms("not a chemical") == []
+    assert pubchem == ["not a chemical"]
+
+    entry = db.session.query(Synonym_Cache).filter_by(Query="not a chemical").one()
+    assert not entry.Found
+
+
+def test_expired_synonyms_are_refreshed(app, pubchem):
+    get_synonyms("table salt")
+    entry = db.session.query(Synonym_Cache).filter_by(Query="table salt").one()
+    entry.Fetched_At = datetime.now() - timedelta(
+        seconds=app.config["SYNONYM_CACHE_TTL"] + 1
+    )
+    db.session.commit()
+    memory_cache().clear()
+
+    assert "Sodium chloride" in get_synonyms("table salt")
+    assert pubchem == ["table salt", "table salt"]
+    assert db.session.query(Synonym_Cache).filter_by(Query="table salt").count() == 1
+
+
+def test_negative_entries_expire_sooner(app, pubchem):
+    get_synonyms("unobtainium")
+    entry = db.session.query(Synonym_Cache).filter_by(Query="unobtainium").one()
+    # Still fresh for a found entry, but too old for a negative one
+    entry.Fetched_At = datetime.now() - timedelta(
+        seconds=app.config["SYNONYM_CACHE_NEGATIVE_TTL"] + 1
+    )
+    db.session.commit()
+    memory_cache().clear()
+
+    get_synonyms("unobtainium")
+    assert pubchem == ["unobtainium", "unobtainium"]
+
+
+def test_search_reuses_cached_synonyms(client, pubchem):
+    for _ in range(3):
+        response = client.get("/api/search?query=acetone&synonyms=true")
+        assert response.status_code == 200
+        assert any(chem["chemical_name"] == "Acetone" for chem in response.json)
+    assert pubchem == ["acetone"]